@@ -48,6 +48,8 @@ setup(
         'Products.MimetypesRegistry',
         'Products.PortalTransforms',
         'Products.CMFPlone',
+        'plone.app.textfield',
+        'plone.dexterity',
     ],
     extras_require={
         'test': [
@@ -59,5 +61,12 @@ setup(
     entry_points="""
     [z3c.autoinclude.plugin]
     target = plone
+
+    [zopectl.command]
+    resanitize_html = experimental.safe_html_transform.resanitize:main
+    calibrate_safe_html = experimental.safe_html_transform.calibrate:main
+
+    [console_scripts]
+    safe_html_benchmark = experimental.safe_html_transform.benchmark:main
     """,
 )
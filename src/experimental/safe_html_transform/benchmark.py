@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the safe_html transform.
+
+Runs SafeHTML.convert over a built-in corpus of tiny, typical, huge and
+pathological documents and reports throughput, latency percentiles and
+the growth of the peak resident memory. Results can be saved as a
+baseline and later runs compared against it::
+
+    bin/safe_html_benchmark --save baseline.json
+    bin/safe_html_benchmark --compare baseline.json
+
+With --original the Products.PortalTransforms safe_html transform is
+measured on the same corpus, if it can be imported.
+"""
+from Products.PortalTransforms.data import datastream
+
+import argparse
+import json
+import resource
+import sys
+import time
+
+TYPICAL = """
+<h2>Welcome to our new intranet</h2>
+<p>The <strong>new intranet</strong> went live on <em>Monday</em>. Please
+read the <a href="http://www.example.com/help" title="Help">help pages</a>
+before you <a href="/contact">contact us</a>.</p>
+<h3>What changed</h3>
+<ul>
+  <li class="first">Faster search &amp; navigation</li>
+  <li>New <span style="color: red; text-align: center;">news</span> portlet</li>
+  <li>Personal dashboards</li>
+</ul>
+<div class="callout"><p>Old bookmarks keep working.</p></div>
+<table border="1" cellpadding="2" width="100%">
+  <tr><th width="30%">Team</th><th>Contact</th></tr>
+  <tr><td valign="top">Web</td><td><a href="mailto:web@example.com">web</a></td></tr>
+  <tr><td valign="top">Support</td><td>+49 123 456</td></tr>
+</table>
+<p><img src="logo.png" alt="Logo" align="left" onclick="zoom()"/>
+Text with an image, a <font face="Arial">font tag</font> and a
+<script type="text/javascript">track();</script> tracking script.</p>
+"""
+
+
+def _nested(depth):
+    return '<div>' * depth + 'deep' + '</div>' * depth
+
+
+def _attributes(count):
+    attributes = ' '.join('data-a%d="value %d"' % (i, i) for i in range(count))
+    return '<p %s>many attributes</p>' % attributes
+
+
+def build_corpus(huge_size=2 * 1024 * 1024):
+    """Return the benchmark corpus as a list of (name, html) tuples."""
+    huge = TYPICAL * (huge_size // len(TYPICAL) + 1)
+    return [
+        ('tiny-text', 'A title without any markup'),
+        ('tiny-comment', '<p>Nice article, <b>thanks</b>!</p>'),
+        ('tiny-safe', '<p>Already <a href="http://plone.org">safe</a></p>'),
+        ('typical', TYPICAL),
+        ('huge', huge),
+        ('nested', _nested(2000)),
+        ('attributes', _attributes(2000)),
+        ('nasty', '<script>x</script><p>text</p>' * 5000),
+        ('unclosed', '<p><b><i><span>unclosed ' * 2000),
+        ('entities', '<p>%s</p>' % ('&amp;&lt;&gt;&quot;&#160;' * 20000)),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss():
+    """Peak resident memory of the process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(transform, html, iterations, min_time=0.0):
+    """Convert html repeatedly and return the measured numbers."""
+    latencies = []
+    rss = peak_rss()
+    started = time.time()
+    while (len(latencies) < iterations or
+           time.time() - started < min_time):
+        data = datastream('benchmark')
+        before = time.time()
+        transform.convert(html, data)
+        latencies.append(time.time() - before)
+    total = sum(latencies) or 1e-9
+    return {
+        'iterations': len(latencies),
+        'bytes': len(html),
+        'docs_per_sec': len(latencies) / total,
+        'mb_per_sec': len(html) * len(latencies) / total / 1024 / 1024,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_growth_kb': peak_rss() - rss,
+    }
+
+
+def run(transform, corpus, iterations, min_time=0.0):
+    results = {}
+    for name, html in corpus:
+        # warm up compiled policies and imports
+        transform.convert(html, datastream('benchmark'))
+        results[name] = measure(transform, html, iterations, min_time)
+    return results
+
+
+def original_transform():
+    """The safe_html transform of Products.PortalTransforms, or None."""
+    try:
+        from Products.PortalTransforms.transforms.safe_html import SafeHTML
+    except ImportError:
+        return None
+    return SafeHTML()
+
+
+def format_results(label, results, baseline=None):
+    lines = [label,
+             '%-12s %10s %10s %10s %10s %10s %10s' % (
+                 'document', 'docs/s', 'MB/s', 'p50 ms', 'p95 ms', 'p99 ms',
+                 'rss kb')]
+    for name in sorted(results):
+        result = results[name]
+        line = '%-12s %10.1f %10.2f %10.3f %10.3f %10.3f %10d' % (
+            name, result['docs_per_sec'], result['mb_per_sec'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['peak_rss_growth_kb'])
+        if baseline and name in baseline:
+            line += '  p50 %+.0f%%' % change(baseline[name], result)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def change(old, new):
+    """Change of the median latency in percent."""
+    if not old['p50_ms']:
+        return 0.0
+    return (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+
+
+def regressions(baseline, results, tolerance):
+    """Names of documents whose median latency grew more than tolerance."""
+    return sorted(name for name in results if name in baseline and
+                  change(baseline[name], results[name]) > tolerance * 100)
+
+
+def _write(text):
+    sys.stdout.write(text + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='safe_html_benchmark',
+        description='Benchmark the safe_html transform.')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='minimal number of conversions per document')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='minimal seconds spent per document')
+    parser.add_argument('--huge-size', type=int, default=2 * 1024 * 1024,
+                        help='size in bytes of the huge document')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the result cache enabled')
+    parser.add_argument('--original', action='store_true',
+                        help='also measure the PortalTransforms transform')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as baseline to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with the baseline in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed growth of the median latency')
+    options = parser.parse_args(argv)
+
+    from experimental.safe_html_transform.transforms.safe_html import \
+        SafeHTML
+    transform = SafeHTML()
+    if not options.cache:
+        transform.config['cache_size'] = 0
+    corpus = build_corpus(options.huge_size)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = run(transform, corpus, options.iterations, options.min_time)
+    _write(format_results('experimental.safe_html_transform', results,
+                          baseline))
+
+    if options.original:
+        original = original_transform()
+        if original is None:
+            _write('\nProducts.PortalTransforms safe_html is not available')
+        else:
+            _write('')
+            _write(format_results(
+                'Products.PortalTransforms',
+                run(original, corpus, options.iterations, options.min_time)))
+
+    if options.save:
+        with open(options.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        slower = regressions(baseline, results, options.tolerance)
+        if slower:
+            _write('\nSlower than the baseline: %s' % ', '.join(slower))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from experimental.safe_html_transform.cache import result_cache_stats
+from experimental.safe_html_transform.deferred import DEFERRED
+from experimental.safe_html_transform.diskcache import disk_cache_stats
+from experimental.safe_html_transform.engines import ENGINES
+from experimental.safe_html_transform.parsers import PARSERS
+from experimental.safe_html_transform.stats import COUNTERS
+from experimental.safe_html_transform.stats import STAGES
+from experimental.safe_html_transform.stats import STATS
+from Products.Five.browser import BrowserView
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+
+import json
+
+
+class SafeHTMLStatsView(BrowserView):
+    """Shows the timings and counters collected by the transform.
+
+    Add ?format=json to get them for monitoring tools.
+    """
+
+    index = ViewPageTemplateFile('templates/stats.pt')
+
+    def __call__(self):
+        self.snapshot = STATS.snapshot()
+        if self.request.get('format') == 'json':
+            self.request.response.setHeader('Content-Type',
+                                            'application/json')
+            return json.dumps(dict(self.snapshot, enabled=STATS.enabled,
+                                   cache=result_cache_stats(),
+                                   disk_cache=disk_cache_stats(),
+                                   parsers=PARSERS.stats(),
+                                   deferred=DEFERRED.stats()))
+        return self.index()
+
+    def enabled(self):
+        return STATS.enabled
+
+    def counters(self):
+        counters = self.snapshot['counters']
+        return [{'name': name, 'value': counters[name]} for name in COUNTERS]
+
+    def stages(self):
+        timings = self.snapshot['timings']
+        total = sum(timings.values()) or 1.0
+        sanitized = self.snapshot['counters']['sanitized'] or 1
+        return [{'name': stage,
+                 'seconds': '%.3f' % timings[stage],
+                 'average': '%.3f' % (timings[stage] * 1000 / sanitized),
+                 'share': '%.0f%%' % (timings[stage] * 100 / total)}
+                for stage in STAGES]
+
+    def limits(self):
+        limits = self.snapshot['limits']
+        return [{'name': name, 'value': limits[name]}
+                for name in sorted(limits)]
+
+    def engines(self):
+        engines = self.snapshot['engines']
+        return [{'name': name, 'value': engines.get(name, 0)}
+                for name in ENGINES]
+
+    def cache(self):
+        stats = result_cache_stats()
+        return [{'name': name, 'value': stats[name]}
+                for name in sorted(stats)]
+
+    def disk_cache(self):
+        stats = disk_cache_stats()
+        return [{'name': name, 'value': stats[name]}
+                for name in sorted(stats)]
+
+    def parsers(self):
+        stats = PARSERS.stats()
+        return [{'name': name, 'value': stats[name]}
+                for name in sorted(stats)]
+
+    def deferred(self):
+        stats = DEFERRED.stats()
+        return [{'name': name, 'value': stats[name]}
+                for name in sorted(stats)]
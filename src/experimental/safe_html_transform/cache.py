@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""In-process cache of sanitized output."""
+from collections import OrderedDict
+from hashlib import sha1
+import threading
+
+# default size of the result cache in bytes.
+DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+
+
+def cache_key(text, fingerprint, encoding=None):
+    """Key for text sanitized with the policy identified by fingerprint.
+
+    encoding is the one byte string text is read in.
+    """
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return '%s:%s:%s' % (fingerprint, encoding or '', sha1(text).hexdigest())
+
+
+def _sizeof(key, value):
+    return len(key) + len(value)
+
+
+class LRUCache(object):
+    """Thread safe least recently used cache bounded by byte size.
+
+    The size of an entry is the length of its key plus the length of its
+    value. The least recently used entries are evicted once the total
+    exceeds max_bytes. Values larger than max_bytes are never stored.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = _sizeof(key, value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= _sizeof(key, old)
+            if size > self.max_bytes:
+                return
+            self._data[key] = value
+            self.size += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._data:
+            key, value = self._data.popitem(last=False)
+            self.size -= _sizeof(key, value)
+            self.evictions += 1
+
+
+# the result cache of the default size. PortalTransforms creates a
+# transform instance per ZODB connection, the policy fingerprint in the key
+# keeps the output of different policies apart.
+RESULT_CACHE = LRUCache()
+
+# size in bytes -> the result cache shared by the configs with that
+# cache_size, so one site without a cache does not disable the others.
+_RESULT_CACHES = {DEFAULT_CACHE_SIZE: RESULT_CACHE}
+_RESULT_CACHES_LOCK = threading.Lock()
+
+
+def result_cache(max_bytes):
+    """Return the result cache for the configs with cache_size max_bytes.
+
+    None is returned for 0. A cache is kept until the process ends, even
+    when no config uses its size any longer.
+    """
+    if not max_bytes:
+        return None
+    with _RESULT_CACHES_LOCK:
+        cache = _RESULT_CACHES.get(max_bytes)
+        if cache is None:
+            cache = _RESULT_CACHES[max_bytes] = LRUCache(max_bytes)
+        return cache
+
+
+def result_cache_stats():
+    """The stats of all result caches of the process added up."""
+    with _RESULT_CACHES_LOCK:
+        caches = _RESULT_CACHES.values()
+    # there always is the one of the default size
+    totals = {'caches': len(caches)}
+    for cache in caches:
+        for name, value in cache.stats().items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Calibrate the engine thresholds of the safe_html transform.
+
+The engines are timed against the tree sanitizer with the policy of the
+site: the snippet sanitizer on snippets of growing size, the stream
+sanitizer on documents like the typical one of the benchmark of growing
+size and then on denser variants of them. Where the winner changes gives
+snippet_size, stream_size and stream_density.
+
+Run it with ``bin/instance calibrate_safe_html <site id>``, which stores
+the thresholds in the config of the transform in portal_transforms, or
+with --dry-run to only log them.
+"""
+from experimental.safe_html_transform.benchmark import TYPICAL
+from experimental.safe_html_transform.limits import Limits
+from experimental.safe_html_transform.parsers import PARSERS
+
+import argparse
+import logging
+import timeit
+
+logger = logging.getLogger('experimental.safe_html_transform')
+
+# sizes in bytes of the snippets timed.
+SNIPPET_SIZES = (16, 32, 64, 128, 256, 512, 1024)
+
+# size in bytes of the smallest document the stream sanitizer is timed on,
+# it is doubled up to the largest.
+STREAM_START_SIZE = 256 * 1024
+DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+
+# samples per document, the fastest one counts.
+DEFAULT_REPEAT = 3
+
+# seconds a sample takes at least, short calls are looped that long.
+MIN_SAMPLE_TIME = 0.02
+
+# markup the snippet sanitizer handles with the default policy, short
+# enough to build the smallest snippets from.
+SNIPPET_TEXT = 'Read <b>it</b> '
+
+# dense markup added to the typical document to raise its tag density.
+DENSE_LINE = 'text <b>bold</b> <i>italic</i><br>\n'
+DENSE_LINES = (4, 8, 16, 32, 64)
+
+
+def repeated(unit, size):
+    """Return unit repeated to at most size bytes, at least once."""
+    return unit * max(1, size // len(unit))
+
+
+def density(orig):
+    """The number of tags per KiB of orig."""
+    return orig.count('<') * 1024.0 / len(orig)
+
+
+def best_time(function, orig, repeat=DEFAULT_REPEAT):
+    """Return the shortest time per call of function(orig) in repeat samples.
+
+    Like timeit, every sample is a loop of as many calls as take
+    MIN_SAMPLE_TIME, so the time of a snippet is not lost in the
+    resolution of the clock.
+    """
+    timer = timeit.Timer(lambda: function(orig))
+    number = 1
+    elapsed = timer.timeit(number)
+    while elapsed < MIN_SAMPLE_TIME:
+        number *= 10
+        elapsed = timer.timeit(number)
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number
+
+
+class Calibration(object):
+    """Times the engines of transform.
+
+    The limits are disabled, they would abort the large documents.
+    """
+
+    def __init__(self, transform, repeat=DEFAULT_REPEAT):
+        self.transform = transform
+        self.repeat = repeat
+        self.compiled = transform.compiled()._replace(
+            limits=Limits(*[0] * len(Limits._fields)))
+        self.parser = PARSERS.get('utf-8')
+
+    def tree(self, orig):
+        return self.transform.sanitize(orig, self.compiled.cleaner,
+                                       self.parser, encoding='utf-8')
+
+    def snippet(self, orig):
+        return self.compiled.snippet(orig, 'utf-8')
+
+    def stream(self, orig):
+        return self.transform.sanitize_streamed(orig, self.compiled,
+                                                encoding='utf-8')
+
+    def faster(self, engine, orig):
+        """Whether engine sanitizes orig faster than the tree sanitizer."""
+        return (best_time(engine, orig, self.repeat) <
+                best_time(self.tree, orig, self.repeat))
+
+    def snippet_size(self):
+        """The largest snippet size at which the snippet sanitizer wins."""
+        size = 0
+        for candidate in SNIPPET_SIZES:
+            orig = '<p>%s</p>' % repeated(SNIPPET_TEXT, candidate - 7)
+            # a policy which needs the tree for the markup
+            if self.snippet(orig) is None:
+                break
+            if not self.faster(self.snippet, orig):
+                break
+            size = candidate
+        return size
+
+    def stream_size(self, max_size=DEFAULT_MAX_SIZE):
+        """The smallest size at which the stream sanitizer wins, or 0."""
+        size = STREAM_START_SIZE
+        while size <= max_size:
+            if self.faster(self.stream, repeated(TYPICAL, size)):
+                return size
+            size *= 2
+        return 0
+
+    def stream_density(self, size):
+        """The highest tag density at which the stream sanitizer wins.
+
+        The documents are of size bytes, the first one is the typical one.
+        """
+        units = [TYPICAL] + [TYPICAL + DENSE_LINE * lines
+                             for lines in DENSE_LINES]
+        highest = None
+        for unit in units:
+            orig = repeated(unit, size)
+            if not self.faster(self.stream, orig):
+                break
+            highest = int(density(orig))
+        return highest
+
+    def __call__(self, max_size=DEFAULT_MAX_SIZE):
+        """Return the measured thresholds as a dict."""
+        thresholds = {'snippet_size': self.snippet_size(),
+                      'stream_size': self.stream_size(max_size)}
+        if thresholds['stream_size']:
+            stream_density = self.stream_density(thresholds['stream_size'])
+            if stream_density is not None:
+                thresholds['stream_density'] = stream_density
+        return thresholds
+
+
+def calibrate(transform, max_size=DEFAULT_MAX_SIZE, repeat=DEFAULT_REPEAT):
+    """Return the thresholds measured for the policy of transform.
+
+    max_size is the size in bytes of the largest document timed, at most
+    max_bytes of the transform.
+    """
+    max_bytes = transform.compiled().limits.max_bytes
+    if max_bytes:
+        # larger documents are escaped, whichever engine would win
+        max_size = min(max_size, max_bytes)
+    return Calibration(transform, repeat)(max_size)
+
+
+def store_thresholds(portal, thresholds):
+    """Store thresholds in the config of safe_html in portal_transforms."""
+    from experimental.safe_html_transform.resanitize import get_transform
+    from Products.CMFCore.utils import getToolByName
+    transform = get_transform(portal)
+    wrapper = getToolByName(portal, 'portal_transforms')['safe_html']
+    for name, value in thresholds.items():
+        wrapper._config[name] = value
+        # configs stored before the threshold existed
+        if name not in wrapper._config_metadata:
+            wrapper._config_metadata[name] = transform.config_metadata[name]
+    wrapper._p_changed = True
+    # load the transform again with the stored config
+    wrapper._tr_init()
+
+
+def main(app, args):
+    """zopectl command: bin/instance calibrate_safe_html <site id>"""
+    parser = argparse.ArgumentParser(
+        prog='calibrate_safe_html',
+        description='Measure the engine thresholds of the safe_html '
+                    'transform and store them in its config.')
+    parser.add_argument('site', help='id of the Plone site')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE,
+                        help='size in bytes of the largest document timed')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='runs per document, the fastest one counts')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only log the thresholds')
+    options = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+
+    from experimental.safe_html_transform.resanitize import get_transform
+    from Testing.makerequest import makerequest
+    from zope.component.hooks import setSite
+    import transaction
+    app = makerequest(app)
+    portal = app.unrestrictedTraverse(options.site)
+    setSite(portal)
+    thresholds = calibrate(get_transform(portal), options.max_size,
+                           options.repeat)
+    for name in sorted(thresholds):
+        logger.info('%s: %s', name, thresholds[name])
+    if not options.dry_run:
+        store_thresholds(portal, thresholds)
+        transaction.commit()
+        logger.info('Stored in the config of safe_html')
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""The lxml tree sanitizer of the safe_html transform.
+
+lxml.html and its cleaner take a while to import, so SafeHTML only
+imports this module when it compiles its first policy.
+"""
+from experimental.safe_html_transform.css import ClassFilter
+from experimental.safe_html_transform.css import StyleSanitizer
+from experimental.safe_html_transform.encoding import decode
+from experimental.safe_html_transform.encoding import invalid_input
+from experimental.safe_html_transform.encoding import native_input
+from experimental.safe_html_transform.limits import check_deadline
+from experimental.safe_html_transform.limits import parse_checked
+from experimental.safe_html_transform.rules import RewriteRules
+from experimental.safe_html_transform.scrub import JavaScriptScrubber
+from experimental.safe_html_transform.tags import EMBEDDED_KILL_TAGS
+from experimental.safe_html_transform.tags import EMBEDDED_REMOVE_TAGS
+from lxml import etree
+from lxml.html.clean import Cleaner
+from lxml.html import fragments_fromstring
+from lxml.html import HTMLParser as HTMLTreeParser
+
+_strings = (bytes, str)
+
+
+class HTMLParser(Cleaner):
+    """
+    Inherited cleaner class of lxml.html.
+
+    Modified __call__ method of the lxml.html to allow the
+    frames tags in the input. styles is a callable which filters the
+    value of style attributes, classes the one of class attributes.
+    stripped_attributes are removed from all elements,
+    stripped_combinations maps tags to the attributes removed from them.
+    scrubber removes event handlers and javascript urls. rename_tags maps
+    tags to the name they are renamed to.
+
+    All of it is compiled into the RewriteRules in rules, which apply it
+    in a single walk over the tree.
+    """
+
+    def __init__(self, styles=None, classes=None, stripped_attributes=(),
+                 stripped_combinations=None, scrubber=None, rename_tags=None,
+                 **kw):
+        Cleaner.__init__(self, **kw)
+        self.styles = styles
+        self.classes = classes
+        self.scrubber = scrubber
+        self.stripped_attributes = frozenset(stripped_attributes)
+        self.stripped_combinations = stripped_combinations or {}
+        # compile the rules once, the cleaner is reused for every
+        # conversion with the same policy.
+        kill_tags = frozenset(self.kill_tags or ())
+        remove_tags = frozenset(self.remove_tags or ())
+        if self.embedded:
+            kill_tags |= EMBEDDED_KILL_TAGS
+            # The alternate contents that are in an iframe are a good fallback:
+            remove_tags |= EMBEDDED_REMOVE_TAGS
+        self.rules = RewriteRules(
+            kill_tags, remove_tags, rename_tags, self.stripped_attributes,
+            self.stripped_combinations, styles, classes,
+            scrubber is not None and scrubber.unsafe or None)
+
+    def filter_attribute(self, tag, name, value):
+        """Return the value attribute name of a tag element keeps, or None.
+
+        This applies the same rules as __call__ to a single attribute, for
+        the stream and snippet sanitizers.
+        """
+        return self.rules.filter_attribute(tag, name, value)
+
+    def filter_attributes(self, tag, attrib):
+        """Return the attributes of a tag element which are kept."""
+        return self.rules.filter_attributes(tag, attrib)
+
+    def __call__(self, doc, max_attributes=0, conversion=None):
+        """Clean doc in place.
+
+        Returns the number of removed elements and stripped attributes.
+        With max_attributes, LimitExceeded is raised for an element with
+        more attributes. The stages are timed into conversion.
+        """
+        return self.rules(doc, max_attributes, conversion)
+
+
+def split_fragments(element):
+    """Drop whitespace between the top-level elements of element.
+
+    This is what serializing every fragment on its own used to do.
+    """
+    if element.text is not None and not element.text.strip():
+        element.text = None
+    for child in element:
+        if child.tail is not None and not child.tail.strip():
+            child.tail = None
+    element.attrib.clear()
+
+
+def serialize_children(element, split=True):
+    """Serialize the children of element in a single tostring call.
+
+    Whitespace between top-level elements is dropped, unless split is
+    false because split_fragments was already called. Either way element
+    has no attributes, so its own tags are <tag> and </tag>.
+    """
+    if split:
+        split_fragments(element)
+    result = etree.tostring(element, with_tail=False)
+    if result.endswith('/>'):
+        return ''
+    return result[len(element.tag) + 2:-len(element.tag) - 3]
+
+
+def page_content(root):
+    """Return the element holding the content of the parsed page root.
+
+    Usually that is the body. Text before the body and content after a
+    stray </body> or </html> ends up next to the body or in another html
+    element, then the head is dropped and the html and body elements in
+    root are unwrapped, so the content is kept in document order and
+    adjacent text is joined.
+    """
+    children = root.getchildren()
+    # whitespace before the body is dropped
+    if root.text is not None and not root.text.strip():
+        root.text = None
+    for child in children:
+        if child.tag == 'body':
+            break
+        if child.tail is not None and not child.tail.strip():
+            child.tail = None
+    if (children and children[-1].tag == 'body' and not children[-1].tail and
+            not root.text and (len(children) == 1 or (
+                len(children) == 2 and children[0].tag == 'head' and
+                not children[0].tail))):
+        return children[-1]
+    for head in list(root.iter('head')):
+        head.drop_tree()
+    etree.strip_tags(root, 'html', 'body')
+    return root
+
+
+def fragment_fromstring(html, parser=None, base_url=None, **kw):
+    if not isinstance(html, _strings):
+        raise TypeError('string required')
+    elements = fragments_fromstring(html, parser=parser,
+                                        no_leading_text=True,
+                                        base_url=base_url, **kw)
+    if not elements:
+        raise etree.ParserError('No elements found')
+    # an array containing elements that have been fragmented. Elements
+    # will be stored in that array of there are more than one fragmented
+    # element.
+    ele_array = []
+    if len(elements) > 1:
+        """
+        if the number of elements is greater than 1 then we have to
+        deal with each element by traverse the array and append
+        each array in the ele_array which will be returned later.
+        """
+        for i in range(len(elements)):
+            result = elements[i]
+            if result.tail and result.tail.strip():
+                raise etree.ParserError('Element followed by text: %r' % result.tail)
+            result.tail = None
+            ele_array.append(result)
+    else:
+        # if there is only one element then append that element to the
+        # array and return the array
+        result = elements[0]
+        if result.tail and result.tail.strip():
+            raise etree.ParserError('Element followed by text: %r' % result.tail)
+        result.tail = None
+        ele_array.append(result)
+    return ele_array
+
+
+def build_cleaner(policy):
+    """Return the cleaner for policy."""
+    return HTMLParser(
+        kill_tags=policy.nasty_tags, remove_tags=policy.stripped_tags,
+        page_structure=False, safe_attrs_only=False,
+        styles=StyleSanitizer(policy.style_whitelist),
+        classes=(policy.class_blacklist and
+                 ClassFilter(policy.class_blacklist) or None),
+        stripped_attributes=policy.stripped_attributes,
+        stripped_combinations=policy.stripped_combinations,
+        scrubber=(policy.remove_javascript and
+                  JavaScriptScrubber() or None),
+        rename_tags=policy.rename_tags)
+
+
+def sanitize(orig, cleaner, parser=None, conversion=None, limits=None,
+             encoding=None, deadline=None):
+    """Return orig cleaned with cleaner.
+
+    The stages are timed into conversion, if one is given. With limits
+    LimitExceeded is raised as soon as orig exceeds one of them. The time
+    budget ends at deadline, or starts now without one. Byte strings are
+    parsed in encoding, a given parser must be built for it.
+    """
+    if orig == "" or orig == "<html></html>" or orig == "<html />" or orig == "<html/>":
+        return ""
+
+    orig, encoding = native_input(orig, encoding)
+    # append html tag to create a dummy parent for the tree
+    html = "<html>%s</html>" % orig
+    if limits is not None and deadline is None:
+        deadline = limits.deadline()
+    if limits is not None and limits.need_checks(orig):
+        root = parse_checked(html, limits, deadline, encoding)
+    else:
+        if parser is None:
+            parser = HTMLTreeParser(encoding=encoding)
+        root = etree.fromstring(html, parser)
+        if encoding is not None and invalid_input(parser):
+            # libxml2 drops the invalid bytes and what follows them
+            root = etree.fromstring(decode(html, encoding), HTMLTreeParser())
+    body = page_content(root)
+    if conversion is not None:
+        conversion.lap('parse')
+    check_deadline(deadline)
+    max_attributes = limits is not None and limits.max_attributes
+    removed, stripped = cleaner(body, max_attributes, conversion)
+    check_deadline(deadline)
+    if conversion is not None:
+        conversion.elements_removed += removed
+        conversion.attributes_stripped += stripped
+    split_fragments(body)
+    if conversion is not None:
+        conversion.lap('split')
+    safe_html = serialize_children(body, split=False)
+    if conversion is not None:
+        conversion.lap('serialize')
+    return safe_html
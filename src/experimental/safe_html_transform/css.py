@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Sanitizers for style and class attributes.
+
+Only declarations of whitelisted properties are kept in style
+attributes, blacklisted names are dropped from class attributes. Both
+repeat a lot in edited content, so the result for every distinct value
+is memoized.
+"""
+import abc
+import re
+
+# number of distinct values memoized per sanitizer.
+MEMOIZE_SIZE = 2048
+
+_COMMENT = re.compile(r'/\*.*?(?:\*/|$)', re.S)
+# declarations are separated by ; outside of quotes and parentheses.
+_DECLARATION = re.compile(r'''(?:[^;"'(]|"[^"]*"?|'[^']*'?|\([^)]*\)?)+''')
+_PROPERTY = re.compile(r'^-?[a-z][a-z0-9-]*$')
+# values which run code or hide it behind escapes.
+_UNSAFE_VALUE = re.compile(
+    r'expression|javascript:|vbscript:|behavior|-moz-binding|\\|<',
+    re.I)
+
+
+def parse_style(style):
+    """Return the (property, value) declarations of a style attribute.
+
+    Property names are lower cased, declarations without a property or
+    value are skipped.
+    """
+    declarations = []
+    for declaration in _DECLARATION.findall(_COMMENT.sub(' ', style)):
+        name, colon, value = declaration.partition(':')
+        name = name.strip().lower()
+        value = value.strip()
+        if colon and name and value:
+            declarations.append((name, value))
+    return declarations
+
+
+class MemoizedSanitizer(object):
+    """Calls sanitize once per distinct value.
+
+    Results are memoized in a dict which is emptied when it holds
+    cache_size entries. Subclasses implement sanitize.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, cache_size=MEMOIZE_SIZE):
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __call__(self, value):
+        try:
+            return self._cache[value]
+        except KeyError:
+            pass
+        result = self.sanitize(value)
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[value] = result
+        return result
+
+    @abc.abstractmethod
+    def sanitize(self, value):
+        """Return the sanitized form of value."""
+
+
+class StyleSanitizer(MemoizedSanitizer):
+    """Filters style attributes with a whitelist of properties.
+
+    Calling it with a style string returns the whitelisted declarations
+    as "property: value;" separated by spaces, or an empty string if none
+    is left.
+    """
+
+    def __init__(self, whitelist, cache_size=MEMOIZE_SIZE):
+        MemoizedSanitizer.__init__(self, cache_size)
+        self.whitelist = frozenset(whitelist)
+
+    def sanitize(self, style):
+        whitelist = self.whitelist
+        return ' '.join(
+            '%s: %s;' % (name, value) for name, value in parse_style(style)
+            if name in whitelist and _PROPERTY.match(name) and
+            _UNSAFE_VALUE.search(value) is None)
+
+
+class ClassFilter(MemoizedSanitizer):
+    """Drops the names in blacklist from class attributes.
+
+    Calling it with a class string returns it unchanged if it has no
+    blacklisted name, the remaining names separated by spaces otherwise,
+    or an empty string if none is left.
+    """
+
+    def __init__(self, blacklist, cache_size=MEMOIZE_SIZE):
+        MemoizedSanitizer.__init__(self, cache_size)
+        self.blacklist = frozenset(blacklist)
+
+    def sanitize(self, value):
+        names = value.split()
+        if self.blacklist.isdisjoint(names):
+            return value
+        return ' '.join(name for name in names if name not in self.blacklist)
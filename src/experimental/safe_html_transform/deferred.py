@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Sanitizing large documents in a background thread.
+
+Rendering a large document which is not in the result cache does not
+wait for the sanitizer. The conversion is queued for a worker thread,
+which puts the result into the result cache. Until then renders get the
+last version sanitized for the same field of the document with the same
+policy, or the input escaped as text.
+
+The queue is bounded. When it is full nothing more is queued and the
+fallback is served, so a burst of saves never ties up request threads.
+"""
+from experimental.safe_html_transform.cache import LRUCache
+from experimental.safe_html_transform.cache import RESULT_CACHE
+from Queue import Full
+from Queue import Queue
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger('experimental.safe_html_transform')
+
+# default number of documents waiting for the worker.
+DEFAULT_QUEUE_SIZE = 32
+
+# size in bytes of the last sanitized versions kept per document.
+LAST_VERSIONS_SIZE = 16 * 1024 * 1024
+
+
+def field_name(context, orig):
+    """Return the name of the rich text attribute of context holding orig.
+
+    Returns None when no attribute of context holds orig.
+    """
+    attributes = getattr(getattr(context, 'aq_base', context), '__dict__', {})
+    for name, value in sorted(attributes.items()):
+        if getattr(value, 'raw_encoded', None) == orig:
+            return name
+    return None
+
+
+def document_id(context, orig):
+    """Identifies the field a conversion of orig is for, None if unknown.
+
+    The id is a tuple of the physical path of context and the name of
+    its field holding orig.
+    """
+    try:
+        path = context.getPhysicalPath()
+    except AttributeError:
+        return None
+    name = field_name(context, orig)
+    if name is None:
+        return None
+    return '/'.join(path), name
+
+
+class DeferredSanitizer(object):
+    """Bounded queue of conversions and the thread working it off.
+
+    The worker is started with the first submitted conversion. lag is the
+    number of seconds between submitting and finishing the last
+    conversion, max_lag the longest of them.
+    """
+
+    def __init__(self, cache=RESULT_CACHE, queue_size=DEFAULT_QUEUE_SIZE,
+                 last_versions_size=LAST_VERSIONS_SIZE):
+        self.cache = cache
+        self.last_versions = LRUCache(last_versions_size)
+        self._queue = Queue(queue_size)
+        self._lock = threading.Lock()
+        # key -> time it was queued
+        self._pending = {}
+        self._worker = None
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def resize(self, queue_size):
+        with self._queue.mutex:
+            self._queue.maxsize = queue_size
+
+    def reserve(self, queue_size):
+        """Make room for queue_size documents, the queue never shrinks.
+
+        The queue is shared by all configs, it holds as many documents as
+        the largest defer_queue_size of them.
+        """
+        with self._queue.mutex:
+            if queue_size > self._queue.maxsize:
+                self._queue.maxsize = queue_size
+
+    def submit(self, key, convert, orig, document=None, cache=None):
+        """Queue convert(orig), its result is stored in cache under key.
+
+        cache defaults to the one the sanitizer was created with. Nothing
+        is queued when key already is. Returns False when the queue is
+        full.
+        """
+        if cache is None:
+            cache = self.cache
+        with self._lock:
+            if key in self._pending:
+                return True
+            now = time.time()
+            try:
+                self._queue.put_nowait((key, convert, orig, document,
+                                        cache, now))
+            except Full:
+                self.rejected += 1
+                return False
+            self._pending[key] = now
+            self.submitted += 1
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='safe_html deferred sanitizer')
+                self._worker.daemon = True
+                self._worker.start()
+        return True
+
+    def remember(self, document, safe_html):
+        """Keep safe_html as the last sanitized version of document."""
+        if document is not None:
+            self.last_versions.set(document, safe_html)
+
+    def last_version(self, document):
+        if document is None:
+            return None
+        return self.last_versions.get(document)
+
+    def wait(self):
+        """Block until all queued conversions are done."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            key, convert, orig, document, cache, queued = self._queue.get()
+            try:
+                safe_html = convert(orig)
+            except Exception:
+                logger.exception('safe_html: deferred sanitizing failed')
+                safe_html = None
+            if safe_html is not None:
+                cache.set(key, safe_html)
+                self.remember(document, safe_html)
+            with self._lock:
+                del self._pending[key]
+                if safe_html is None:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                    self.lag = time.time() - queued
+                    self.max_lag = max(self.max_lag, self.lag)
+            self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            oldest = min(self._pending.values() or [None])
+            return {
+                'queued': self._queue.qsize(),
+                'queue_size': self._queue.maxsize,
+                'pending': len(self._pending),
+                'oldest': oldest and time.time() - oldest or 0.0,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'lag': self.lag,
+                'max_lag': self.max_lag,
+            }
+
+
+# shared by all SafeHTML instances of the process.
+DEFERRED = DeferredSanitizer()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of sanitized output shared by the processes of a node.
+
+The Zope clients of a machine sanitize the same content. With a disk
+cache configured they share their output in a SQLite database, so a
+freshly started client reads it from disk instead of sanitizing every
+document again. The database is in WAL mode, readers never wait for a
+writer. It is only a cache: any database error counts as a miss.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('experimental.safe_html_transform')
+
+# default size of the disk cache in bytes.
+DEFAULT_DISK_CACHE_SIZE = 256 * 1024 * 1024
+
+# seconds a connection waits for the lock of another writer.
+BUSY_TIMEOUT = 1.0
+
+# the oldest entries are evicted until the cache is this full.
+EVICT_TO = 0.9
+
+# databases written with another format are emptied. Increase it when
+# a change of the sanitizer changes its output.
+FORMAT = '2'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+class DiskCache(object):
+    """Size bounded cache in the SQLite database at path.
+
+    Every thread has its own connection. The size of an entry is the
+    length of its key plus the length of its value. Once the entries
+    written since the last check could exceed max_bytes, the least
+    recently read or written are evicted. A path of None disables the
+    cache.
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_DISK_CACHE_SIZE):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._written = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        self.configure(path, max_bytes)
+
+    def configure(self, path, max_bytes=DEFAULT_DISK_CACHE_SIZE):
+        self.path = path or None
+        self.max_bytes = max_bytes
+
+    def _connection(self):
+        """The connection of the calling thread to path, None on errors."""
+        path = self.path
+        local = self._local
+        if getattr(local, 'path', None) == path:
+            return local.connection
+        local.path = path
+        local.connection = None
+        try:
+            connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_SCHEMA)
+            self._check_format(connection)
+        except sqlite3.Error as error:
+            self.errors += 1
+            logger.warning('safe_html: disk cache %s is not used: %s',
+                           path, error)
+            return None
+        local.connection = connection
+        return connection
+
+    def _check_format(self, connection):
+        row = connection.execute(
+            "SELECT value FROM meta WHERE name = 'format'").fetchone()
+        if row is not None and row[0] == FORMAT:
+            return
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM results')
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('format', ?)",
+                (FORMAT,))
+
+    def get(self, key, default=None):
+        connection = self.path and self._connection()
+        if connection is None:
+            return default
+        try:
+            row = connection.execute(
+                'SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return default
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        try:
+            connection.execute('UPDATE results SET used = ? WHERE key = ?',
+                               (time.time(), key))
+        except sqlite3.Error:
+            # another process is writing, the entry is just evicted sooner
+            pass
+        value = row[0]
+        if isinstance(value, buffer):
+            value = str(value)
+        return value
+
+    def set(self, key, value):
+        connection = self.path and self._connection()
+        if connection is None:
+            return
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        if isinstance(value, str):
+            value = buffer(value)
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                (key, value, size, time.time()))
+        except sqlite3.Error:
+            self.errors += 1
+            return
+        self.writes += 1
+        with self._lock:
+            self._written += size
+            if self._written * 16 < self.max_bytes:
+                return
+            self._written = 0
+        self._evict(connection)
+
+    def _evict(self, connection):
+        try:
+            total = connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes * EVICT_TO
+            keys = []
+            cursor = connection.execute(
+                'SELECT key, size FROM results ORDER BY used')
+            for key, size in cursor:
+                if excess <= 0:
+                    break
+                keys.append((key,))
+                excess -= size
+            cursor.close()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany('DELETE FROM results WHERE key = ?',
+                                       keys)
+        except sqlite3.Error:
+            self.errors += 1
+            return
+        self.evictions += len(keys)
+
+    def clear(self):
+        connection = self.path and self._connection()
+        if connection is None:
+            return
+        try:
+            connection.execute('DELETE FROM results')
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self):
+        entries = size = 0
+        connection = self.path and self._connection()
+        if connection is not None:
+            try:
+                entries, size = connection.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) '
+                    'FROM results').fetchone()
+            except sqlite3.Error:
+                self.errors += 1
+        return {
+            'path': self.path or '',
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'errors': self.errors,
+        }
+
+
+# numbers of DiskCache.stats.
+_STATS = ('entries', 'bytes', 'max_bytes', 'hits', 'misses', 'writes',
+          'evictions', 'errors')
+
+# path -> the disk cache shared by the configs with that disk_cache_path.
+_DISK_CACHES = {}
+_DISK_CACHES_LOCK = threading.Lock()
+
+
+def disk_cache(path, max_bytes=DEFAULT_DISK_CACHE_SIZE):
+    """Return the disk cache for the configs with disk_cache_path path.
+
+    None is returned without a path. The cache of a path shared by configs
+    with different sizes gets the largest of them.
+    """
+    if not path:
+        return None
+    with _DISK_CACHES_LOCK:
+        cache = _DISK_CACHES.get(path)
+        if cache is None:
+            cache = _DISK_CACHES[path] = DiskCache(path, max_bytes)
+        elif max_bytes > cache.max_bytes:
+            cache.max_bytes = max_bytes
+        return cache
+
+
+def disk_cache_stats():
+    """The stats of all disk caches of the process added up."""
+    with _DISK_CACHES_LOCK:
+        caches = [_DISK_CACHES[path] for path in sorted(_DISK_CACHES)]
+    totals = dict.fromkeys(_STATS, 0)
+    for cache in caches:
+        stats = cache.stats()
+        for name in _STATS:
+            totals[name] += stats[name]
+    totals['path'] = ' '.join(cache.path for cache in caches)
+    return totals
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Encoding of byte string input.
+
+Byte strings are read in the encoding given with the conversion, which
+PortalTransforms passes on from the rich text field, or as utf-8 without
+one. They are handed to lxml as they are, a parser built for their
+encoding decodes them, so they are not copied into unicode first. Only
+input which is not valid in its encoding, or in one libxml2 does not
+know, is decoded in python.
+"""
+import codecs
+
+DEFAULT_ENCODING = 'utf-8'
+
+# given encoding -> (name, whether libxml2 reads it). libxml2 and python
+# do not always use the same names.
+_ENCODINGS = {None: (DEFAULT_ENCODING, True), '': (DEFAULT_ENCODING, True),
+              DEFAULT_ENCODING: (DEFAULT_ENCODING, True)}
+
+
+def _lookup(encoding):
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return DEFAULT_ENCODING, True
+    from lxml import etree
+    for candidate in (name, name.replace('_', '-'), encoding):
+        try:
+            etree.HTMLParser(encoding=candidate)
+        except LookupError:
+            continue
+        return candidate, True
+    return name, False
+
+
+def _encoding(encoding):
+    try:
+        return _ENCODINGS[encoding]
+    except KeyError:
+        _ENCODINGS[encoding] = result = _lookup(encoding)
+        return result
+
+
+def input_encoding(orig, encoding=None):
+    """Return the normalized encoding of orig, None for unicode.
+
+    Unknown encodings are replaced by the default.
+    """
+    if isinstance(orig, unicode):
+        return None
+    return _encoding(encoding)[0]
+
+
+def native_input(orig, encoding=None):
+    """Return orig and its encoding in a form lxml parses.
+
+    Byte strings in an encoding libxml2 does not read are decoded.
+    """
+    if isinstance(orig, unicode):
+        return orig, None
+    name, native = _encoding(encoding)
+    if native:
+        return orig, name
+    return decode(orig, name), None
+
+
+def native_source(source, encoding=None):
+    """Return the file-like source and encoding in a form lxml parses.
+
+    A source in an encoding libxml2 does not read is decoded while it is
+    read.
+    """
+    name, native = _encoding(encoding)
+    if native:
+        return source, name
+    return codecs.getreader(name)(source, 'replace'), None
+
+
+def invalid_input(parser):
+    """Whether the last input of parser was not valid in its encoding."""
+    return any(error.type_name == 'ERR_INVALID_ENCODING'
+               for error in parser.error_log)
+
+
+def decode(orig, encoding):
+    """Return orig as unicode, invalid bytes are replaced."""
+    if isinstance(orig, unicode):
+        return orig
+    return orig.decode(encoding or DEFAULT_ENCODING, 'replace')
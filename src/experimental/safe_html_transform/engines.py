@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Choice of the engine which sanitizes a conversion.
+
+None of the engines is the fastest for all input. The snippet sanitizer
+wins on short snippets, the tree sanitizer on most documents and the
+stream sanitizer on very large ones, where moving the children of big
+elements around in the tree gets slow, as long as they are not dense
+with tags, each of which costs it a Python call. Large documents of
+block elements are sanitized incrementally to reuse unchanged blocks.
+
+EngineChoice picks one from features of the input which are cheap to
+get: its size in bytes, its tag density and whether it has tags the
+policy kills. All engines give the same output, the stream sanitizer is
+only chosen for documents it does (see streaming.py). The thresholds
+are part of the config, the calibration command measures them on the
+machine (see calibrate.py).
+"""
+from collections import namedtuple
+from experimental.safe_html_transform.streaming import streamable
+
+import re
+
+# engines a conversion is sanitized with.
+ENGINES = ('snippet', 'incremental', 'stream', 'tree')
+
+# threshold -> default. 0 disables the engine. stream_density is the
+# number of tags per KiB up to which the stream sanitizer is used. The
+# snippet sanitizer only wins on snippets of a few dozen bytes, it is
+# left to the calibration to enable it.
+DEFAULT_THRESHOLDS = (
+    ('snippet_size', 0),
+    ('incremental_size', 32 * 1024),
+    ('stream_size', 1536 * 1024),
+    ('stream_density', 100),
+)
+
+
+class Thresholds(namedtuple('Thresholds',
+                            [name for name, _ in DEFAULT_THRESHOLDS])):
+    """The sizes in bytes from or up to which the engines are used."""
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(*[config.get(name, default) or 0
+                     for name, default in DEFAULT_THRESHOLDS])
+
+
+def _any_case(tag):
+    # unlike re.I, this keeps the fast search for the leading <
+    return ''.join(char.isalpha() and '[%s%s]' % (char.lower(), char.upper())
+                   or re.escape(char) for char in tag)
+
+
+class EngineChoice(object):
+    """Chooses the engine for an input.
+
+    thresholds are the Thresholds of the config, kill_tags the tags the
+    policy removes with their content.
+    """
+
+    def __init__(self, thresholds, kill_tags):
+        self.thresholds = thresholds
+        self._nasty = None
+        if kill_tags:
+            self._nasty = re.compile(r'<(?:%s)[\s/>]' % '|'.join(
+                _any_case(tag) for tag in sorted(kill_tags)))
+
+    def nasty(self, orig):
+        """Whether orig has a tag the policy kills.
+
+        The safe markup scanner rejects such input anyway. A tag name in
+        an attribute value or a comment gives a false positive, which only
+        costs the scanner.
+        """
+        return self._nasty is not None and self._nasty.search(orig) is not None
+
+    def __call__(self, orig, tags, checks=False, cache=True):
+        """Return the engine to sanitize orig with.
+
+        tags is the number of tags of orig, checks whether the limits must
+        be checked while it is parsed, which only the tree and the stream
+        sanitizer do, cache whether the result cache is enabled.
+        """
+        thresholds = self.thresholds
+        size = len(orig)
+        if not checks:
+            if size <= thresholds.snippet_size:
+                return 'snippet'
+            if (cache and thresholds.incremental_size and
+                    size > thresholds.incremental_size):
+                return 'incremental'
+        return self.whole(orig, tags)
+
+    def whole(self, orig, tags):
+        """Return the engine for a document sanitized as a whole.
+
+        The stream sanitizer is only used for documents it gives the same
+        output for as the tree sanitizer.
+        """
+        thresholds = self.thresholds
+        size = len(orig)
+        if (thresholds.stream_size and size >= thresholds.stream_size and
+                tags * 1024 <= thresholds.stream_density * size and
+                streamable(orig)):
+            return 'stream'
+        return 'tree'
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Fast paths which avoid building a tree for simple input.
+
+plain_text handles input without any markup. SafeMarkupScanner detects
+input which only uses tags and attributes that the policy leaves alone,
+written the way the tree sanitizer writes them, such as output of the
+transform itself, so it can be returned as it is.
+split_blocks splits large input into top-level blocks which can be
+sanitized one by one. All are conservative: anything they are not sure
+about goes through the full sanitizer.
+"""
+from experimental.safe_html_transform.encoding import DEFAULT_ENCODING
+from experimental.safe_html_transform.scrub import SRCSET_ATTRIBUTES
+from experimental.safe_html_transform.scrub import unsafe_srcset
+from experimental.safe_html_transform.scrub import unsafe_url
+from experimental.safe_html_transform.scrub import URL_ATTRIBUTES
+from experimental.safe_html_transform.tags import CLOSING_START_TAGS
+from experimental.safe_html_transform.tags import NESTING_TAGS
+from experimental.safe_html_transform.tags import PARSER_VOID_TAGS
+
+import re
+
+# characters which make the parser do more than wrapping text in a p:
+# markup, entities and control characters libxml2 drops.
+_NOT_PLAIN = re.compile(r'[<&\x00-\x08\x0b\x0c\x0e-\x1f]')
+_NOT_PLAIN_UNICODE = re.compile(
+    u'[<&\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+_TAG = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)((?:\s+[^\s=<>"\'/]+'
+                  r'(?:\s*=\s*"[^"<]*")?)*)\s*(/?)>')
+
+# elements without content, the parser never expects them to be closed.
+VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+                       'input', 'keygen', 'link', 'meta', 'param', 'source',
+                       'track', 'wbr'])
+
+
+def escape_text(text):
+    return text.replace('>', '&gt;').replace('\r', '&#13;')
+
+
+def plain_text(orig, encoding=DEFAULT_ENCODING):
+    """Return the sanitized form of orig if it contains no markup.
+
+    Returns None when orig has markup or characters which need the
+    parser. Like the parser, text is wrapped in a p and whitespace only
+    input gives an empty result. Byte strings are read in encoding.
+    """
+    if isinstance(orig, unicode):
+        if _NOT_PLAIN_UNICODE.search(orig) is not None:
+            return None
+        text = orig
+    else:
+        if _NOT_PLAIN.search(orig) is not None:
+            return None
+        try:
+            text = orig.decode(encoding or DEFAULT_ENCODING)
+        except UnicodeDecodeError:
+            # the parser replaces the invalid bytes
+            return None
+    # the parser only drops ascii whitespace, not no-break spaces.
+    if not text.strip(' \t\n\r'):
+        return ''
+    return '<p>%s</p>' % escape_text(text).encode('ascii', 'xmlcharrefreplace')
+
+
+# a tag and an attribute as the tree sanitizer writes them.
+_CANONICAL_TAG = re.compile(r'<(/?)([a-z][a-z0-9]*)'
+                            r'((?: [a-z_][-a-z0-9_.]*="[^"<>]*")*)(/?)>')
+_CANONICAL_ATTRIBUTE = re.compile(r' ([^=]+)="([^"]*)"')
+# the characters and references the tree sanitizer writes escaped or
+# replaced in text and attribute values. It writes the characters of
+# references below 128 as they are, the others as decimal references.
+_BAD_TEXT = re.compile(r'[<>\r\x00-\x08\x0b\x0c\x0e-\x1f]')
+_BAD_VALUE = re.compile(r'[<>\t\n\r\x00-\x08\x0b\x0c\x0e-\x1f]')
+_TEXT_REFERENCE = re.compile(r'&(?:amp|lt|gt|#13|#([1-9][0-9]{2,6}));')
+_VALUE_REFERENCE = re.compile(
+    r'&(?:amp|lt|gt|quot|#9|#10|#13|#([1-9][0-9]{2,6}));')
+_VISIBLE = re.compile(r'[!-~]')
+_BAD_CHARACTER = re.compile(u'[\ud800-\udfff\ufffe\uffff]')
+
+
+def _canonical(text, bad, reference):
+    if bad.search(text) is not None:
+        return False
+    if '&' not in text:
+        return True
+    numbers = reference.findall(text)
+    if text.count('&') != len(numbers):
+        return False
+    for number in numbers:
+        if number and not (128 <= int(number) <= 0x10ffff and
+                           not 0xd800 <= int(number) <= 0xdfff and
+                           int(number) not in (0xfffe, 0xffff)):
+            return False
+    return True
+
+
+class SafeMarkupScanner(object):
+    """Returns html which only uses markup the policy allows, or None.
+
+    tags may be used as they are. Attributes must not be event handlers,
+    styles, forbidden by the policy or urls the scrubber removes. Urls
+    with references, which may hide a scheme, go to the parser as well.
+    The markup must be written as the tree sanitizer writes it: lower
+    case names, double quoted attribute values, no empty elements but
+    the ones written as <tag/>, elements nested the way libxml2 keeps
+    them, and characters escaped the same way. Only whitespace between
+    the top-level elements is dropped and characters outside of ascii
+    replaced by references, like the tree sanitizer does.
+    """
+
+    def __init__(self, policy, tags):
+        self.tags = tags & NESTING_TAGS
+        self.void_tags = policy.void_tags | PARSER_VOID_TAGS
+        self.stripped_attributes = policy.stripped_attributes | frozenset(
+            ['style'])
+        self.stripped_combinations = policy.stripped_combinations
+        self.class_blacklist = policy.class_blacklist
+
+    def _safe_attributes(self, tag, attributes):
+        forbidden = self.stripped_combinations.get(tag, ())
+        names = set()
+        for name, value in _CANONICAL_ATTRIBUTE.findall(attributes):
+            if (name in names or name.startswith('on') or
+                    name in self.stripped_attributes or name in forbidden or
+                    not _canonical(value, _BAD_VALUE, _VALUE_REFERENCE)):
+                return False
+            names.add(name)
+            if name in URL_ATTRIBUTES:
+                if '&' in value or unsafe_url(value):
+                    return False
+            elif name in SRCSET_ATTRIBUTES:
+                if '&' in value or unsafe_srcset(value):
+                    return False
+            elif name == 'class' and self.class_blacklist:
+                if self.class_blacklist.intersection(value.split()):
+                    return False
+        return True
+
+    def _tag(self, stack, match):
+        """Put the tag of match on stack or take it off.
+
+        Returns False unless it is allowed and written like the tree
+        sanitizer does.
+        """
+        closing, tag, attributes, empty = match.groups()
+        if tag not in self.tags:
+            return False
+        if closing:
+            # mismatched, or empty and written as <tag/> by the tree
+            # sanitizer
+            return not (attributes or empty or not stack or
+                        stack[-1][0] != tag or
+                        stack.pop()[1] == match.start())
+        if stack and stack[-1][0] in CLOSING_START_TAGS.get(tag, ()):
+            return False
+        if not self._safe_attributes(tag, attributes):
+            return False
+        if not empty:
+            if tag in self.void_tags:
+                return False
+            stack.append((tag, match.end()))
+        return True
+
+    def __call__(self, orig, encoding=None):
+        # open elements as (tag, end of their start tag)
+        stack = []
+        parts = []
+        dropped = False
+        position = 0
+        for match in _CANONICAL_TAG.finditer(orig):
+            text = orig[position:match.start()]
+            kept = _kept_text(text, stack, parts)
+            if kept is None or not self._tag(stack, match):
+                return None
+            if kept:
+                parts.append(text)
+            else:
+                dropped = dropped or bool(text)
+            parts.append(match.group())
+            position = match.end()
+        text = orig[position:]
+        kept = _kept_text(text, stack, parts)
+        if kept is None or stack:
+            return None
+        if kept:
+            parts.append(text)
+        elif text:
+            dropped = True
+        if dropped:
+            return _ascii(''.join(parts), encoding)
+        return _ascii(orig, encoding)
+
+
+def _kept_text(text, stack, parts):
+    """Whether the tree sanitizer keeps text, None if it changes it.
+
+    Whitespace between top-level elements is dropped, leading text put
+    into a p. None as well when it may be whitespace written as
+    references or characters outside of ascii.
+    """
+    if not _canonical(text, _BAD_TEXT, _TEXT_REFERENCE):
+        return None
+    if stack:
+        return True
+    if _VISIBLE.search(_TEXT_REFERENCE.sub('', text)) is None:
+        if text.strip():
+            return None
+        return False
+    if not parts:
+        return None
+    return True
+
+
+def _ascii(html, encoding):
+    """Return html with the characters outside of ascii as references."""
+    if isinstance(html, unicode):
+        text = html
+    else:
+        try:
+            html.decode('ascii')
+            return html
+        except UnicodeDecodeError:
+            pass
+        try:
+            text = html.decode(encoding or DEFAULT_ENCODING)
+        except UnicodeDecodeError:
+            return None
+    if _BAD_CHARACTER.search(text) is not None:
+        return None
+    return text.encode('ascii', 'xmlcharrefreplace')
+
+
+def split_blocks(orig, block_tags):
+    """Split orig into its top-level elements.
+
+    Returns None unless orig only consists of properly nested elements
+    in block_tags, separated by whitespace. Those elements are parsed the
+    same on their own as within orig, so sanitizing them one by one gives
+    the same result as sanitizing orig. The whitespace after an element
+    belongs to it, because a text tail moved out of a renamed element
+    keeps it. Comments and anything else the tag pattern does not match
+    make it give up.
+    """
+    starts = []
+    stack = []
+    position = 0
+    for match in _TAG.finditer(orig):
+        text = orig[position:match.start()]
+        if '<' in text or (not stack and text.strip()):
+            return None
+        position = match.end()
+        closing, tag, attributes, empty = match.groups()
+        tag = tag.lower()
+        if closing:
+            if attributes or empty or not stack or stack.pop() != tag:
+                return None
+            continue
+        if not stack:
+            if tag not in block_tags:
+                return None
+            starts.append(match.start())
+        if tag not in VOID_TAGS:
+            # <div/> opens a div for the parser
+            if empty:
+                return None
+            stack.append(tag)
+    rest = orig[position:]
+    if stack or '<' in rest or rest.strip():
+        return None
+    return [orig[start:end] for start, end in zip(starts,
+                                                  starts[1:] + [len(orig)])]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Complexity limits and the time budget of a conversion.
+
+Input which exceeds a limit is not sanitized, the conversion is aborted
+as early as possible and the input is returned as escaped text instead.
+Element count and depth are checked while the input is parsed. Input
+which has too few tags to exceed them is parsed without the checks,
+which are slower. The attributes are checked in the first walk over the
+tree.
+"""
+from collections import namedtuple
+from itertools import chain
+from experimental.safe_html_transform.encoding import decode
+from experimental.safe_html_transform.streaming import escape_text
+from experimental.safe_html_transform.streaming import iter_chunks
+
+from StringIO import StringIO
+
+import re
+import time
+
+# characters the parser drops, they are not allowed in the output.
+_CONTROL = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# size of the chunks fed to the parser while checking the limits.
+PARSE_CHUNK_SIZE = 64 * 1024
+
+# number of parser events between two checks of the time budget.
+DEADLINE_EVENTS = 256
+
+# limit -> default. 0 disables a limit. libxml2 stops parsing at a depth
+# of 256 anyway, checking the depth is only needed for a lower limit.
+# Large documents are left to the stream sanitizer, so the size is not
+# limited by default.
+DEFAULT_LIMITS = (
+    ('max_bytes', 0),
+    ('max_depth', 0),
+    ('max_elements', 50000),
+    ('max_attributes', 100),
+    ('time_budget', 2000),
+)
+
+
+class LimitExceeded(Exception):
+    """Raised when a conversion exceeds limit."""
+
+    def __init__(self, limit, value):
+        Exception.__init__(self, '%s exceeded: %s' % (limit, value))
+        self.limit = limit
+        self.value = value
+
+
+class Limits(namedtuple('Limits', [name for name, _ in DEFAULT_LIMITS])):
+    """The limits of a policy. time_budget is in milliseconds.
+
+    max_attributes is the number of attributes of a single element.
+    """
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(*[config.get(name, default) or 0
+                     for name, default in DEFAULT_LIMITS])
+
+    def deadline(self):
+        """Time at which a conversion starting now exceeds the budget."""
+        if not self.time_budget:
+            return None
+        return time.time() + self.time_budget / 1000.0
+
+    def check_bytes(self, orig):
+        if self.max_bytes and len(orig) > self.max_bytes:
+            raise LimitExceeded('max_bytes', len(orig))
+
+    def need_checks(self, orig, tags=None):
+        """Whether parsing orig could exceed max_elements or max_depth.
+
+        Every element starts with a <, so the number of them, tags if it
+        is already known, is a bound for the element count and the depth.
+        """
+        if tags is None:
+            tags = orig.count('<')
+        return ((self.max_elements and tags > self.max_elements) or
+                (self.max_depth and tags > self.max_depth))
+
+    def check_element(self, depth, elements, attributes, deadline=None):
+        """Check the element number elements at depth with attributes.
+
+        The deadline is only checked every DEADLINE_EVENTS elements.
+        """
+        if self.max_depth and depth > self.max_depth:
+            raise LimitExceeded('max_depth', depth)
+        if self.max_elements and elements > self.max_elements:
+            raise LimitExceeded('max_elements', elements)
+        if self.max_attributes and len(attributes) > self.max_attributes:
+            raise LimitExceeded('max_attributes', len(attributes))
+        if not elements % DEADLINE_EVENTS:
+            check_deadline(deadline)
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.time() > deadline:
+        raise LimitExceeded('time_budget', time.time() - deadline)
+
+
+def parse_checked(html, limits, deadline=None, encoding=None):
+    """Parse html to an lxml.html tree while checking limits.
+
+    Raises LimitExceeded as soon as the parser reports an element which
+    exceeds one of the limits or the deadline has passed. Byte strings
+    are read in encoding.
+    """
+    from lxml import etree
+    from lxml.html import HtmlElementClassLookup
+    # the pull parser does not report invalid input, it is decoded with
+    # replacement characters instead. The chunks copy the input anyway.
+    html = decode(html, encoding)
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    parser.set_element_class_lookup(HtmlElementClassLookup())
+    check_element = limits.check_element
+    depth = elements = 0
+    chunks = iter_chunks(StringIO(html), PARSE_CHUNK_SIZE)
+    # None closes the parser, which reports the remaining events
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            root = parser.close()
+        else:
+            parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'end':
+                depth -= 1
+                continue
+            depth += 1
+            elements += 1
+            check_element(depth, elements, element.attrib, deadline)
+        check_deadline(deadline)
+    return root
+
+
+def escaped_text(orig, encoding=None):
+    """The fallback for input which exceeded a limit.
+
+    The input is escaped and wrapped in a p, so the markup shows up as
+    text. Byte strings are read in encoding.
+    """
+    orig = _CONTROL.sub(u'', decode(orig, encoding))
+    if not orig.strip():
+        return ''
+    return '<p>%s</p>' % escape_text(orig).encode('ascii', 'xmlcharrefreplace')
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Per-thread lxml parsers.
+
+lxml parsers must not be used by two threads at the same time, but they
+can be reused for any number of documents. Every thread gets its own
+parser, tied to the input encoding it was built for, so no lock is taken
+when it is reused. Parsers hold no state of the policy, all policies
+and sites of the process share them.
+"""
+import thread
+import threading
+
+
+class _ThreadParser(object):
+    """The parser of one thread and how often it was reused."""
+
+    __slots__ = ('encoding', 'parser', 'hits')
+
+    def __init__(self, encoding, parser):
+        self.encoding = encoding
+        self.parser = parser
+        self.hits = 0
+
+
+class ParserPool(object):
+    """Hands out one parser per thread.
+
+    A thread gets a new parser when it asks for another encoding than the
+    last time. Hits are counted per thread without locking, rebuilds are
+    rare and counted under a lock, which also folds the hits of the
+    replaced parser into the totals.
+    """
+
+    def __init__(self, factory=None):
+        # lxml.html is imported with the first parser
+        self.factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = {}
+        self.hits = 0
+        self.rebuilds = 0
+
+    def get(self, encoding=None):
+        """Return the parser of the calling thread for encoding.
+
+        The parser reads byte strings in encoding, without one it is the
+        parser for unicode input.
+        """
+        entry = getattr(self._local, 'entry', None)
+        if entry is not None and entry.encoding == encoding:
+            entry.hits += 1
+            return entry.parser
+        return self._rebuild(encoding, entry)
+
+    def _rebuild(self, encoding, old):
+        factory = self.factory
+        if factory is None:
+            from lxml.html import HTMLParser as factory
+        if encoding is None:
+            parser = factory()
+        else:
+            parser = factory(encoding=encoding)
+        entry = _ThreadParser(encoding, parser)
+        ident = thread.get_ident()
+        with self._lock:
+            self.rebuilds += 1
+            # the entry of a finished thread with the same ident
+            old = self._threads.get(ident, old)
+            if old is not None:
+                self.hits += old.hits
+            self._threads[ident] = entry
+        self._local.entry = entry
+        return entry.parser
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': len(self._threads),
+                'hits': self.hits + sum(entry.hits for entry in
+                                        self._threads.values()),
+                'rebuilds': self.rebuilds,
+            }
+
+
+# shared by all SafeHTML instances of the process.
+PARSERS = ParserPool()
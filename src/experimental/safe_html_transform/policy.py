@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Compiled sanitization policy of the safe_html transform."""
+from experimental.safe_html_transform.tags import PARAGRAPH_TAGS
+from hashlib import sha1
+
+
+def compile_names(value):
+    """Return a frozenset of lower cased names from a config value.
+
+    The value may be a mapping (its keys are used, like valid_tags), a
+    sequence or a whitespace separated string.
+    """
+    if not value:
+        return frozenset()
+    if isinstance(value, basestring):
+        value = value.split()
+    return frozenset(name.strip().lower() for name in value if name.strip())
+
+
+def compile_void_tags(valid_tags):
+    """Return the tags of a valid_tags mapping which have no closing part.
+
+    In valid_tags the value is 1 for tags with a closing part and 0 for
+    empty tags like br.
+    """
+    if not isinstance(valid_tags, dict):
+        return frozenset()
+    return frozenset(tag.lower() for tag, value in valid_tags.items()
+                     if not value or str(value).strip() == '0')
+
+
+def compile_combinations(value):
+    """Compile stripped_combinations into a tag -> attributes index.
+
+    {'table th td': 'width height'} becomes
+    {'table': frozenset(['width', 'height']), 'th': ..., 'td': ...}.
+    """
+    index = {}
+    for tags, attributes in (value or {}).items():
+        attributes = compile_names(attributes)
+        for tag in compile_names(tags):
+            index[tag] = index.get(tag, frozenset()) | attributes
+    return index
+
+
+def compile_renames(value):
+    """Compile rename_tags into a lower cased tag -> new tag index.
+
+    Tags renamed to themselves are left out.
+    """
+    index = {}
+    for tag, name in (value or {}).items():
+        tag, name = tag.strip().lower(), str(name).strip().lower()
+        if tag and name and name != tag:
+            index[tag] = name
+    return index
+
+
+class SanitizePolicy(object):
+    """Immutable, compiled form of the safe_html transform config.
+
+    All rules are turned into frozensets and lookup tables once, so a
+    conversion only does set and dict lookups. Build a new policy when the
+    config changes instead of modifying this one. Configs stored before
+    rename_tags existed rename PARAGRAPH_TAGS to p, as they always did.
+    """
+
+    __slots__ = ('valid_tags', 'void_tags', 'nasty_tags', 'stripped_tags',
+                 'rename_tags', 'stripped_attributes',
+                 'stripped_combinations', 'style_whitelist',
+                 'class_blacklist', 'remove_javascript', 'fingerprint')
+
+    def __init__(self, config):
+        set_ = super(SanitizePolicy, self).__setattr__
+        valid_tags = config.get('valid_tags')
+        set_('valid_tags', compile_names(valid_tags))
+        set_('void_tags', compile_void_tags(valid_tags))
+        set_('nasty_tags', compile_names(config.get('nasty_tags')))
+        set_('stripped_tags', compile_names(config.get('stripped_tags')))
+        set_('rename_tags', compile_renames(config.get(
+            'rename_tags', dict.fromkeys(PARAGRAPH_TAGS, 'p'))))
+        set_('stripped_attributes',
+             compile_names(config.get('stripped_attributes')))
+        set_('stripped_combinations',
+             compile_combinations(config.get('stripped_combinations')))
+        set_('style_whitelist', compile_names(config.get('style_whitelist')))
+        set_('class_blacklist', frozenset(
+            name.strip() for name in config.get('class_blacklist') or ()
+            if name.strip()))
+        set_('remove_javascript', bool(config.get('remove_javascript')))
+        set_('fingerprint', self._fingerprint())
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SanitizePolicy is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('SanitizePolicy is immutable')
+
+    def _fingerprint(self):
+        """Digest identifying the rules of this policy."""
+        parts = []
+        for name in self.__slots__[:-1]:
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                value = sorted((key, isinstance(val, frozenset) and
+                                sorted(val) or val)
+                               for key, val in value.items())
+            elif isinstance(value, frozenset):
+                value = sorted(value)
+            parts.append('%s=%r' % (name, value))
+        return sha1('\n'.join(parts)).hexdigest()
+
+    def __repr__(self):
+        return '<SanitizePolicy %s>' % self.fingerprint[:12]
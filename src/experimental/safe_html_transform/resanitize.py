@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Re-sanitize the rich text of existing content with the current policy.
+
+Content is walked through the catalog in batches sorted by UID. The
+rich text of a batch is sanitized with SafeHTML.convert_many, optionally
+in a process pool, and every batch is committed together with a
+checkpoint, so an interrupted run resumes after the last committed batch.
+
+Run it with ``bin/instance resanitize_html <site id>`` or through the
+upgrade step of the default profile, which leaves the commit to the
+upgrade. With store_output set, it also stores the output of every
+field on the content, which refreshes outputs stored with an older
+policy.
+"""
+from Acquisition import aq_base
+from experimental.safe_html_transform.transforms.safe_html import SafeHTML
+from persistent.mapping import PersistentMapping
+from plone.app.textfield.interfaces import IRichText
+from plone.app.textfield.value import RichTextValue
+from plone.dexterity.interfaces import IDexterityContent
+from plone.dexterity.utils import iterSchemata
+from Products.CMFCore.utils import getToolByName
+from zope.annotation.interfaces import IAnnotations
+from zope.component.hooks import setSite
+from zope.schema import getFieldsInOrder
+
+import argparse
+import logging
+import time
+import transaction
+
+logger = logging.getLogger('experimental.safe_html_transform')
+
+# annotation key on the site root holding the progress of a run.
+CHECKPOINT_KEY = 'experimental.safe_html_transform.resanitize'
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def get_transform(portal):
+    """Return the safe_html transform registered in portal_transforms."""
+    transforms = getToolByName(portal, 'portal_transforms')
+    transform = None
+    if 'safe_html' in transforms:
+        wrapper = transforms['safe_html']
+        transform = getattr(aq_base(wrapper), '_v_transform', None)
+        if transform is None:
+            transform = wrapper._tr_init()
+    if not isinstance(transform, SafeHTML):
+        transform = SafeHTML()
+    return transform
+
+
+def rich_text_fields(obj):
+    """Yield (field, value) for all html rich text fields of obj."""
+    for schema in iterSchemata(obj):
+        for name, field in getFieldsInOrder(schema):
+            if not IRichText.providedBy(field):
+                continue
+            value = field.get(field.interface(obj))
+            if value and value.mimeType == 'text/html' and value.raw:
+                yield field, value
+
+
+def resanitize_batch(transform, brains, pool=None):
+    """Sanitize the rich text of the objects of brains.
+
+    pool is a process pool of the transform, None to sanitize in the
+    calling process. A field is only changed when its sanitized text
+    differs from its raw text in more than the characters written as
+    references. Returns the number of changed fields.
+    """
+    by_encoding = {}
+    for brain in brains:
+        obj = brain._unrestrictedGetObject()
+        for field, value in rich_text_fields(obj):
+            by_encoding.setdefault(value.encoding, []).append(
+                (obj, field, value))
+    store = transform.config.get('store_output')
+    changed = 0
+    for encoding, fields in by_encoding.items():
+        results = transform.convert_many(
+            [value.raw_encoded for _, _, value in fields], pool=pool,
+            encoding=encoding)
+        for (obj, field, value), safe_html in zip(fields, results):
+            # the sanitizer writes all characters outside of ascii as
+            # references
+            if safe_html == value.raw.encode('ascii', 'xmlcharrefreplace'):
+                if store:
+                    transform.store(obj, field.__name__, value.raw_encoded,
+                                    safe_html, encoding)
+                continue
+            field.set(field.interface(obj), RichTextValue(
+                safe_html.decode(encoding), value.mimeType,
+                value.outputMimeType, encoding))
+            obj.reindexObject()
+            if store:
+                # the output of the new input
+                transform.store(obj, field.__name__, safe_html,
+                                encoding=encoding)
+            changed += 1
+    return changed
+
+
+def store_rich_text(obj, event):
+    """Store the sanitized rich text of obj when it is saved.
+
+    Nothing is sanitized unless store_output is set.
+    """
+    transform = get_transform(obj)
+    config = transform.config
+    if not config.get('store_output') or config.get('disable_transform'):
+        return
+    for field, value in rich_text_fields(obj):
+        transform.store(obj, field.__name__, value.raw_encoded,
+                        encoding=value.encoding)
+
+
+def resanitize(portal, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+               commit=True):
+    """Re-sanitize all dexterity rich text of portal in batches.
+
+    workers is the size of the process pool, None for one per CPU and 0
+    to sanitize in the calling process. The pool is shared by all
+    batches. Returns the number of changed fields.
+    """
+    transform = get_transform(portal)
+    fingerprint = transform.policy().fingerprint
+    annotations = IAnnotations(portal)
+    checkpoint = annotations.get(CHECKPOINT_KEY)
+    if checkpoint is None or checkpoint['policy'] != fingerprint:
+        checkpoint = annotations[CHECKPOINT_KEY] = PersistentMapping(
+            policy=fingerprint, last_uid='', done=0, changed=0)
+    elif checkpoint['last_uid']:
+        logger.info('Resuming after %d documents', checkpoint['done'])
+
+    catalog = getToolByName(portal, 'portal_catalog')
+    query = {'object_provides': IDexterityContent.__identifier__,
+             'sort_on': 'UID'}
+    if checkpoint['last_uid']:
+        query['UID'] = {'query': checkpoint['last_uid'], 'range': 'min'}
+    brains = catalog.unrestrictedSearchResults(**query)
+
+    pool = workers != 0 and transform.process_pool(workers) or None
+    started = time.time()
+    done = 0
+    batch = []
+    try:
+        for brain in brains:
+            if brain.UID == checkpoint['last_uid']:
+                continue
+            batch.append(brain)
+            if len(batch) < batch_size:
+                continue
+            done += _finish_batch(transform, batch, pool, checkpoint, commit)
+            _report(checkpoint, done, started)
+            batch = []
+        if batch:
+            done += _finish_batch(transform, batch, pool, checkpoint, commit)
+            _report(checkpoint, done, started)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    changed = checkpoint['changed']
+    del annotations[CHECKPOINT_KEY]
+    if commit:
+        transaction.commit()
+    return changed
+
+
+def _finish_batch(transform, batch, pool, checkpoint, commit):
+    checkpoint['changed'] += resanitize_batch(transform, batch, pool)
+    checkpoint['done'] += len(batch)
+    checkpoint['last_uid'] = batch[-1].UID
+    if commit:
+        transaction.commit()
+    return len(batch)
+
+
+def _report(checkpoint, done, started):
+    elapsed = time.time() - started
+    logger.info('Re-sanitized %d documents (%d changed fields), %.1f '
+                'documents/s', checkpoint['done'], checkpoint['changed'],
+                elapsed and done / elapsed or 0.0)
+
+
+def main(app, args):
+    """zopectl command: bin/instance resanitize_html <site id>"""
+    parser = argparse.ArgumentParser(
+        prog='resanitize_html',
+        description='Re-sanitize the rich text of all content of a site.')
+    parser.add_argument('site', help='id of the Plone site')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='documents per transaction')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='size of the process pool, 0 to not use one')
+    options = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+
+    from Testing.makerequest import makerequest
+    app = makerequest(app)
+    portal = app.unrestrictedTraverse(options.site)
+    setSite(portal)
+    changed = resanitize(portal, batch_size=options.batch_size,
+                         workers=options.workers)
+    logger.info('Done, %d fields changed', changed)
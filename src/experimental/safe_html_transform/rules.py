@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Rewrite rules of the safe_html transform compiled into dispatch tables.
+
+The policy renames elements, unwraps them, kills them with their content
+and strips or filters attributes. RewriteRules compiles all of these
+into a table keyed by tag and one keyed by attribute name and applies
+them to a tree in a single walk, so an element or attribute costs one
+dict lookup however many rules there are. The stream and the snippet
+sanitizer apply the same tables.
+"""
+from experimental.safe_html_transform.limits import LimitExceeded
+from experimental.safe_html_transform.tags import KILL
+from experimental.safe_html_transform.tags import NO_RULE
+from experimental.safe_html_transform.tags import PARAGRAPH_CLOSING_TAGS
+from experimental.safe_html_transform.tags import UNWRAP
+
+# attribute rule removing the attribute.
+STRIP = 'strip'
+
+
+def unnest_paragraph(element):
+    """Move block children of a renamed p element behind it.
+
+    Everything from the first block child on becomes a following sibling
+    of element, just like the parser does with <p>foo<p>bar</p></p>.
+    """
+    for index, child in enumerate(element):
+        if child.tag in PARAGRAPH_CLOSING_TAGS:
+            break
+    else:
+        return
+    parent = element.getparent()
+    if parent is None:
+        return
+    moved = element[index:]
+    tail = element.tail
+    element.tail = None
+    position = parent.index(element)
+    for offset, child in enumerate(moved):
+        parent.insert(position + offset + 1, child)
+    if tail:
+        moved[-1].tail = (moved[-1].tail or '') + tail
+
+
+class RewriteRules(object):
+    """The element and attribute rules of a policy.
+
+    tags maps a tag to its new name or None and its fate, KILL, UNWRAP or
+    None. A renamed element gets the fate of its new name. attributes
+    maps an attribute name to STRIP or to a filter returning the value
+    to keep, like styles for style and classes for class attributes.
+    combinations maps tags to the attributes stripped from them, unsafe
+    is called with the name and value of the remaining attributes and
+    tells whether to strip them.
+    """
+
+    def __init__(self, kill_tags=(), remove_tags=(), rename_tags=None,
+                 stripped_attributes=(), stripped_combinations=None,
+                 styles=None, classes=None, unsafe=None):
+        kill_tags = frozenset(kill_tags)
+        remove_tags = frozenset(remove_tags) - kill_tags
+
+        def fate(tag):
+            if tag in kill_tags:
+                return KILL
+            if tag in remove_tags:
+                return UNWRAP
+            return None
+
+        tags = dict((tag, (None, fate(tag)))
+                    for tag in kill_tags | remove_tags)
+        for tag, name in (rename_tags or {}).items():
+            if name != tag:
+                tags[tag] = (name, fate(name))
+        self.tags = tags
+        self.rename_tags = dict((tag, name) for tag, (name, _) in tags.items()
+                                if name is not None)
+        self.kill_tags = frozenset(tag for tag, (_, fate_) in tags.items()
+                                   if fate_ is KILL)
+        self.remove_tags = frozenset(tag for tag, (_, fate_) in tags.items()
+                                     if fate_ is UNWRAP)
+
+        attributes = {}
+        if styles is not None:
+            attributes['style'] = styles
+        if classes is not None:
+            attributes['class'] = classes
+        for name in stripped_attributes:
+            attributes[name] = STRIP
+        self.attributes = attributes
+        self.combinations = stripped_combinations or {}
+        self.unsafe = unsafe
+
+    def filter_attribute(self, tag, name, value):
+        """Return the value attribute name of a tag element keeps, or None.
+
+        tag is the name after renaming.
+        """
+        rule = self.attributes.get(name)
+        if (rule is STRIP or name in self.combinations.get(tag, ()) or
+                self.unsafe is not None and self.unsafe(name, value)):
+            return None
+        if rule is not None:
+            return rule(value) or None
+        return value
+
+    def filter_attributes(self, tag, attrib):
+        """Return the attributes of a tag element which are kept."""
+        safe = {}
+        for name, value in attrib.items():
+            value = self.filter_attribute(tag, name, value)
+            if value is not None:
+                safe[name] = value
+        return safe
+
+    def _rewrite_attributes(self, element, tag, items):
+        """Strip or filter the attributes items of element in place.
+
+        tag is the name after renaming. Returns the number of stripped
+        attributes.
+        """
+        attributes = self.attributes
+        forbidden = self.combinations.get(tag, ())
+        unsafe = self.unsafe
+        stripped = 0
+        for name, value in items:
+            rule = attributes.get(name)
+            if (rule is STRIP or name in forbidden or
+                    unsafe is not None and unsafe(name, value)):
+                del element.attrib[name]
+                stripped += 1
+            elif rule is not None:
+                safe = rule(value)
+                if not safe:
+                    del element.attrib[name]
+                    stripped += 1
+                elif safe != value:
+                    element.set(name, safe)
+        return stripped
+
+    def __call__(self, root, max_attributes=0, conversion=None):
+        """Apply the rules to root and its descendants in place.
+
+        Returns the number of removed elements and stripped attributes.
+        With max_attributes, LimitExceeded is raised for an element with
+        more attributes. The walk and the changes of the structure after
+        it are timed into conversion as rewrite and clean, if one is given.
+        """
+        tags = self.tags
+        rewrite_attributes = self._rewrite_attributes
+        renamed = []
+        killed = []
+        unwrapped = []
+        stripped = 0
+        for element in root.iter():
+            items = element.items()
+            if max_attributes and len(items) > max_attributes:
+                raise LimitExceeded('max_attributes', len(items))
+            tag = element.tag
+            name, fate = tags.get(tag, NO_RULE)
+            if name is not None:
+                element.tag = tag = name
+                if name == 'p':
+                    renamed.append(element)
+            if fate is KILL:
+                killed.append(element)
+                continue
+            if fate is UNWRAP:
+                unwrapped.append(element)
+            if items:
+                stripped += rewrite_attributes(element, tag, items)
+        if conversion is not None:
+            conversion.lap('rewrite')
+        for element in renamed:
+            unnest_paragraph(element)
+        for element in killed:
+            element.drop_tree()
+        for element in unwrapped:
+            element.drop_tag()
+        if conversion is not None:
+            conversion.lap('clean')
+        return len(killed) + len(unwrapped), stripped
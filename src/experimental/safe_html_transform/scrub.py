@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Scrubber for javascript in attributes, used with remove_javascript.
+
+Event handler attributes (on*) are removed, as are urls which run code
+when they are followed or loaded, including the candidate urls of
+srcset.
+"""
+from experimental.safe_html_transform.css import MemoizedSanitizer
+
+import re
+
+# attributes holding urls.
+URL_ATTRIBUTES = frozenset(['href', 'src', 'action', 'background',
+                            'cite', 'longdesc', 'usemap', 'poster',
+                            'formaction', 'xlink:href'])
+
+# attributes holding comma separated urls, each with an optional
+# descriptor.
+SRCSET_ATTRIBUTES = frozenset(['srcset'])
+
+# schemes of urls which are removed.
+UNSAFE_SCHEMES = ('javascript', 'vbscript', 'data')
+
+# browsers ignore whitespace and control characters in the scheme. The
+# parser leaves the character references html5 added alone, browsers
+# read them as tab, newline and colon.
+_IGNORED = re.compile(u'(?:[\x00-\x20]|&Tab;|&NewLine;)+')
+_UNSAFE_URL = re.compile(r'(?:%s)(?::|&colon;)' % '|'.join(UNSAFE_SCHEMES),
+                         re.I)
+
+
+def unsafe_url(url):
+    """Whether url uses one of UNSAFE_SCHEMES."""
+    return _UNSAFE_URL.match(_IGNORED.sub(u'', url)) is not None
+
+
+def unsafe_srcset(srcset):
+    """Whether a candidate url of srcset uses one of UNSAFE_SCHEMES.
+
+    Urls may hold commas too, every part between them is checked.
+    """
+    for candidate in srcset.split(','):
+        if unsafe_url(candidate):
+            return True
+    return False
+
+
+class JavaScriptScrubber(MemoizedSanitizer):
+    """Tells which attributes of an element run javascript.
+
+    Calling it with a url returns whether the url is safe, the result is
+    memoized per url, for srcset attributes per candidate url.
+    """
+
+    def __init__(self, url_attributes=URL_ATTRIBUTES,
+                 srcset_attributes=SRCSET_ATTRIBUTES, **kw):
+        MemoizedSanitizer.__init__(self, **kw)
+        self.url_attributes = frozenset(url_attributes)
+        self.srcset_attributes = frozenset(srcset_attributes)
+
+    def sanitize(self, url):
+        return not unsafe_url(url)
+
+    def unsafe(self, name, value):
+        """Whether the attribute name with value must be removed."""
+        if name[:2] == 'on':
+            return True
+        if name in self.url_attributes:
+            return not self(value)
+        if name in self.srcset_attributes:
+            # see unsafe_srcset
+            for candidate in value.split(','):
+                if not self(candidate):
+                    return True
+        return False
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Snapshot of the filter settings stored in plone.registry.
+
+The transform reads the IFilterSchema records once and keeps them in a
+snapshot. A subscriber for registry changes refreshes the snapshot, which
+gets a new version, so the transform rebuilds its policy without reading
+the registry on every conversion.
+"""
+from experimental.safe_html_transform.policy import compile_names
+from plone.registry.interfaces import IRegistry
+from zope.component import queryUtility
+import itertools
+import threading
+import time
+
+# prefix of the IFilterSchema records, see profiles/default/registry.xml
+RECORD_PREFIX = 'plone'
+
+# names of the IFilterSchema fields the transform uses
+FIELD_NAMES = ('nasty_tags', 'stripped_tags', 'custom_tags',
+               'stripped_attributes', 'style_whitelist', 'class_blacklist')
+
+RECORD_NAMES = frozenset('%s.%s' % (RECORD_PREFIX, name)
+                         for name in FIELD_NAMES)
+
+# modification events are only seen by the ZEO client that made the
+# change. Other clients reread the records after this many seconds.
+SNAPSHOT_MAX_AGE = 300
+
+_versions = itertools.count(1)
+_snapshots = {}
+_lock = threading.Lock()
+
+
+class FilterSettings(object):
+    """Immutable snapshot of the filter records of one registry."""
+
+    def __init__(self, values, version):
+        self.values = values
+        self.version = version
+        self.created = time.time()
+
+    def expired(self, now=None):
+        return (now or time.time()) - self.created > SNAPSHOT_MAX_AGE
+
+
+def _registry_key(registry):
+    # every ZODB connection has its own copy of the registry, they share
+    # the snapshot through the oid.
+    return getattr(registry, '_p_oid', None) or registry
+
+
+def read_settings(registry):
+    """Read the filter records from registry into a dict."""
+    values = {}
+    for name in FIELD_NAMES:
+        value = registry.get('%s.%s' % (RECORD_PREFIX, name))
+        if value is not None:
+            values[name] = tuple(value)
+    return values
+
+
+def refresh_settings(registry):
+    """Take a new snapshot of the records of registry."""
+    snapshot = FilterSettings(read_settings(registry), next(_versions))
+    with _lock:
+        _snapshots[_registry_key(registry)] = snapshot
+    return snapshot
+
+
+def get_filter_settings():
+    """Return the snapshot for the registry of the current site.
+
+    Returns None when there is no registry, e.g. outside of a Plone site.
+    """
+    registry = queryUtility(IRegistry)
+    if registry is None:
+        return None
+    snapshot = _snapshots.get(_registry_key(registry))
+    if snapshot is None or snapshot.expired():
+        snapshot = refresh_settings(registry)
+    return snapshot
+
+
+def merge_settings(config, settings):
+    """Return a copy of the transform config updated with settings.
+
+    The nasty tags of the registry are added to the ones of the transform,
+    so the control panel cannot let through tags like style or meta it
+    does not list.
+    """
+    if settings is None or not settings.values:
+        return config
+    values = settings.values
+    config = dict(config)
+    for name in ('stripped_tags', 'stripped_attributes',
+                 'style_whitelist', 'class_blacklist'):
+        if name in values:
+            config[name] = values[name]
+    if 'nasty_tags' in values:
+        config['nasty_tags'] = tuple(sorted(
+            compile_names(config.get('nasty_tags')) |
+            compile_names(values['nasty_tags'])))
+    if values.get('custom_tags'):
+        valid_tags = dict(config.get('valid_tags') or {})
+        for tag in values['custom_tags']:
+            valid_tags.setdefault(tag, 1)
+        config['valid_tags'] = valid_tags
+    return config
+
+
+def registry_modified(event):
+    """Refresh the snapshot when one of the filter records changed."""
+    record = event.record
+    if getattr(record, '__name__', None) not in RECORD_NAMES:
+        return
+    registry = getattr(record, '__parent__', None)
+    if registry is None:
+        registry = queryUtility(IRegistry)
+    if registry is not None:
+        refresh_settings(registry)
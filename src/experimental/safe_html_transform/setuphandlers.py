@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
-import pkgutil
 import logging
 from Products.CMFCore.utils import getToolByName
-import experimental.safe_html_transform.transforms
+
+# modules in experimental.safe_html_transform.transforms registered with
+# portal_transforms. Listed explicitly, scanning the package for them
+# costs startup time.
+TRANSFORMS = ('safe_html',)
 
 
 def isNotCurrentProfile(context):
@@ -19,12 +22,7 @@ def post_install(context):
 
 
 def availableTransforms():
-    try:
-        return [x[1] for x
-                in pkgutil.iter_modules(experimental.safe_html_transform.transforms.__path__)
-                if x[1] != 'mimetypes']
-    except ImportError:
-        return []
+    return list(TRANSFORMS)
 
 
 def uninstallOldTransform(context, logger=None):
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""Tree-free sanitizer for small snippets.
+
+Titles, descriptions and comments are short and use little markup, for
+them building a tree costs more than the sanitizing. SnippetSanitizer
+splits the input into tokens with regular expressions and runs a state
+machine over them, which applies the same rules as the tree sanitizer
+while it writes the output.
+
+It only handles input which it knows libxml2 parses without rewriting
+the structure: properly nested tags of the structures in the tables
+below, quoted or simple attribute values and known entities. It returns
+None for anything else, and the tree sanitizer takes over, so the output
+is always the one of the tree sanitizer.
+"""
+from experimental.safe_html_transform.encoding import DEFAULT_ENCODING
+from experimental.safe_html_transform.limits import LimitExceeded
+from experimental.safe_html_transform.streaming import escape_attribute
+from experimental.safe_html_transform.streaming import escape_text
+from experimental.safe_html_transform.tags import KILL
+from experimental.safe_html_transform.tags import NO_RULE
+from experimental.safe_html_transform.tags import UNWRAP
+from htmlentitydefs import name2codepoint
+
+import re
+import sys
+
+# elements which may be nested in any of the handled elements but lists.
+PHRASING_TAGS = frozenset([
+    'a', 'abbr', 'acronym', 'b', 'bdo', 'big', 'br', 'cite', 'code', 'dfn',
+    'em', 'font', 'i', 'img', 'kbd', 'q', 's', 'samp', 'small', 'span',
+    'strike', 'strong', 'sub', 'sup', 'tt', 'u', 'var'])
+
+# elements which close a paragraph the parser opened for leading text.
+# They are handled at the top level and in BLOCK_PARENTS.
+BLOCK_TAGS = frozenset([
+    'blockquote', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'ol',
+    'p', 'pre', 'ul'])
+
+# elements which may contain BLOCK_TAGS, None is the top level.
+BLOCK_PARENTS = frozenset([None, 'blockquote', 'li'])
+
+# elements which only contain li elements and whitespace.
+LIST_TAGS = frozenset(['ol', 'ul'])
+
+VOID_TAGS = frozenset(['br', 'hr', 'img'])
+
+# elements the parser reads as raw text. They are handled when the policy
+# removes them with their content.
+RAW_TAGS = frozenset(['script', 'style'])
+
+# the entities libxml2 knows.
+ENTITIES = dict(name2codepoint, apos=39)
+
+_TOKEN = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)'
+                    r'((?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*\s*=\s*'
+                    r'(?:"[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))*)\s*(/?)>')
+_ATTRIBUTE = re.compile(r'\s+([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*'
+                        r'(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+))')
+_END_TAG = re.compile(r'</[a-zA-Z]')
+# characters escape_text and escape_attribute replace.
+_TEXT_ESCAPES = re.compile(u'[&<>\r]')
+_ATTRIBUTE_ESCAPES = re.compile(u'[&<>\r"\n\t]')
+_ENTITY = re.compile(r'&(?:#([0-9]{1,7})|#[xX]([0-9a-fA-F]{1,6})|'
+                     r'([a-zA-Z][a-zA-Z0-9]*));')
+# characters the parser drops or replaces.
+_BAD_TEXT = re.compile(
+    u'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f\ud800-\udfff\ufffe\uffff]')
+
+# what libxml2 counts as whitespace in the input.
+_BLANKS = u' \t\n\r'
+
+
+def _escape_text(text):
+    if _TEXT_ESCAPES.search(text) is None:
+        return text
+    return escape_text(text)
+
+
+def _valid_code_point(code):
+    return (code in (9, 10, 13) or 0x20 <= code < 0x7f or
+            0xa0 <= code < 0xd800 or 0xe000 <= code < 0xfffe or
+            0x10000 <= code <= sys.maxunicode)
+
+
+def unescape(text):
+    """Return text with its entities replaced, None if it has others.
+
+    Only complete entities libxml2 replaces the same way are handled, any
+    other & gives None.
+    """
+    if '&' not in text:
+        return text
+    parts = []
+    position = 0
+    for match in _ENTITY.finditer(text):
+        literal = text[position:match.start()]
+        if '&' in literal:
+            return None
+        decimal, hexadecimal, name = match.groups()
+        if name is not None:
+            code = ENTITIES.get(name)
+            if code is None:
+                return None
+        else:
+            code = int(decimal or hexadecimal, hexadecimal and 16 or 10)
+            if not _valid_code_point(code):
+                return None
+        parts.append(literal)
+        parts.append(unichr(code))
+        position = match.end()
+    rest = text[position:]
+    if '&' in rest:
+        return None
+    parts.append(rest)
+    return u''.join(parts)
+
+
+class _State(object):
+    """The output of one call and the elements open in it."""
+
+    __slots__ = ('out', 'stack', 'depth', 'toplevel', 'started', 'pending')
+
+    def __init__(self):
+        self.out = []
+        # open elements as (tag, written name or None, implied)
+        self.stack = []
+        # the number of written open elements
+        self.depth = 0
+        # the text outside of all written elements, which is only kept if
+        # there is more than whitespace between two top-level elements.
+        self.toplevel = []
+        # whether the parser saw more than whitespace, the last start tag
+        # written still lacks its > or />.
+        self.started = self.pending = False
+
+    def open(self):
+        """Finish the last start tag written."""
+        if self.pending:
+            self.out.append('>')
+            self.pending = False
+
+    def close(self, name):
+        """Close the last written element, name."""
+        self.depth -= 1
+        if self.pending:
+            self.out.append('/>')
+            self.pending = False
+        else:
+            self.out.append('</%s>' % name)
+
+    def flush_toplevel(self):
+        if self.toplevel:
+            text = u''.join(self.toplevel)
+            del self.toplevel[:]
+            if text.strip():
+                self.out.append(_escape_text(text))
+
+
+class SnippetSanitizer(object):
+    """Sanitizes small html snippets without building a tree.
+
+    rules are the RewriteRules of the policy, they are looked up in their
+    dispatch tables while the output is written. Calling it returns the
+    sanitized html or None when the input needs the tree sanitizer.
+    """
+
+    def __init__(self, rules, limits=None):
+        self.rules = rules
+        self.tags = rules.tags
+        self.raw_tags = RAW_TAGS & rules.kill_tags
+        self.max_attributes = limits is not None and limits.max_attributes
+        # the paragraph the parser opens for leading text
+        self._implied = 'p' not in rules.tags
+
+    def _attributes(self, name, attributes):
+        """Return the attributes of a name element to write.
+
+        None is returned if the parser would not read them as they are.
+        """
+        seen = set()
+        parts = []
+        filter_attribute = self.rules.filter_attribute
+        for match in _ATTRIBUTE.finditer(attributes):
+            attribute = match.group(1).lower()
+            if attribute in seen:
+                return None
+            seen.add(attribute)
+            value = match.group(2)
+            if value is None:
+                value = match.group(3)
+                if value is None:
+                    value = match.group(4)
+            value = unescape(value)
+            if value is None:
+                return None
+            value = filter_attribute(name, attribute, value)
+            if value is not None:
+                if _ATTRIBUTE_ESCAPES.search(value) is not None:
+                    value = escape_attribute(value)
+                parts.append(' %s="%s"' % (attribute, value))
+        if self.max_attributes and len(seen) > self.max_attributes:
+            raise LimitExceeded('max_attributes', len(seen))
+        return parts
+
+    def __call__(self, orig, encoding=None):
+        if not isinstance(orig, unicode):
+            try:
+                orig = orig.decode(encoding or DEFAULT_ENCODING)
+            except UnicodeDecodeError:
+                return None
+        if _BAD_TEXT.search(orig) is not None:
+            return None
+        # text, then closing, tag, attributes, empty and text of every tag
+        tokens = _TOKEN.split(orig)
+        count = len(tokens)
+        state = _State()
+        index = 0
+        while True:
+            if tokens[index] and not self._text(state, tokens[index]):
+                return None
+            index += 5
+            if index > count:
+                break
+            closing, tag, attributes, empty = tokens[index - 4:index]
+            tag = tag.lower()
+            if closing:
+                handled = self._end_tag(state, tag, attributes, empty)
+            elif tag in self.raw_tags:
+                index = self._raw_element(state, tokens, index, tag, empty)
+                handled = index is not None
+            else:
+                handled = self._start_tag(state, tag, attributes, empty)
+            if not handled:
+                return None
+        return self._finish(state)
+
+    def _text(self, state, raw):
+        """Write the text raw, return False if it needs the parser."""
+        if '<' in raw:
+            return False
+        text = unescape(raw)
+        if text is None:
+            return False
+        if state.depth:
+            parent = state.stack[-1][0]
+            if parent in LIST_TAGS:
+                if raw.strip(_BLANKS):
+                    return False
+            elif state.pending and parent == 'pre' and raw[0] in '\r\n':
+                # the parser drops the first newline of a pre
+                return False
+            state.open()
+            state.out.append(_escape_text(text))
+        elif state.started:
+            state.toplevel.append(text)
+        elif raw.strip(_BLANKS):
+            # the parser opens a paragraph for leading text, a character
+            # reference is not whitespace to it
+            if not self._implied:
+                return False
+            state.stack.append(('p', 'p', True))
+            state.depth = 1
+            state.started = True
+            state.out.append('<p>')
+            state.out.append(_escape_text(text))
+        return True
+
+    def _end_tag(self, state, tag, attributes, empty):
+        """Close the tag element, return False if it is not the last open."""
+        stack = state.stack
+        if attributes or empty or not stack or stack[-1][0] != tag:
+            return False
+        name = stack.pop()[1]
+        if name is not None:
+            state.close(name)
+        return True
+
+    def _raw_element(self, state, tokens, index, tag, empty):
+        """Skip the killed raw text element tag starting before index.
+
+        Returns the index of the text after its end tag, None if the
+        parser reads it differently.
+        """
+        # in front of any content the parser puts it into the head. Its
+        # raw text ends at the first end tag, whichever it is.
+        if not state.started or empty:
+            return None
+        count = len(tokens)
+        while True:
+            if _END_TAG.search(tokens[index]) is not None:
+                return None
+            index += 5
+            if index > count:
+                return None
+            if tokens[index - 4]:
+                break
+            if _END_TAG.search(tokens[index - 2]) is not None:
+                return None
+        closing, end, attributes, empty = tokens[index - 4:index]
+        if end.lower() != tag or attributes or empty:
+            return None
+        return index
+
+    def _place(self, state, tag):
+        """Whether the parser puts a tag element after the open ones.
+
+        The paragraph the parser opened for leading text is closed before
+        a block.
+        """
+        stack = state.stack
+        parent = stack and stack[-1] or None
+        if tag in BLOCK_TAGS:
+            if parent is not None and parent[2]:
+                stack.pop()
+                state.close('p')
+                parent = stack and stack[-1] or None
+            # blocks in renamed elements are left to the tree sanitizer
+            return parent is None or (parent[0] in BLOCK_PARENTS and
+                                      parent[1] == parent[0])
+        if tag == 'li':
+            return parent is not None and parent[0] in LIST_TAGS
+        if tag in PHRASING_TAGS:
+            if parent is not None and parent[0] in LIST_TAGS:
+                return False
+            return tag != 'a' or all(entry[0] != 'a' for entry in stack)
+        return False
+
+    def _start_tag(self, state, tag, attributes, empty):
+        """Write the start tag, return False if it needs the parser."""
+        void = tag in VOID_TAGS
+        if empty and not void or not self._place(state, tag):
+            return False
+        state.started = True
+        name, fate = self.tags.get(tag, NO_RULE)
+        if fate is KILL:
+            return False
+        if fate is UNWRAP:
+            if tag not in PHRASING_TAGS:
+                return False
+            if not void:
+                state.stack.append((tag, None, False))
+            return True
+        if name is None:
+            name = tag
+        parts = attributes and self._attributes(name, attributes)
+        if parts is None:
+            return False
+        if not state.depth:
+            state.flush_toplevel()
+        state.open()
+        state.out.append('<' + name)
+        if parts:
+            state.out.extend(parts)
+        if void:
+            state.out.append('/>')
+        else:
+            state.stack.append((tag, name, False))
+            state.depth += 1
+            state.pending = True
+        return True
+
+    def _finish(self, state):
+        """Close the open elements and return the output."""
+        while state.stack:
+            name = state.stack.pop()[1]
+            if name is not None:
+                state.close(name)
+        state.flush_toplevel()
+        return u''.join(state.out).encode('ascii', 'xmlcharrefreplace')
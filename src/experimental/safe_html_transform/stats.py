@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Timers and counters of the safe_html transform.
+
+Collecting is off by default. When it is on, every conversion measures
+the time spent in each stage of the sanitizer and adds it, together with
+its counters, to the process wide STATS in a single locked update.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger('experimental.safe_html_transform')
+
+# stages of a conversion in the order they run. lookup covers the fast
+# paths, the result cache and the choice of the engine, snippet and
+# stream are the snippet and the stream sanitizer, the others the tree
+# sanitizer.
+STAGES = ('lookup', 'snippet', 'stream', 'parse', 'rewrite', 'clean',
+          'split', 'serialize')
+
+# counters kept for every conversion. scanner_skipped counts input with
+# killed tags, which is not given to the safe markup scanner.
+COUNTERS = ('conversions', 'plain_text', 'safe_markup', 'snippet', 'cached',
+            'sanitized', 'incremental', 'streamed', 'limited', 'deferred',
+            'bytes_in', 'bytes_out', 'elements_removed',
+            'attributes_stripped', 'blocks_sanitized', 'blocks_reused',
+            'scanner_skipped')
+
+
+class Conversion(object):
+    """Measurements of a single conversion.
+
+    engine is the one chosen to sanitize it, if it was not handled before.
+    """
+
+    __slots__ = ('last', 'timings', 'engine', 'elements_removed',
+                 'attributes_stripped', 'blocks_sanitized', 'blocks_reused',
+                 'scanner_skipped')
+
+    def __init__(self):
+        self.last = time.time()
+        self.timings = {}
+        self.engine = None
+        self.elements_removed = 0
+        self.attributes_stripped = 0
+        self.blocks_sanitized = 0
+        self.blocks_reused = 0
+        self.scanner_skipped = False
+
+    def lap(self, stage):
+        """Add the time since the previous lap to stage."""
+        now = time.time()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+class ConversionStats(object):
+    """Thread safe totals of the conversions of this process.
+
+    log_interval is the number of seconds between summaries written to
+    the log, 0 disables them.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.log_interval = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def configure(self, enabled, log_interval=0):
+        self.enabled = bool(enabled)
+        self.log_interval = log_interval
+
+    def enable(self, log_interval=0):
+        """Collect for a config with collect_stats.
+
+        Only the conversions of such configs are recorded, the totals are
+        logged at the shortest interval of them.
+        """
+        self.enabled = True
+        if log_interval and (not self.log_interval or
+                             log_interval < self.log_interval):
+            self.log_interval = log_interval
+
+    def reset(self):
+        with self._lock:
+            self.started = self._logged = time.time()
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.timings = dict.fromkeys(STAGES, 0.0)
+            self.limits = {}
+            self.engines = {}
+
+    def begin(self):
+        """Return a Conversion to measure, or None when disabled."""
+        if self.enabled:
+            return Conversion()
+        return None
+
+    def record(self, conversion, path, orig, safe_html):
+        """Add a finished conversion which took path.
+
+        path is the counter of the way it was handled: plain_text,
+        safe_markup, cached, snippet, sanitized, incremental, streamed,
+        limited or deferred. It differs from the chosen engine when that
+        gave up on the input. Time which was not assigned to a stage yet
+        is added to lookup.
+        """
+        if path != 'sanitized':
+            conversion.lap('lookup')
+        with self._lock:
+            counters = self.counters
+            counters['conversions'] += 1
+            counters[path] += 1
+            counters['bytes_in'] += len(orig)
+            counters['bytes_out'] += len(safe_html)
+            counters['elements_removed'] += conversion.elements_removed
+            counters['attributes_stripped'] += conversion.attributes_stripped
+            counters['blocks_sanitized'] += conversion.blocks_sanitized
+            counters['blocks_reused'] += conversion.blocks_reused
+            counters['scanner_skipped'] += conversion.scanner_skipped
+            engine = conversion.engine
+            if engine is not None:
+                self.engines[engine] = self.engines.get(engine, 0) + 1
+            timings = self.timings
+            for stage, seconds in conversion.timings.iteritems():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+            now = time.time()
+            if not self.log_interval or now - self._logged < self.log_interval:
+                return
+            self._logged = now
+            summary = self.summary()
+        logger.info(summary)
+
+    def limit_exceeded(self, limit):
+        """Count a conversion aborted by limit, even when disabled."""
+        with self._lock:
+            self.limits[limit] = self.limits.get(limit, 0) + 1
+
+    def snapshot(self):
+        """Return a copy of the counters and timings."""
+        with self._lock:
+            return {
+                'since': self.started,
+                'counters': dict(self.counters),
+                'timings': dict(self.timings),
+                'limits': dict(self.limits),
+                'engines': dict(self.engines),
+            }
+
+    def summary(self):
+        """One line summary of the totals."""
+        counters = self.counters
+        stages = ' '.join('%s=%.3fs' % (stage, self.timings[stage])
+                          for stage in STAGES)
+        return ('safe_html: %d conversions (%d sanitized), %d bytes in, '
+                '%d bytes out, %d elements removed, %d attributes '
+                'stripped, %s' % (
+                    counters['conversions'], counters['sanitized'],
+                    counters['bytes_in'], counters['bytes_out'],
+                    counters['elements_removed'],
+                    counters['attributes_stripped'], stages))
+
+
+# shared by all SafeHTML instances of the process.
+STATS = ConversionStats()
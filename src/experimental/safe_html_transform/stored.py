@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Sanitized output stored on the content it belongs to.
+
+With store_output set, the sanitized rich text of dexterity content is
+stored in an annotation when the content is saved, and renders read it
+from there. An entry holds the cache key of the input it was sanitized
+from, which includes the policy fingerprint. Entries of edited input or
+of another policy do not match and are sanitized at render time like
+before, until the content is saved or re-sanitized again.
+"""
+from persistent.mapping import PersistentMapping
+from zope.annotation.interfaces import IAnnotations
+
+# annotation key of the field name -> (cache key, output) mapping.
+OUTPUT_KEY = 'experimental.safe_html_transform.output'
+
+
+def stored_output(context, key):
+    """Return the output stored on context for the input key, or None."""
+    annotations = IAnnotations(context, None)
+    if annotations is None:
+        return None
+    outputs = annotations.get(OUTPUT_KEY)
+    if not outputs:
+        return None
+    for stored_key, safe_html in outputs.values():
+        if stored_key == key:
+            return safe_html
+    return None
+
+
+def store_output(obj, name, key, safe_html):
+    """Store safe_html on obj as the output of the field name.
+
+    Nothing is written when the entry is unchanged.
+    """
+    annotations = IAnnotations(obj)
+    outputs = annotations.get(OUTPUT_KEY)
+    if outputs is None:
+        outputs = annotations[OUTPUT_KEY] = PersistentMapping()
+    if outputs.get(name) != (key, safe_html):
+        outputs[name] = (key, safe_html)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""Streaming sanitizer for very large documents.
+
+The input is fed in chunks to an lxml HTML parser with a parser target
+instead of building a tree. The target applies the same rules as
+SafeHTML.sanitize while the events come in and writes the output to a
+file-like sink, so memory only depends on the nesting depth of the
+document, not on its size. The rewrite rules of the policy are looked
+up in their dispatch tables for every element.
+
+The output matches the tree based sanitizer, except for:
+
+- attributes, which are written in sorted order because the parser
+  target does not get them in document order,
+- attributes without a value, which are written as name="" instead of
+  name="name", the parser target cannot tell them from empty ones,
+- content after an </html> end tag, which the parser does not report
+  when it is fed in chunks,
+- script and style elements without their end tag or with a < in them,
+  which the parser ends in other places when it is fed in chunks,
+- content nested deeper than the 256 levels libxml2 builds a tree for,
+  which is kept.
+
+streamable tells whether a document has none of the first four and
+its attributes in sorted order.
+"""
+from experimental.safe_html_transform.encoding import DEFAULT_ENCODING
+from experimental.safe_html_transform.tags import KILL
+from experimental.safe_html_transform.tags import NO_RULE
+from experimental.safe_html_transform.tags import PARAGRAPH_CLOSING_TAGS
+from experimental.safe_html_transform.tags import UNWRAP
+
+import codecs
+import re
+
+# size of the chunks read from the source and written to the sink.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# an incomplete tag in this many characters at the end of a chunk is held
+# back, enough for a split </script or </style end tag.
+HELD_BACK = 32
+
+# a start tag with an attribute without a value, script or style content
+# with a < which does not start its end tag or without one, an </html>
+# tag.
+_NOT_STREAMABLE = re.compile(
+    r"""<(?=[a-z])(?![a-z][^\s/>]*(?:[\s/]+[^\s/>"'=]+\s*=\s*"""
+    r"""(?:"[^"]*"|'[^']*'|[^\s>"']+))*[\s/]*>)"""
+    r"""|<(script|style)[\s/>][^<]*(?:<(?!/\1[\s/>])|\Z)"""
+    r"""|</html[\s/>]""", re.I)
+# a start tag with several attributes and one of them.
+_ATTRIBUTES = re.compile(
+    r"""<[a-z][^\s/>]*((?:[\s/]+[^\s/>"'=]+\s*=\s*"""
+    r"""(?:"[^"]*"|'[^']*'|[^\s>"']+)){2,})""", re.I)
+_ATTRIBUTE = re.compile(
+    r"""([^\s/>"'=]+)\s*=\s*(?:"[^"]*"|'[^']*'|[^\s>"']+)""")
+
+# rules of the page structure, which the tree sanitizer never sees: the
+# head is skipped with its content, html and body are unwrapped.
+_PAGE_RULES = {
+    'head': (None, KILL),
+    'html': (None, UNWRAP),
+    'body': (None, UNWRAP),
+}
+_PAGE_TAGS = frozenset(['html', 'body'])
+_BEFORE_BODY = frozenset(['head', 'body'])
+
+
+def streamable(orig):
+    """Whether the stream sanitizer gives the same output as the tree.
+
+    orig must not be nested deeper than libxml2 builds a tree for.
+    """
+    if _NOT_STREAMABLE.search(orig) is not None:
+        return False
+    for match in _ATTRIBUTES.finditer(orig):
+        names = [name.lower() for name in _ATTRIBUTE.findall(match.group(1))]
+        if names != sorted(set(names)):
+            return False
+    return True
+
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace(
+        '>', '&gt;').replace('\r', '&#13;')
+
+
+def escape_attribute(value):
+    return escape_text(value).replace('"', '&quot;').replace(
+        '\n', '&#10;').replace('\t', '&#9;')
+
+
+class _Open(object):
+    """An element which is open in the output."""
+
+    __slots__ = ('tag', 'written', 'renamed', 'closed')
+
+    def __init__(self, tag, written, renamed):
+        self.tag = tag
+        self.written = written
+        self.renamed = renamed
+        self.closed = False
+
+
+class StreamSanitizer(object):
+    """lxml parser target writing sanitized html to sink.
+
+    rules are the RewriteRules of the policy. Elements renamed to p are
+    closed before any of close_tags, like the parser does for a real p
+    element. With limits, LimitExceeded is raised as soon as the input
+    exceeds one of them or deadline has passed.
+    """
+
+    def __init__(self, sink, rules, close_tags=PARAGRAPH_CLOSING_TAGS,
+                 chunk_size=STREAM_CHUNK_SIZE, limits=None, deadline=None):
+        self.sink = sink
+        self.attributes = rules.filter_attributes
+        self.limits = limits
+        self.deadline = deadline
+        self.tags = dict(rules.tags, **_PAGE_RULES)
+        self.close_tags = close_tags
+        self.chunk_size = chunk_size
+        self._stack = []
+        self._depth = 0
+        self._before_body = True
+        self._skip = 0
+        self._pending = None
+        self._toplevel_text = []
+        self._buffer = []
+        self._buffered = 0
+        # open and started elements, including skipped ones
+        self._open = 0
+        self._elements = 0
+
+    def _write(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('ascii', 'xmlcharrefreplace')
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.sink.write(''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def _flush_pending(self):
+        if self._pending is not None:
+            self._write(self._pending + '>')
+            self._pending = None
+
+    def _flush_toplevel_text(self):
+        text = ''.join(self._toplevel_text)
+        self._toplevel_text = []
+        if text.strip():
+            self._write(escape_text(text))
+
+    def _close(self, entry):
+        self._depth -= 1
+        if self._pending is not None:
+            self._write(self._pending + '/>')
+            self._pending = None
+        else:
+            self._write('</%s>' % entry.tag)
+
+    def start(self, tag, attrib):
+        self._open += 1
+        self._elements += 1
+        if self.limits is not None:
+            self.limits.check_element(self._open, self._elements, attrib,
+                                      self.deadline)
+        if self._skip:
+            self._skip += 1
+            return
+        if (self._before_body and tag in _BEFORE_BODY and
+                not ''.join(self._toplevel_text).strip()):
+            # like the tree sanitizer, drop whitespace before the body
+            self._toplevel_text = []
+        if tag == 'body':
+            self._before_body = False
+        name, fate = self.tags.get(tag, NO_RULE)
+        if fate is KILL:
+            self._skip = 1
+            return
+        written = fate is not UNWRAP
+        renamed = name == 'p'
+        if name is not None:
+            tag = name
+        # the tree sanitizer unnests renamed elements after all renames,
+        # and after html and body elements are unwrapped
+        parent = None
+        for entry in reversed(self._stack):
+            if entry.tag not in _PAGE_TAGS:
+                parent = entry
+                break
+        if (parent is not None and parent.renamed and not parent.closed and
+                tag in self.close_tags):
+            self._close(parent)
+            parent.closed = True
+        if written and attrib:
+            attrib = self.attributes(tag, attrib)
+        self._stack.append(_Open(tag, written, renamed))
+        if not written:
+            return
+        self._depth += 1
+        self._flush_toplevel_text()
+        self._flush_pending()
+        parts = ['<', tag]
+        for name, value in sorted(attrib.items()):
+            parts.append(' %s="%s"' % (name, escape_attribute(value)))
+        self._pending = ''.join(parts)
+
+    def end(self, tag):
+        self._open -= 1
+        if self._skip:
+            self._skip -= 1
+            return
+        entry = self._stack.pop()
+        if entry.written and not entry.closed:
+            self._close(entry)
+
+    def data(self, data):
+        if self._skip or not data:
+            return
+        if not self._depth:
+            self._toplevel_text.append(data)
+            return
+        self._flush_pending()
+        self._write(escape_text(data))
+
+    def _markup(self, text):
+        if self._skip:
+            return
+        self._flush_toplevel_text()
+        self._flush_pending()
+        self._write(text)
+
+    def comment(self, text):
+        self._markup('<!--%s-->' % text)
+
+    def pi(self, target, data=None):
+        # libxml2 ends processing instructions at the first >, so a
+        # closing ? is part of data, and serializes them like this.
+        self._markup('<?%s %s?>' % (target, data or ''))
+
+    def close(self):
+        self._flush_toplevel_text()
+        self._flush_pending()
+        self.flush()
+
+
+def iter_chunks(source, chunk_size=STREAM_CHUNK_SIZE, encoding=None):
+    """Yield the content of the file-like source in chunks for a parser.
+
+    Byte strings are decoded in encoding, utf-8 by default, so characters
+    split over two reads are put together. libxml2 does not recognize end
+    tags of script and style which are split over two chunks, so an
+    incomplete tag in the last HELD_BACK characters of a chunk is held
+    back for the next one.
+    """
+    decoder = codecs.getincrementaldecoder(
+        encoding or DEFAULT_ENCODING)('replace')
+    rest = u''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, unicode):
+            chunk = decoder.decode(chunk)
+        chunk = rest + chunk
+        cut = chunk.rfind(u'<', max(len(chunk) - HELD_BACK, 0))
+        if cut != -1 and chunk.find(u'>', cut) == -1:
+            chunk, rest = chunk[:cut], chunk[cut:]
+        else:
+            rest = u''
+        if chunk:
+            yield chunk
+    rest += decoder.decode('', True)
+    if rest:
+        yield rest
+
+
+def sanitize_stream(source, sink, rules, chunk_size=STREAM_CHUNK_SIZE,
+                    encoding=None, limits=None, deadline=None):
+    """Read html from the file-like source and write it sanitized to sink.
+
+    rules are the RewriteRules of the policy. Byte strings are read in
+    encoding. The limits and the deadline, if given, are checked while it
+    is read.
+    """
+    from lxml import etree
+    target = StreamSanitizer(sink, rules, PARAGRAPH_CLOSING_TAGS, chunk_size,
+                             limits, deadline)
+    parser = etree.HTMLParser(target=target)
+    # the html tag creates a dummy parent, like for the tree sanitizer.
+    parser.feed(u'<html>')
+    for chunk in iter_chunks(source, chunk_size, encoding):
+        parser.feed(chunk)
+    parser.feed(u'</html>')
+    parser.close()
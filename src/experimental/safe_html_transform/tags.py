@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Tag tables of the safe_html transform.
+
+They are literals, built once when the module is imported and never
+changed afterwards. Configs get copies of the mutable ones.
+"""
+
+# add some tags to nasty.
+NASTY_TAGS = frozenset(['style', 'script', 'object', 'applet', 'meta', 'embed'])  # noqa
+
+# tag mapping: tag -> short or long tag
+# These are the HTML tags that we will leave intact
+VALID_TAGS = {'a': 1,
+ 'b': 1,
+ 'base': 0,
+ 'big': 1,
+ 'blockquote': 1,
+ 'body': 1,
+ 'br': 0,
+ 'caption': 1,
+ 'cite': 1,
+ 'code': 1,
+ 'dd': 1,
+ 'div': 1,
+ 'dl': 1,
+ 'dt': 1,
+ 'em': 1,
+ 'h1': 1,
+ 'h2': 1,
+ 'h3': 1,
+ 'h4': 1,
+ 'h5': 1,
+ 'h6': 1,
+ 'head': 1,
+ 'hr': 0,
+ 'html': 1,
+ 'i': 1,
+ 'img': 0,
+ 'kbd': 1,
+ 'li': 1,
+ 'meta': 0,
+ 'ol': 1,
+ 'p': 1,
+ 'pre': 1,
+ 'small': 1,
+ 'span': 1,
+ 'strong': 1,
+ 'sub': 1,
+ 'sup': 1,
+ 'table': 1,
+ 'tbody': 1,
+ 'td': 1,
+ 'th': 1,
+ 'title': 1,
+ 'tr': 1,
+ 'tt': 1,
+ 'u': 1,
+ 'ul': 1,
+ # added to the allowed types. These should be backported to CMFDefault.
+ 'ins': 1,
+ 'del': 1,
+ 'q': 1,
+ 'map': 1,
+ 'area': 0,
+ 'abbr': 1,
+ 'acronym': 1,
+ 'var': 1,
+ 'dfn': 1,
+ 'samp': 1,
+ 'address': 1,
+ 'bdo': 1,
+ 'thead': 1,
+ 'tfoot': 1,
+ 'col': 1,
+ 'colgroup': 1,
+ # HTML5 tags that should be allowed:
+ 'article': 1,
+ 'aside': 1,
+ 'audio': 1,
+ 'canvas': 1,
+ 'command': 1,
+ 'datalist': 1,
+ 'details': 1,
+ 'dialog': 1,
+ 'figure': 1,
+ 'footer': 1,
+ 'header': 1,
+ 'hgroup': 1,
+ 'keygen': 1,
+ 'mark': 1,
+ 'meter': 1,
+ 'nav': 1,
+ 'output': 1,
+ 'progress': 1,
+ 'rp': 1,
+ 'rt': 1,
+ 'ruby': 1,
+ 'section': 1,
+ 'source': 1,
+ 'time': 1,
+ 'video': 1
+}
+
+# tags renamed to p by default, see rename_tags of the transform.
+PARAGRAPH_TAGS = frozenset(['h3', 'h4', 'h5', 'h6', 'div'])
+
+# block tags which can not live inside a p. The HTML parser closes an open
+# p when it sees one of these, so renamed elements are split the same way.
+PARAGRAPH_CLOSING_TAGS = frozenset([
+    'address', 'blockquote', 'dir', 'div', 'dl', 'fieldset', 'form', 'h1',
+    'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'menu', 'ol', 'p', 'pre', 'table',
+    'ul'])
+
+# embedded content handled by the cleaner. applet is killed with its
+# content, the others are unwrapped.
+EMBEDDED_KILL_TAGS = frozenset(['applet'])
+EMBEDDED_REMOVE_TAGS = frozenset(['embed', 'layer', 'object', 'param'])
+
+# tags which belong to the page structure and never pass unchanged.
+PAGE_TAGS = frozenset(['html', 'head', 'body', 'title', 'base', 'meta'])
+
+# tags whose nesting in libxml2 is known, see CLOSING_START_TAGS.
+NESTING_TAGS = frozenset([
+    'a', 'abbr', 'acronym', 'address', 'area', 'article', 'aside', 'audio',
+    'b', 'bdo', 'big', 'blockquote', 'br', 'button', 'canvas', 'caption',
+    'center', 'cite', 'code', 'col', 'colgroup', 'command', 'datalist',
+    'dd', 'del', 'details', 'dfn', 'dialog', 'dir', 'div', 'dl', 'dt',
+    'em', 'embed', 'fieldset', 'figcaption', 'figure', 'font', 'footer',
+    'form', 'frame', 'frameset', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hgroup', 'hr', 'i', 'iframe', 'img', 'input', 'ins', 'kbd',
+    'keygen', 'label', 'legend', 'li', 'main', 'map', 'mark', 'menu',
+    'meter', 'nav', 'nobr', 'noframes', 'noscript', 'ol', 'optgroup',
+    'option', 'output', 'p', 'param', 'pre', 'progress', 'q', 'rp', 'rt',
+    'ruby', 's', 'samp', 'section', 'select', 'small', 'source', 'span',
+    'strike', 'strong', 'sub', 'summary', 'sup', 'table', 'tbody', 'td',
+    'textarea', 'tfoot', 'th', 'thead', 'time', 'tr', 'track', 'tt', 'u',
+    'ul', 'var', 'video', 'wbr'])
+
+# tags libxml2 parses without content, so they are never open.
+PARSER_VOID_TAGS = frozenset([
+    'area', 'br', 'col', 'frame', 'hr', 'img', 'input', 'param'])
+
+# start tags which make libxml2 close the open element -> the open
+# elements they close, measured on NESTING_TAGS with libxml2 2.10. Other
+# nesting of these tags is parsed as it is written.
+CLOSING_START_TAGS = {
+    'a': frozenset(['a']),
+    'address': frozenset(['p', 'ul']),
+    'blockquote': frozenset(['p']),
+    'caption': frozenset(['p']),
+    'center': frozenset(['b', 'font', 'i', 'p']),
+    'col': frozenset(['caption', 'p']),
+    'colgroup': frozenset(['caption', 'colgroup', 'p']),
+    'dd': frozenset(['address', 'dir', 'dt', 'menu', 'p', 'pre']),
+    'dir': frozenset(['p']),
+    'div': frozenset(['p']),
+    'dl': frozenset(['address', 'dir', 'dt', 'menu', 'p', 'pre']),
+    'dt': frozenset(['address', 'dd', 'dir', 'menu', 'p', 'pre']),
+    'fieldset': frozenset([
+        'a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'legend', 'p', 'pre']),
+    'form': frozenset([
+        'address', 'dir', 'dl', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+        'h6', 'menu', 'ol', 'p', 'pre', 'ul']),
+    'frameset': frozenset(['p']),
+    'h1': frozenset(['p']),
+    'h2': frozenset(['p']),
+    'h3': frozenset(['p']),
+    'h4': frozenset(['p']),
+    'h5': frozenset(['p']),
+    'h6': frozenset(['p']),
+    'hr': frozenset(['p']),
+    'li': frozenset([
+        'address', 'dl', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'p',
+        'pre']),
+    'menu': frozenset(['p', 'ul']),
+    'ol': frozenset(['p', 'ul']),
+    'optgroup': frozenset(['option']),
+    'option': frozenset(['option']),
+    'p': frozenset([
+        'b', 'big', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'i', 'p', 's',
+        'small', 'strike', 'tt', 'u']),
+    'pre': frozenset(['p', 'ul']),
+    'table': frozenset(['a', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'pre']),
+    'tbody': frozenset([
+        'caption', 'colgroup', 'p', 'tbody', 'td', 'tfoot', 'th',
+        'thead', 'tr']),
+    'td': frozenset(['a', 'b', 'font', 'i', 'p', 'span', 'td', 'th', 'u']),
+    'tfoot': frozenset([
+        'caption', 'colgroup', 'p', 'tbody', 'td', 'th', 'thead', 'tr']),
+    'th': frozenset(['a', 'b', 'font', 'i', 'p', 'span', 'td', 'th', 'u']),
+    'thead': frozenset(['caption', 'colgroup']),
+    'tr': frozenset(['caption', 'colgroup', 'p', 'td', 'th', 'tr']),
+    'ul': frozenset(['address', 'dir', 'menu', 'ol', 'p', 'pre']),
+}
+
+# fates of an element in the rewrite rules: dropped with its content or
+# replaced by it. NO_RULE is the new name and fate of a tag without rules.
+KILL = 'kill'
+UNWRAP = 'unwrap'
+NO_RULE = (None, None)
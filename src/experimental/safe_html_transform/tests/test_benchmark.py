@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest2 as unittest
+
+
+class BenchmarkUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_corpus(self):
+        from experimental.safe_html_transform.benchmark import build_corpus
+        corpus = dict(build_corpus(huge_size=1024))
+        self.assertIn('typical', corpus)
+        self.assertGreaterEqual(len(corpus['huge']), 1024)
+
+    def test_measure(self):
+        from experimental.safe_html_transform.benchmark import measure
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        result = measure(SafeHTML(), '<p>foo</p>', iterations=3)
+        self.assertEqual(result['iterations'], 3)
+        self.assertGreater(result['docs_per_sec'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_regressions(self):
+        from experimental.safe_html_transform.benchmark import regressions
+        baseline = {'a': {'p50_ms': 1.0}, 'b': {'p50_ms': 1.0}}
+        results = {'a': {'p50_ms': 1.1}, 'b': {'p50_ms': 1.5},
+                   'c': {'p50_ms': 9.0}}
+        self.assertEqual(regressions(baseline, results, 0.2), ['b'])
+
+    def test_save_and_compare(self):
+        from experimental.safe_html_transform.benchmark import main
+        baseline = os.path.join(self.directory, 'baseline.json')
+        options = ['--iterations', '1', '--min-time', '0',
+                   '--huge-size', '1024']
+        self.assertEqual(main(options + ['--save', baseline]), 0)
+        with open(baseline) as baseline_file:
+            results = json.load(baseline_file)
+        self.assertIn('nested', results)
+        # a baseline which is infinitely fast makes every document slower
+        for result in results.values():
+            result['p50_ms'] = 1e-9
+        with open(baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file)
+        self.assertEqual(
+            main(options + ['--compare', baseline, '--tolerance', '0']), 1)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import unittest2 as unittest
+from Products.PortalTransforms.data import datastream
+
+
+class LRUCacheUnitTest(unittest.TestCase):
+
+    def _makeOne(self, max_bytes):
+        from experimental.safe_html_transform.cache import LRUCache
+        return LRUCache(max_bytes)
+
+    def test_get_set(self):
+        cache = self._makeOne(100)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'value')
+        self.assertEqual(cache.get('a'), 'value')
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.size, 6)
+
+    def test_evict_least_recently_used(self):
+        cache = self._makeOne(12)
+        cache.set('a', 'xxxxx')
+        cache.set('b', 'xxxxx')
+        cache.get('a')
+        cache.set('c', 'xxxxx')
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size, 12)
+
+    def test_too_large_value_not_stored(self):
+        cache = self._makeOne(10)
+        cache.set('a', 'x' * 10)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.size, 0)
+
+    def test_resize(self):
+        cache = self._makeOne(100)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.resize(5)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('b', cache)
+
+    def test_cache_key_depends_on_fingerprint(self):
+        from experimental.safe_html_transform.cache import cache_key
+        self.assertEqual(cache_key('<p>x</p>', 'a'), cache_key('<p>x</p>', 'a'))
+        self.assertNotEqual(cache_key('<p>x</p>', 'a'),
+                            cache_key('<p>x</p>', 'b'))
+        self.assertEqual(cache_key(u'<p>\xe9</p>', 'a'),
+                         cache_key(u'<p>\xe9</p>'.encode('utf-8'), 'a'))
+
+
+class SafeHTMLCacheUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.cache = RESULT_CACHE
+        self.cache.clear()
+        self.transform = SafeHTML()
+
+    def test_result_is_cached(self):
+        html = "<p>cached</p><script>alert(1)</script>"
+        data = datastream(self.transform.name())
+        self.transform.convert(html, data)
+        self.assertEqual(len(self.cache), 1)
+        hits = self.cache.hits
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>cached</p>")
+        self.assertEqual(self.cache.hits, hits + 1)
+
+    def test_policy_change_misses_cache(self):
+        html = "<p>cached</p><script>alert(1)</script>"
+        self.transform.convert(html, datastream(self.transform.name()))
+        self.transform.config['nasty_tags'] = []
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>cached</p><script>alert(1)</script>")
+
+    def test_cache_disabled(self):
+        self.transform.config['cache_size'] = 0
+        self.transform.convert("<p>x</p>", datastream(self.transform.name()))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_cache_per_size(self):
+        from experimental.safe_html_transform.cache import DEFAULT_CACHE_SIZE
+        from experimental.safe_html_transform.cache import result_cache
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        # another site without a cache or with another size
+        SafeHTML(cache_size=0).compiled()
+        small = SafeHTML(cache_size=1024).compiled().cache
+        self.assertIs(small, result_cache(1024))
+        self.assertIs(self.transform.compiled().cache, self.cache)
+        self.assertEqual(self.cache.max_bytes, DEFAULT_CACHE_SIZE)
+        html = "<p>cached</p><script>alert(1)</script>"
+        self.transform.convert(html, datastream(self.transform.name()))
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(len(small), 0)
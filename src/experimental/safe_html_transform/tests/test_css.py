@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import unittest2 as unittest
+
+
+class StyleSanitizerUnitTest(unittest.TestCase):
+
+    def _sanitizer(self, whitelist=('text-align', 'float', 'font-family',
+                                    'background-image'), **kw):
+        from experimental.safe_html_transform.css import StyleSanitizer
+        return StyleSanitizer(whitelist, **kw)
+
+    def test_parse_style(self):
+        from experimental.safe_html_transform.css import parse_style
+        self.assertEqual(
+            parse_style('COLOR: red;; float:left /* x; y */; bad; '
+                        'font-family: "a;b", serif'),
+            [('color', 'red'), ('float', 'left'),
+             ('font-family', '"a;b", serif')])
+
+    def test_whitelist(self):
+        sanitize = self._sanitizer()
+        self.assertEqual(sanitize('color: red; text-align: center'),
+                         'text-align: center;')
+        self.assertEqual(sanitize('color: red'), '')
+
+    def test_unsafe_values(self):
+        sanitize = self._sanitizer()
+        for style in ['background-image: url(javascript:alert(1))',
+                      'float: expression(alert(1))',
+                      'float: \\65xpression(alert(1))',
+                      'font-family: vbscript:x']:
+            self.assertEqual(sanitize(style), '', style)
+        self.assertEqual(sanitize('background-image: url(logo.png)'),
+                         'background-image: url(logo.png);')
+
+    def test_memoized(self):
+        sanitize = self._sanitizer(cache_size=2)
+        sanitize('float: left')
+        self.assertIn('float: left', sanitize._cache)
+        sanitize('float: right')
+        sanitize('float: none')
+        self.assertEqual(sanitize._cache.keys(), ['float: none'])
+
+
+class ClassFilterUnitTest(unittest.TestCase):
+
+    def _filter(self, blacklist=('evil', 'bad')):
+        from experimental.safe_html_transform.css import ClassFilter
+        return ClassFilter(blacklist)
+
+    def test_filter(self):
+        classes = self._filter()
+        self.assertEqual(classes('good  evil other bad'), 'good other')
+        self.assertEqual(classes('evil bad'), '')
+        self.assertEqual(classes(' kept  as is '), ' kept  as is ')
+
+    def test_memoized(self):
+        classes = self._filter()
+        classes('a evil')
+        self.assertEqual(classes._cache, {'a evil': 'a'})
+
+
+class MemoizedSanitizerUnitTest(unittest.TestCase):
+
+    def test_abstract(self):
+        from experimental.safe_html_transform.css import MemoizedSanitizer
+        self.assertRaises(TypeError, MemoizedSanitizer)
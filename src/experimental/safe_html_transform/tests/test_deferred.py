@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest2 as unittest
+from Products.PortalTransforms.data import datastream
+
+
+class DeferredSanitizerUnitTest(unittest.TestCase):
+
+    def _makeOne(self, queue_size=4):
+        from experimental.safe_html_transform.cache import LRUCache
+        from experimental.safe_html_transform.deferred import \
+            DeferredSanitizer
+        return DeferredSanitizer(LRUCache(1024), queue_size, 1024)
+
+    def test_submit(self):
+        deferred = self._makeOne()
+        self.assertTrue(deferred.submit('key', str.upper, 'abc', '/doc'))
+        deferred.wait()
+        self.assertEqual(deferred.cache.get('key'), 'ABC')
+        self.assertEqual(deferred.last_version('/doc'), 'ABC')
+        stats = deferred.stats()
+        self.assertEqual(stats['submitted'], 1)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['pending'], 0)
+        self.assertGreater(stats['lag'], 0.0)
+
+    def test_full_queue(self):
+        deferred = self._makeOne(queue_size=1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking(orig):
+            started.set()
+            release.wait()
+            return orig
+
+        deferred.submit('running', blocking, 'a')
+        started.wait()
+        self.assertTrue(deferred.submit('queued', str.upper, 'b'))
+        # already queued
+        self.assertTrue(deferred.submit('queued', str.upper, 'b'))
+        self.assertFalse(deferred.submit('rejected', str.upper, 'c'))
+        stats = deferred.stats()
+        self.assertEqual(stats['queued'], 1)
+        self.assertEqual(stats['pending'], 2)
+        self.assertEqual(stats['submitted'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertGreater(stats['oldest'], 0.0)
+        release.set()
+        deferred.wait()
+        self.assertEqual(deferred.cache.get('queued'), 'B')
+        self.assertIsNone(deferred.cache.get('rejected'))
+
+    def test_failed(self):
+        deferred = self._makeOne()
+
+        def failing(orig):
+            raise ValueError(orig)
+
+        deferred.submit('key', failing, 'a')
+        deferred.wait()
+        self.assertIsNone(deferred.cache.get('key'))
+        self.assertEqual(deferred.stats()['failed'], 1)
+        # the next conversion still runs
+        deferred.submit('key', str.upper, 'a')
+        deferred.wait()
+        self.assertEqual(deferred.cache.get('key'), 'A')
+
+    def test_document_id(self):
+        from experimental.safe_html_transform.deferred import document_id
+
+        class Value(object):
+            raw_encoded = '<p>x</p>'
+
+        class Document(object):
+            def getPhysicalPath(self):
+                return ('', 'plone', 'front-page')
+
+        document = Document()
+        document.text = Value()
+        self.assertEqual(document_id(document, '<p>x</p>'),
+                         ('/plone/front-page', 'text'))
+        # orig is not the value of any field
+        self.assertIsNone(document_id(document, '<p>y</p>'))
+        self.assertIsNone(document_id(None, '<p>x</p>'))
+
+
+class DeferredTransformUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        from experimental.safe_html_transform.deferred import DEFERRED
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        RESULT_CACHE.clear()
+        DEFERRED.last_versions.clear()
+        self.deferred = DEFERRED
+        self.transform = SafeHTML(defer_size=10)
+
+    def tearDown(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        self.deferred.wait()
+        RESULT_CACHE.clear()
+
+    def convert(self, orig, context=None):
+        data = datastream('deferred')
+        self.transform.convert(orig, data, context=context)
+        return data
+
+    def test_escaped_until_ready(self):
+        orig = '<p onclick="evil()">text</p><script>x</script>'
+        data = self.convert(orig)
+        self.assertEqual(
+            data.getData(),
+            '<p>&lt;p onclick="evil()"&gt;text&lt;/p&gt;&lt;script&gt;x'
+            '&lt;/script&gt;</p>')
+        self.assertFalse(data.isCacheable())
+        self.deferred.wait()
+        data = self.convert(orig)
+        self.assertEqual(data.getData(), '<p>text</p>')
+        self.assertTrue(data.isCacheable())
+
+    def document(self, **fields):
+        class Value(object):
+            def __init__(self, raw_encoded):
+                self.raw_encoded = raw_encoded
+
+        class Document(object):
+            def getPhysicalPath(self):
+                return ('', 'plone', 'page')
+
+        document = Document()
+        for name, raw in fields.items():
+            setattr(document, name, Value(raw))
+        return document
+
+    def test_last_version(self):
+        first = '<p>first version</p><em>a</em>'
+        second = '<p>second version</p><em>b</em>'
+        self.convert(first, self.document(text=first))
+        self.deferred.wait()
+        document = self.document(text=second)
+        data = self.convert(second, document)
+        self.assertEqual(data.getData(), first)
+        self.assertFalse(data.isCacheable())
+        self.deferred.wait()
+        data = self.convert(second, document)
+        self.assertEqual(data.getData(), second)
+
+    def test_last_version_of_field(self):
+        text = '<p>the text</p><em>a</em>'
+        self.convert(text, self.document(text=text))
+        self.deferred.wait()
+        # another field of the same document gets its input escaped
+        summary = '<p>the summary</p><em>b</em>'
+        data = self.convert(summary, self.document(text=text,
+                                                   summary=summary))
+        self.assertEqual(
+            data.getData(),
+            '<p>&lt;p&gt;the summary&lt;/p&gt;&lt;em&gt;b&lt;/em&gt;</p>')
+
+    def test_last_version_of_policy(self):
+        first = '<p>first version</p><em>a</em>'
+        self.convert(first, self.document(text=first))
+        self.deferred.wait()
+        valid_tags = dict(self.transform.config['valid_tags'])
+        del valid_tags['em']
+        self.transform.config = dict(self.transform.config,
+                                     valid_tags=valid_tags)
+        second = '<p>second version</p><em>b</em>'
+        data = self.convert(second, self.document(text=second))
+        self.assertEqual(
+            data.getData(),
+            '<p>&lt;p&gt;second version&lt;/p&gt;&lt;em&gt;b&lt;/em&gt;</p>')
+
+    def test_small_documents_not_deferred(self):
+        data = self.convert('<b>x</b>')
+        self.assertEqual(data.getData(), '<b>x</b>')
+        self.assertTrue(data.isCacheable())
+
+    def test_plain_text_not_deferred(self):
+        data = self.convert('only some plain text')
+        self.assertEqual(data.getData(), '<p>only some plain text</p>')
+        self.assertTrue(data.isCacheable())
+
+    def test_without_cache(self):
+        self.transform.config['cache_size'] = 0
+        data = self.convert('<p onclick="evil()">text</p>')
+        self.assertEqual(data.getData(), '<p>text</p>')
+        self.assertTrue(data.isCacheable())
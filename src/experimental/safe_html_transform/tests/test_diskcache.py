@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import unittest2 as unittest
+
+
+class DiskCacheUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'safe_html.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _makeOne(self, max_bytes=1024):
+        from experimental.safe_html_transform.diskcache import DiskCache
+        return DiskCache(self.path, max_bytes)
+
+    def test_get_set(self):
+        cache = self._makeOne()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', '<p>value</p>')
+        cache.set('b', u'<p>\xfcnicode</p>')
+        self.assertEqual(cache.get('a'), '<p>value</p>')
+        self.assertIsInstance(cache.get('a'), str)
+        self.assertEqual(cache.get('b'), u'<p>\xfcnicode</p>')
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['errors'], 0)
+
+    def test_shared_by_processes(self):
+        self._makeOne().set('a', 'value')
+        # a new instance stands in for another process
+        self.assertEqual(self._makeOne().get('a'), 'value')
+
+    def test_connection_per_thread(self):
+        cache = self._makeOne()
+        cache.set('a', 'value')
+        values = []
+        thread = threading.Thread(target=lambda: values.append(cache.get('a')))
+        thread.start()
+        thread.join()
+        self.assertEqual(values, ['value'])
+
+    def test_evict_least_recently_used(self):
+        cache = self._makeOne(max_bytes=64)
+        for key in 'abcd':
+            cache.set(key, 'x' * 15)
+        cache.get('a')
+        cache.set('e', 'x' * 15)
+        self.assertEqual(cache.get('a'), 'x' * 15)
+        self.assertIsNone(cache.get('b'))
+        self.assertLessEqual(cache.stats()['bytes'], 64)
+        self.assertGreater(cache.evictions, 0)
+
+    def test_too_large_value_not_stored(self):
+        cache = self._makeOne(max_bytes=10)
+        cache.set('a', 'x' * 10)
+        self.assertIsNone(cache.get('a'))
+
+    def test_other_format_emptied(self):
+        from experimental.safe_html_transform import diskcache
+        self._makeOne().set('a', 'value')
+        original = diskcache.FORMAT
+        diskcache.FORMAT = 'other'
+        try:
+            self.assertIsNone(self._makeOne().get('a'))
+        finally:
+            diskcache.FORMAT = original
+
+    def test_disabled(self):
+        from experimental.safe_html_transform.diskcache import DiskCache
+        cache = DiskCache()
+        cache.set('a', 'value')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_unusable_path(self):
+        cache = self._makeOne()
+        cache.configure(os.path.join(self.directory, 'missing', 'x.db'))
+        cache.set('a', 'value')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.errors, 1)
+
+
+class DiskCacheTransformUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'safe_html.db')
+        RESULT_CACHE.clear()
+
+    def tearDown(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        RESULT_CACHE.clear()
+        shutil.rmtree(self.directory)
+
+    def _transform(self, **config):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        config.setdefault('disk_cache_path', self.path)
+        return SafeHTML(**config)
+
+    def test_warm_start(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        from experimental.safe_html_transform.diskcache import disk_cache
+        orig = '<p onclick="evil()">text</p>'
+        self.assertEqual(self._transform().convert_text(orig), '<p>text</p>')
+        # a restarted client has an empty result cache
+        RESULT_CACHE.clear()
+        transform = self._transform()
+        transform.sanitize = None
+        self.assertEqual(transform.convert_text(orig), '<p>text</p>')
+        self.assertEqual(disk_cache(self.path).hits, 1)
+        self.assertEqual(len(RESULT_CACHE), 1)
+
+    def test_without_result_cache(self):
+        orig = '<p onclick="evil()">text</p>'
+        self._transform(cache_size=0).convert_text(orig)
+        transform = self._transform(cache_size=0)
+        transform.sanitize = None
+        self.assertEqual(transform.convert_text(orig), '<p>text</p>')
+
+    def test_safe_markup_not_stored(self):
+        from experimental.safe_html_transform.diskcache import disk_cache
+        self._transform().convert_text('<p>already safe</p>')
+        self.assertEqual(disk_cache(self.path).stats()['entries'], 0)
+
+    def test_shared_per_path(self):
+        from experimental.safe_html_transform.diskcache import disk_cache
+        one = self._transform(disk_cache_size=1024).compiled().disk_cache
+        two = self._transform(disk_cache_size=2048).compiled().disk_cache
+        self.assertIs(one, two)
+        self.assertEqual(one.max_bytes, 2048)
+        self.assertIs(one, disk_cache(self.path, 1024))
+        # a config without a disk cache leaves the others alone
+        self.assertIsNone(
+            self._transform(disk_cache_path='').compiled().disk_cache)
+        self.assertEqual(disk_cache(self.path).path, self.path)
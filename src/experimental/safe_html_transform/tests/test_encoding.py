@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from Products.PortalTransforms.data import datastream
+
+import unittest2 as unittest
+
+
+class EncodingUnitTest(unittest.TestCase):
+
+    def test_input_encoding(self):
+        from experimental.safe_html_transform.encoding import input_encoding
+        self.assertIsNone(input_encoding(u'text', 'latin-1'))
+        self.assertEqual(input_encoding('text'), 'utf-8')
+        self.assertEqual(input_encoding('text', 'Latin-1'), 'iso8859-1')
+        self.assertEqual(input_encoding('text', 'unknown'), 'utf-8')
+
+    def test_libxml2_names(self):
+        from experimental.safe_html_transform.encoding import input_encoding
+        from experimental.safe_html_transform.encoding import native_input
+        self.assertEqual(input_encoding('text', 'euc_jp'), 'euc-jp')
+        orig = '\xe4'
+        self.assertIs(native_input(orig, 'euc_jp')[0], orig)
+        # libxml2 does not read mac-roman, it is decoded in python
+        self.assertEqual(native_input(orig, 'mac-roman'), (u'\u2030', None))
+
+    def test_decode(self):
+        from experimental.safe_html_transform.encoding import decode
+        text = u'caf\xe9'
+        self.assertIs(decode(text, 'utf-8'), text)
+        self.assertEqual(decode('caf\xc3\xa9', None), text)
+        self.assertEqual(decode('caf\xe9', 'iso8859-1'), text)
+        self.assertEqual(decode('caf\xe9', 'utf-8'), u'caf\ufffd')
+
+
+class EncodingTransformUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(cache_size=0)
+
+    def convert(self, orig, **kwargs):
+        data = datastream('encoding')
+        self.transform.convert(orig, data, **kwargs)
+        return data.getData()
+
+    def test_utf8_bytes(self):
+        orig = '<div>\xc3\xa4</div><script>x</script>'
+        self.assertEqual(self.transform.convert_text(orig), '<p>&#228;</p>')
+        self.assertEqual(self.transform.convert_text(orig.decode('utf-8')),
+                         '<p>&#228;</p>')
+
+    def test_plain_text(self):
+        self.assertEqual(self.transform.convert_text('\xc3\xa4'),
+                         '<p>&#228;</p>')
+
+    def test_declared_encoding(self):
+        orig = '<div>\xe4</div>'
+        self.assertEqual(self.convert(orig, encoding='latin-1'),
+                         '<p>&#228;</p>')
+        self.assertEqual(self.transform.convert_text('\xe4', encoding='cp1252'),
+                         '<p>&#228;</p>')
+
+    def test_invalid_input_replaced(self):
+        # libxml2 alone would drop everything after the invalid byte
+        self.assertEqual(
+            self.transform.convert_text('<div>a\xe9b <em>c</em></div>'),
+            '<p>a&#65533;b <em>c</em></p>')
+
+    def test_invalid_input_checked(self):
+        self.transform.config['max_depth'] = 100
+        orig = '<div>a\xe9b</div>' + '<br>' * 1000
+        self.assertTrue(
+            self.transform.convert_text(orig).startswith('<p>a&#65533;b'))
+
+    def test_cache_key_includes_encoding(self):
+        from experimental.safe_html_transform.cache import cache_key
+        self.assertNotEqual(cache_key('\xe4', 'a', 'utf-8'),
+                            cache_key('\xe4', 'a', 'iso8859-1'))
+
+    def test_pass_through_not_copied(self):
+        orig = '<p>already <strong>safe</strong></p>'
+        self.assertIs(self.transform.convert_text(orig), orig)
+        self.transform.config['disable_transform'] = 1
+        orig = '<p onclick="evil()">text</p>'
+        self.assertIs(self.convert(orig), orig)
+
+    def test_decoded_encoding(self):
+        self.assertEqual(
+            self.transform.convert_text('<div>\x8a</div>', encoding='mac-roman'),
+            '<p>&#228;</p>')
+
+    def test_stream(self):
+        from StringIO import StringIO
+        sink = StringIO()
+        self.transform.convert_stream(StringIO('<div>\xe4</div>'), sink,
+                                      encoding='latin-1')
+        self.assertEqual(sink.getvalue(), '<p>&#228;</p>')
+        sink = StringIO()
+        self.transform.convert_stream(StringIO('<div>\x8a</div>'), sink,
+                                      encoding='mac-roman')
+        self.assertEqual(sink.getvalue(), '<p>&#228;</p>')
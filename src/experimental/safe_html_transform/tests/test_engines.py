@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+from experimental.safe_html_transform.testing import \
+    EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+
+import unittest2 as unittest
+
+
+class EngineChoiceUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.engines import EngineChoice
+        from experimental.safe_html_transform.engines import Thresholds
+        self.choose = EngineChoice(Thresholds(256, 1000, 5000, 100),
+                                   frozenset(['script', 'style']))
+
+    def test_size(self):
+        self.assertEqual(self.choose('<p>x</p>', 2), 'snippet')
+        self.assertEqual(self.choose('x' * 2000, 0), 'incremental')
+        self.assertEqual(self.choose('x' * 2000, 0, cache=False), 'tree')
+        self.assertEqual(self.choose('x' * 6000, 0, cache=False), 'stream')
+
+    def test_checks(self):
+        # only the tree and the stream sanitizer check the limits
+        self.assertEqual(self.choose('<p>x</p>', 2, checks=True), 'tree')
+        self.assertEqual(self.choose('x' * 6000, 0, checks=True), 'stream')
+
+    def test_density(self):
+        self.assertEqual(self.choose.whole('x' * 10240, 1000), 'stream')
+        self.assertEqual(self.choose.whole('x' * 10240, 1001), 'tree')
+
+    def test_not_streamable(self):
+        orig = '<input disabled>' + 'x' * 6000
+        self.assertEqual(self.choose(orig, 1, cache=False), 'tree')
+
+    def test_disabled(self):
+        from experimental.safe_html_transform.engines import EngineChoice
+        from experimental.safe_html_transform.engines import Thresholds
+        choose = EngineChoice(Thresholds(0, 0, 0, 100), frozenset())
+        self.assertEqual(choose('<p>x</p>', 2), 'tree')
+        self.assertEqual(choose('x' * 6000, 0), 'tree')
+
+    def test_nasty(self):
+        self.assertTrue(self.choose.nasty('<p>x</p><SCRIPT>y</SCRIPT>'))
+        self.assertTrue(self.choose.nasty('<style/>'))
+        self.assertFalse(self.choose.nasty('<p>scripts</p><scripted>'))
+
+
+class EngineTransformUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.stats import STATS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(cache_size=0, collect_stats=1,
+                                  snippet_size=256, stream_size=1000,
+                                  stream_density=150)
+        STATS.reset()
+        self.stats = STATS
+
+    def tearDown(self):
+        self.stats.configure(False)
+        self.stats.reset()
+
+    def test_stream(self):
+        orig = ('<h3>Title</h3><div>text <font>x</font>'
+                '<script>y</script></div>\n') * 50
+        self.assertEqual(self.transform.convert_text(orig),
+                         self.transform.sanitize(orig))
+        snapshot = self.stats.snapshot()
+        self.assertEqual(snapshot['engines'], {'stream': 1})
+        self.assertEqual(snapshot['counters']['streamed'], 1)
+        self.assertEqual(snapshot['counters']['scanner_skipped'], 1)
+        self.assertGreater(snapshot['timings']['stream'], 0)
+
+    def test_dense_input(self):
+        orig = '<b>x</b><i>y</i><br onclick="z()">' * 100
+        self.assertEqual(self.transform.convert_text(orig),
+                         '<b>x</b><i>y</i><br/>' * 100)
+        snapshot = self.stats.snapshot()
+        self.assertEqual(snapshot['engines'], {'tree': 1})
+        self.assertEqual(snapshot['counters']['sanitized'], 1)
+
+    def test_snippet_fallback(self):
+        self.transform.convert_text('<b><i>x</b>y</i>')
+        snapshot = self.stats.snapshot()
+        self.assertEqual(snapshot['engines'], {'snippet': 1})
+        self.assertEqual(snapshot['counters']['sanitized'], 1)
+
+    def test_stream_limits(self):
+        self.transform.config['max_elements'] = 10
+        orig = '<p>more text <font>x</font></p>\n' * 100
+        self.assertEqual(self.transform.convert_text(orig)[:12],
+                         '<p>&lt;p&gt;')
+        snapshot = self.stats.snapshot()
+        self.assertEqual(snapshot['engines'], {'stream': 1})
+        self.assertEqual(snapshot['limits'], {'max_elements': 1})
+
+    def test_invalid_input(self):
+        # the invalid byte is replaced, like by the tree sanitizer
+        orig = '<div>a\xe9b <script>c</script></div>\n' * 50
+        self.assertEqual(self.transform.convert_text(orig),
+                         '<p>a&#65533;b </p>' * 50)
+        self.assertEqual(self.stats.snapshot()['engines'], {'stream': 1})
+
+    def test_differential(self):
+        # every engine chosen at its threshold gives the tree's output
+        import random
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        from experimental.safe_html_transform.tests.test_snippet import \
+            generate
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        engines = {
+            'snippet': SafeHTML(cache_size=0, snippet_size=10 ** 6),
+            'incremental': SafeHTML(incremental_size=1),
+            'stream': SafeHTML(cache_size=0, stream_size=1,
+                               stream_density=10 ** 6),
+            'default': SafeHTML(cache_size=0),
+        }
+        rng = random.Random(24)
+        for i in range(500):
+            orig = '\n'.join([generate(rng)] * rng.randint(1, 4))
+            expected = orig and self.transform.sanitize(orig)
+            for name, transform in sorted(engines.items()):
+                RESULT_CACHE.clear()
+                self.assertEqual(transform.convert_text(orig), expected,
+                                 (name, orig))
+        RESULT_CACHE.clear()
+
+
+class CalibrationUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(cache_size=0)
+
+    def test_calibrate(self):
+        from experimental.safe_html_transform.calibrate import calibrate
+        from experimental.safe_html_transform.calibrate import SNIPPET_SIZES
+        thresholds = calibrate(self.transform, max_size=0, repeat=1)
+        self.assertIn(thresholds['snippet_size'], (0,) + SNIPPET_SIZES)
+        # no document was large enough for the stream sanitizer
+        self.assertEqual(thresholds['stream_size'], 0)
+        self.assertNotIn('stream_density', thresholds)
+
+    def test_best_time_loops_short_calls(self):
+        from experimental.safe_html_transform.calibrate import best_time
+        from experimental.safe_html_transform.calibrate import \
+            MIN_SAMPLE_TIME
+        calls = []
+        seconds = best_time(calls.append, 'x', repeat=2)
+        self.assertGreater(len(calls), 2)
+        self.assertLess(seconds * len(calls), MIN_SAMPLE_TIME * 20)
+
+    def test_limits_disabled(self):
+        from experimental.safe_html_transform.calibrate import Calibration
+        self.transform.config['max_elements'] = 1
+        calibration = Calibration(self.transform, repeat=1)
+        orig = '<p>a</p><p>b</p>'
+        self.assertEqual(calibration.stream(orig), orig)
+        self.assertEqual(calibration.tree(orig), orig)
+
+
+class CalibrationIntegrationTest(unittest.TestCase):
+
+    layer = EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+
+    def test_store_thresholds(self):
+        from experimental.safe_html_transform.calibrate import \
+            store_thresholds
+        from experimental.safe_html_transform.resanitize import get_transform
+        portal = self.layer['portal']
+        store_thresholds(portal, {'snippet_size': 128,
+                                  'stream_size': 4096})
+        config = get_transform(portal).config
+        self.assertEqual(config['snippet_size'], 128)
+        self.assertEqual(config['stream_size'], 4096)
@@ -41,10 +41,19 @@ class safe_htmlUnitTest(unittest.TestCase):
                          "<span>spans are good!</span>")
 
     def test_keep_span_style_attribue(self):
-        html = '<span style="color: red;">spans are good!</span>'
+        html = '<span style="text-align: center;">spans are good!</span>'
         data = datastream(self.transform.name())
         self.assertEqual(self.transform.convert(html, data)._data,
-                         '<span style="color: red;">spans are good!</span>')
+                         '<span style="text-align: center;">spans are good!'
+                         '</span>')
+
+    def test_strip_styles_not_in_whitelist(self):
+        html = ('<span style="color: red; TEXT-ALIGN:center">a</span>'
+                '<span style="color: red">b</span>')
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<span style="text-align: center;">a</span>'
+                         '<span>b</span>')
 
     def test_keep_italic(self):
         html = "<i>italic is nice!</i>"
@@ -144,6 +153,51 @@ class safe_htmlUnitTest(unittest.TestCase):
                          '<img src="logo.png" align="center"/>'
                          )
 
+    def test_strip_attributes(self):
+        html = '<p lang="de" bgcolor="red" title="t">foo</p>'
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<p title="t">foo</p>')
+
+    def test_strip_combinations(self):
+        html = ('<table width="100%"><tr><td width="50" height="5">x</td>'
+                '</tr></table><img src="logo.png" width="100"/>')
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<table><tr><td>x</td></tr></table>'
+                         '<img src="logo.png" width="100"/>')
+
+    def test_strip_blacklisted_classes(self):
+        self.transform.config['class_blacklist'] = ['evil']
+        html = '<p class="good evil">foo</p><p class="evil">bar</p>'
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<p class="good">foo</p><p>bar</p>')
+
+    def test_remove_javascript(self):
+        html = ('<p onclick="alert(1)" title="t"><a href="javascript:x()">'
+                'a</a><a href="http://plone.org" onMouseOver="x()">b</a>'
+                '<img src="data:image/png;base64,AAAA"/></p>')
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<p title="t"><a>a</a><a href="http://plone.org">'
+                         'b</a><img/></p>')
+
+    def test_remove_javascript_urls(self):
+        html = ('<form><button formaction="javascript:x()">a</button></form>'
+                '<p><img srcset="a.png 1x, javascript:x() 2x"/>'
+                '<img srcset="a.png 1x, b.png 2x"/></p>')
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<form><button>a</button></form><p><img/>'
+                         '<img srcset="a.png 1x, b.png 2x"/></p>')
+
+    def test_keep_javascript(self):
+        self.transform.config['remove_javascript'] = 0
+        html = '<p onclick="alert(1)">x</p>'
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data, html)
+
     # Ignores
     def test_ignore_headlines_other_than_h1_or_h2(self):
         html = '<h3>foo</h3><h4>bar</h4><h5>baz</h5><h6>boz</h6><p>Keep me</p>'
@@ -203,3 +257,86 @@ class safe_htmlUnitTest(unittest.TestCase):
         html = "<p>Keep me"
         data = datastream(self.transform.name())
         self.assertEqual(self.transform.convert(html, data)._data, "<p>Keep me</p>")
+
+    def test_content_after_body(self):
+        for html, expected in [('<p>a</p></body><p>b</p>', '<p>a</p><p>b</p>'),
+                               ('<p>a</p></html><p>b</p>', '<p>a</p><p>b</p>'),
+                               ('<body></body>x', '<p>x</p>'),
+                               ('<body></body><', '&lt;'),
+                               ('</b><<li>', '&lt;<li/>'),
+                               ('\n<body>\n<b>x</b>', '<b>x</b>'),
+                               ('<head><title>t</title></head><p>x</p>',
+                                '<p>x</p>')]:
+            self.assertEqual(self.transform.sanitize(html), expected, html)
+
+    def test_text_after_element(self):
+        html = "<b>bold</b> and more"
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<b>bold</b> and more")
+
+    def test_nested_paragraphs_keep_trailing_text(self):
+        html = "<div>foo<p>Keep me</p>bar</div>"
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>foo</p><p>Keep me</p>bar")
+
+    # Nasty tags
+    def test_remove_script_after_content(self):
+        html = "<p>foo</p><script>alert(1)</script>"
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>foo</p>")
+
+    def test_remove_nested_style(self):
+        html = "<p>foo<style>p {color: red}</style></p>"
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>foo</p>")
+
+
+class safe_htmlConvertManyUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML()
+        self.items = ["<p>%d</p><script>alert(%d)</script>" % (i, i)
+                      for i in range(50)]
+        self.expected = ["<p>%d</p>" % i for i in range(50)]
+
+    def test_convert_many(self):
+        self.assertEqual(list(self.transform.convert_many(self.items)),
+                         self.expected)
+
+    def test_convert_many_thread_pool(self):
+        results = self.transform.convert_many(iter(self.items), pool='thread',
+                                              workers=4, chunksize=3)
+        self.assertEqual(list(results), self.expected)
+
+    def test_convert_many_process_pool(self):
+        results = self.transform.convert_many(self.items, pool='process',
+                                              workers=2, chunksize=10)
+        self.assertEqual(list(results), self.expected)
+
+    def test_convert_many_shared_process_pool(self):
+        pool = self.transform.process_pool(2)
+        try:
+            for encoding, orig in (('utf-8', '<p>\xc3\xa9</p><b>'),
+                                   ('latin-1', '<p>\xe9</p><b>')):
+                results = self.transform.convert_many(
+                    self.items + [orig], pool=pool, encoding=encoding)
+                self.assertEqual(list(results),
+                                 self.expected + ['<p>&#233;</p><b/>'])
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def test_convert_many_unknown_pool(self):
+        with self.assertRaises(ValueError):
+            list(self.transform.convert_many(self.items, pool='cluster'))
+
+    def test_convert_many_disabled(self):
+        self.transform.config['disable_transform'] = 1
+        self.assertEqual(list(self.transform.convert_many(self.items)),
+                         self.items)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest2 as unittest
+
+
+class PlainTextUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML()
+
+    def _plain_text(self, orig):
+        from experimental.safe_html_transform.fastpath import plain_text
+        return plain_text(orig)
+
+    def test_matches_sanitizer(self):
+        for orig in ["hello", "  hello  ", "a\nb\r\nc", "x > y", "   \n",
+                     "caf\xc3\xa9", u"caf\xe9 €", "tab\there", u"\xa0",
+                     " \xc2\xa0 "]:
+            self.assertEqual(self._plain_text(orig),
+                             self.transform.sanitize(orig), repr(orig))
+
+    def test_markup_needs_parser(self):
+        for orig in ["<p>x</p>", "a &amp; b", "a\x01b", u"a\ud800b"]:
+            self.assertIsNone(self._plain_text(orig), repr(orig))
+
+
+class SafeMarkupScannerUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML()
+        self.scanner = self.transform.compiled().scanner
+
+    def test_safe_markup(self):
+        for html in ['<p>foo</p><p>bar &amp; baz</p>',
+                     '<p>a<br/>b<br/>c</p>',
+                     '<a href="http://plone.org" title="Plone">x</a>',
+                     '<a href="/relative/link#anchor">x</a>',
+                     '<img src="logo.png" alt="logo"/>',
+                     '<img srcset="a.png 1x, b.png 2x"/>',
+                     '<ul class="navigation"><li>a</li><li>b</li></ul>']:
+            self.assertEqual(self.scanner(html), html)
+
+    def test_canonical_form(self):
+        for html, expected in [
+                ('\n<p>foo</p>\n<p>bar</p>\n', '<p>foo</p><p>bar</p>'),
+                ('<b>x</b> and more', '<b>x</b> and more'),
+                ('<p>caf\xc3\xa9 &#8364;</p>', '<p>caf&#233; &#8364;</p>'),
+                (u'<p>caf\xe9</p>', '<p>caf&#233;</p>'),
+                ('<p title="a&#10;b">x</p>', '<p title="a&#10;b">x</p>')]:
+            self.assertEqual(self.scanner(html), expected, html)
+            self.assertEqual(self.transform.sanitize(html), expected, html)
+
+    def test_not_canonical(self):
+        # the tree sanitizer writes these differently
+        for html in ['<p><p>x</p></p>',
+                     '<p>a > b</p>',
+                     '<small></small>',
+                     '<p>a<br>b</p>',
+                     '<P>x</P>',
+                     '<p title="x" >y</p>',
+                     '<p title="a\nb">x</p>',
+                     '<p>&#65;&nbsp;&#xe9;</p>',
+                     '<p>a\rb</p>',
+                     '<p lang="de" lang="en">x</p>',
+                     '<b>x<p>y</p></b>',
+                     '<table><tr><td>x<td>y</td></tr></table>',
+                     'leading text<b>x</b>',
+                     '<b>x</b>&#160;<b>y</b>',
+                     '<p>\xff</p>']:
+            self.assertIsNone(self.scanner(html, 'utf-8'), html)
+
+    def test_matches_tree_sanitizer(self):
+        # the differential test: whatever the scanner accepts comes out
+        # as from the tree sanitizer
+        from experimental.safe_html_transform.tests.test_snippet import \
+            generate
+        rng = random.Random(11)
+        accepted = 0
+        for i in range(3000):
+            orig = generate(rng)
+            safe_html = self.scanner(orig, 'utf-8')
+            if safe_html is not None:
+                accepted += 1
+                self.assertEqual(safe_html, self.transform.sanitize(orig),
+                                 repr(orig))
+        self.assertGreater(accepted, 200)
+
+    def test_unsafe_markup(self):
+        for html in ['<p>foo',
+                     '<p>foo</b>',
+                     '<script>alert(1)</script>',
+                     '<iframe src="x"></iframe>',
+                     '<div>renamed</div>',
+                     '<p onclick="alert(1)">x</p>',
+                     '<a href="javascript:alert(1)">x</a>',
+                     '<a href="&#106;avascript:alert(1)">x</a>',
+                     '<a href="java\tscript:alert(1)">x</a>',
+                     '<a href="java\nscript:alert(1)">x</a>',
+                     '<a href="javascript&colon;alert(1)">x</a>',
+                     '<a href="java&Tab;script:alert(1)">x</a>',
+                     '<a href=" vbscript:x">x</a>',
+                     '<button formaction="javascript:x()">x</button>',
+                     '<img srcset="a.png 1x, javascript:x() 2x"/>',
+                     '<img srcset="a.png 1x, b&#46;png 2x"/>',
+                     '<p style="color: red">x</p>',
+                     '<table border="1"><tr><td>x</td></tr></table>',
+                     '<p>a &b</p>',
+                     '<p>a<!-- comment --></p>',
+                     "<p title='single quoted'>x</p>",
+                     '<br></br>']:
+            self.assertFalse(self.scanner(html), html)
+
+    def test_hidden_javascript_removed(self):
+        for html in ['<a href="java\tscript:alert(1)">x</a>',
+                     '<a href="java\nscript:alert(1)">x</a>',
+                     '<a href="javascript&colon;alert(1)">x</a>',
+                     '<a href="java&Tab;script:alert(1)">x</a>']:
+            self.assertEqual(self.transform.convert_text(html), '<a>x</a>',
+                             html)
+
+    def test_safe_markup_passes_unchanged(self):
+        from Products.PortalTransforms.data import datastream
+        html = '<p class="a">foo<br/>bar</p>'
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data, html)
+
+
+class SplitBlocksUnitTest(unittest.TestCase):
+
+    def _split(self, orig):
+        from experimental.safe_html_transform.fastpath import split_blocks
+        from experimental.safe_html_transform.transforms.safe_html import \
+            PARAGRAPH_CLOSING_TAGS
+        return split_blocks(orig, PARAGRAPH_CLOSING_TAGS)
+
+    def test_blocks(self):
+        self.assertEqual(
+            self._split(' <p>a<br>b</p>\n<div>c<p>d</p></div><hr>\n'),
+            ['<p>a<br>b</p>\n', '<div>c<p>d</p></div>', '<hr>\n'])
+
+    def test_not_splittable(self):
+        for orig in ['text<p>a</p>',
+                     '<p>a</p>text',
+                     '<b>inline</b><p>a</p>',
+                     '<p>a<p>b',
+                     '<p>a</b></p>',
+                     '<div/><p>a</p>',
+                     '<p>a</p><!-- comment -->',
+                     "<p title='x'>a</p>"]:
+            self.assertIsNone(self._split(orig), orig)
+
+    def test_blocks_match_whole_document(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        transform = SafeHTML()
+        orig = ('<h3>h</h3>\n<div>a<h4>b</h4>c</div>\n'
+                '<div><script>x</script></div><p><div>inner</div></p>'
+                '<table><tr><td width="3">x</td></tr></table>')
+        self.assertEqual(
+            ''.join(transform.sanitize(block)
+                    for block in self._split(orig)),
+            transform.sanitize(orig))
+
+
+class IncrementalUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.cache import RESULT_CACHE
+        from experimental.safe_html_transform.stats import STATS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(incremental_size=100, snippet_size=0,
+                                  collect_stats=1)
+        RESULT_CACHE.clear()
+        STATS.reset()
+        self.stats = STATS
+
+    def tearDown(self):
+        self.stats.configure(False)
+        self.stats.reset()
+
+    def test_only_changed_blocks_are_sanitized(self):
+        paragraphs = ['<div>paragraph %d</div>' % i for i in range(10)]
+        self.transform.convert_text('\n'.join(paragraphs))
+        paragraphs[4] = '<div>changed <b>paragraph</b></div>'
+        safe_html = self.transform.convert_text('\n'.join(paragraphs))
+        self.assertIn('<p>changed <b>paragraph</b></p>', safe_html)
+        self.assertEqual(safe_html,
+                         self.transform.sanitize('\n'.join(paragraphs)))
+        counters = self.stats.snapshot()['counters']
+        self.assertEqual(counters['incremental'], 2)
+        self.assertEqual(counters['blocks_sanitized'], 11)
+        self.assertEqual(counters['blocks_reused'], 9)
+
+    def test_small_documents_are_sanitized_whole(self):
+        self.transform.convert_text('<div>a</div><div>b</div>')
+        counters = self.stats.snapshot()['counters']
+        self.assertEqual(counters['sanitized'], 1)
+        self.assertEqual(counters['blocks_sanitized'], 0)
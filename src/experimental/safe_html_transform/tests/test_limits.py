@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest2 as unittest
+
+
+class LimitsUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.stats import STATS
+        STATS.reset()
+
+    def _convert(self, html, **config):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        from Products.PortalTransforms.data import datastream
+        transform = SafeHTML(cache_size=0, **config)
+        data = datastream(transform.name())
+        return transform.convert(html, data)._data
+
+    def _exceeded(self):
+        from experimental.safe_html_transform.stats import STATS
+        return STATS.snapshot()['limits']
+
+    def test_within_limits(self):
+        html = '<div><p class="a">%s</p></div>' % ('<b>x</b>' * 20)
+        self.assertEqual(
+            self._convert(html, max_depth=5, max_elements=30,
+                          max_attributes=1),
+            '<p/><p class="a">%s</p>' % ('<b>x</b>' * 20))
+        self.assertEqual(self._exceeded(), {})
+
+    def test_max_bytes(self):
+        self.assertEqual(self._convert('<p>abc</p>', max_bytes=5),
+                         '<p>&lt;p&gt;abc&lt;/p&gt;</p>')
+        self.assertEqual(self._exceeded(), {'max_bytes': 1})
+
+    def test_max_depth(self):
+        html = '<div>' * 10 + 'deep' + '</div>' * 10
+        self.assertEqual(self._convert(html, max_depth=8),
+                         '<p>%s</p>' % html.replace('<', '&lt;').replace(
+                             '>', '&gt;'))
+        self.assertEqual(self._exceeded(), {'max_depth': 1})
+
+    def test_max_elements(self):
+        self._convert('<div>x</div>' * 20, max_elements=10)
+        self.assertEqual(self._exceeded(), {'max_elements': 1})
+
+    def test_max_attributes(self):
+        self._convert('<p a="1" b="2" c="3">x</p><p>y', max_attributes=2)
+        self.assertEqual(self._exceeded(), {'max_attributes': 1})
+
+    def test_time_budget(self):
+        from experimental.safe_html_transform.limits import LimitExceeded
+        from experimental.safe_html_transform.limits import Limits
+        from experimental.safe_html_transform.limits import parse_checked
+        with self.assertRaises(LimitExceeded) as raised:
+            parse_checked('<p>x</p>', Limits.from_config({}),
+                          deadline=time.time() - 1)
+        self.assertEqual(raised.exception.limit, 'time_budget')
+
+    def test_size_not_limited_by_default(self):
+        from experimental.safe_html_transform.limits import Limits
+        self.assertEqual(Limits.from_config({}).max_bytes, 0)
+
+    def test_one_budget_per_conversion(self):
+        from experimental.safe_html_transform.limits import Limits
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        deadlines = []
+
+        class CountedLimits(Limits):
+
+            def deadline(self):
+                deadlines.append(self.time_budget)
+                return Limits.deadline(self)
+
+        transform = SafeHTML(incremental_size=100, snippet_size=0)
+        compiled = transform.compiled()
+        compiled = compiled._replace(
+            limits=CountedLimits(*compiled.limits))
+        blocks = ['<div>block %d</div>' % i for i in range(10)]
+        self.assertEqual(transform.convert_text('\n'.join(blocks), compiled),
+                         ''.join('<p>block %d</p>' % i for i in range(10)))
+        self.assertEqual(deadlines, [2000])
+
+    def test_blocks_share_budget(self):
+        from experimental.safe_html_transform.limits import LimitExceeded
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        # a cache of its own, the blocks are not in it
+        transform = SafeHTML(cache_size=12345)
+        with self.assertRaises(LimitExceeded):
+            transform.sanitize_blocks(['<div>a</div>', '<div>b</div>'],
+                                      transform.compiled(),
+                                      deadline=time.time() - 1)
+
+    def test_parse_checked(self):
+        from experimental.safe_html_transform.limits import Limits
+        from experimental.safe_html_transform.limits import \
+            PARSE_CHUNK_SIZE
+        from experimental.safe_html_transform.limits import parse_checked
+        from lxml import etree
+        from lxml.html import HTMLParser
+        # the end tag of the script is split between two chunks
+        html = '<html><p>%s</p><script>x</script><p>after</p></html>' % (
+            'x' * (PARSE_CHUNK_SIZE - 35))
+        limits = Limits.from_config({'max_depth': 100})
+        self.assertEqual(
+            etree.tostring(parse_checked(html, limits)),
+            etree.tostring(etree.fromstring(html, HTMLParser())))
+
+    def test_escaped_text(self):
+        from experimental.safe_html_transform.limits import escaped_text
+        self.assertEqual(escaped_text('a < b\x01 & caf\xe9', 'latin-1'),
+                         '<p>a &lt; b &amp; caf&#233;</p>')
+        self.assertEqual(escaped_text('caf\xc3\xa9'), '<p>caf&#233;</p>')
+        self.assertEqual(escaped_text(u'caf\xe9'), '<p>caf&#233;</p>')
+        self.assertEqual(escaped_text(' \n'), '')
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest2 as unittest
+
+
+class ParserPoolUnitTest(unittest.TestCase):
+
+    def _pool(self):
+        from experimental.safe_html_transform.parsers import ParserPool
+        return ParserPool()
+
+    def test_reuse(self):
+        pool = self._pool()
+        parser = pool.get()
+        self.assertIs(pool.get(), parser)
+        self.assertIs(pool.get(), parser)
+        self.assertEqual(pool.stats(),
+                         {'threads': 1, 'hits': 2, 'rebuilds': 1})
+
+    def test_parser_per_encoding(self):
+        pool = self._pool()
+        parser = pool.get()
+        latin = pool.get('iso8859-1')
+        self.assertIsNot(latin, parser)
+        self.assertIs(pool.get('iso8859-1'), latin)
+        self.assertEqual(pool.stats()['rebuilds'], 2)
+
+    def test_parser_per_thread(self):
+        pool = self._pool()
+        parsers = []
+
+        def get():
+            parsers.append(pool.get())
+            pool.get()
+
+        threads = [threading.Thread(target=get) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        parsers.append(pool.get())
+        self.assertEqual(len(set(map(id, parsers))), 4)
+        stats = pool.stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['rebuilds'], 4)
+
+    def test_transform_uses_pool(self):
+        from experimental.safe_html_transform.parsers import PARSERS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        transform = SafeHTML(cache_size=0, snippet_size=0)
+        transform.convert_text('<div>a</div>')
+        before = PARSERS.stats()
+        transform.convert_text('<div>b</div>')
+        self.assertEqual(PARSERS.stats()['hits'], before['hits'] + 1)
+        self.assertEqual(PARSERS.stats()['rebuilds'], before['rebuilds'])
+
+    def test_shared_by_policies(self):
+        from experimental.safe_html_transform.parsers import PARSERS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        SafeHTML(cache_size=0, snippet_size=0).convert_text('<div>a</div>')
+        before = PARSERS.stats()
+        transform = SafeHTML(cache_size=0, snippet_size=0,
+                             nasty_tags=['b'])
+        transform.convert_text('<div>b</div>')
+        self.assertEqual(PARSERS.stats()['rebuilds'], before['rebuilds'])
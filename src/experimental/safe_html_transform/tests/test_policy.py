@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import unittest2 as unittest
+from Products.PortalTransforms.data import datastream
+
+
+class SanitizePolicyUnitTest(unittest.TestCase):
+
+    def _makeOne(self, **config):
+        from experimental.safe_html_transform.policy import SanitizePolicy
+        return SanitizePolicy(config)
+
+    def test_tags_are_frozensets(self):
+        policy = self._makeOne(valid_tags={'p': 1, 'BR': 0},
+                               nasty_tags=['script'])
+        self.assertEqual(policy.valid_tags, frozenset(['p', 'br']))
+        self.assertEqual(policy.nasty_tags, frozenset(['script']))
+
+    def test_stripped_combinations_index(self):
+        policy = self._makeOne(
+            stripped_combinations={'table th td': 'width height',
+                                   'td': 'nowrap'})
+        self.assertEqual(policy.stripped_combinations['table'],
+                         frozenset(['width', 'height']))
+        self.assertEqual(policy.stripped_combinations['td'],
+                         frozenset(['width', 'height', 'nowrap']))
+
+    def test_rename_tags_index(self):
+        policy = self._makeOne(rename_tags={'H3': 'P ', 'em': 'em'})
+        self.assertEqual(policy.rename_tags, {'h3': 'p'})
+        other = self._makeOne(rename_tags={'h3': 'div'})
+        self.assertNotEqual(policy.fingerprint, other.fingerprint)
+
+    def test_rename_tags_missing(self):
+        self.assertEqual(self._makeOne().rename_tags,
+                         dict.fromkeys(['h3', 'h4', 'h5', 'h6', 'div'], 'p'))
+        self.assertEqual(self._makeOne(rename_tags={}).rename_tags, {})
+
+    def test_immutable(self):
+        policy = self._makeOne(nasty_tags=['script'])
+        with self.assertRaises(AttributeError):
+            policy.nasty_tags = frozenset()
+
+    def test_fingerprint(self):
+        one = self._makeOne(nasty_tags=['script', 'style'])
+        two = self._makeOne(nasty_tags=('style', 'script'))
+        three = self._makeOne(nasty_tags=['script'])
+        self.assertEqual(one.fingerprint, two.fingerprint)
+        self.assertNotEqual(one.fingerprint, three.fingerprint)
+
+
+class SafeHTMLPolicyUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML()
+
+    def test_policy_is_reused(self):
+        policy = self.transform.policy()
+        cleaner = self.transform.cleaner()
+        self.assertIs(self.transform.policy(), policy)
+        self.assertIs(self.transform.cleaner(), cleaner)
+
+    def test_policy_rebuilt_on_config_change(self):
+        policy = self.transform.policy()
+        self.transform.config['nasty_tags'] = ['script']
+        self.assertIsNot(self.transform.policy(), policy)
+        self.assertEqual(self.transform.policy().nasty_tags,
+                         frozenset(['script']))
+
+    def test_convert_uses_changed_policy(self):
+        self.transform.config['nasty_tags'] = ['script']
+        html = "<p>foo</p><style>p {}</style><script>alert(1)</script>"
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>foo</p><style>p {}</style>")
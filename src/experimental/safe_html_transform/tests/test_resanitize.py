@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from experimental.safe_html_transform.testing import \
+    EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+from plone import api
+from plone.app.testing import setRoles
+from plone.app.testing import TEST_USER_ID
+from plone.app.textfield.value import RichTextValue
+from zope.annotation.interfaces import IAnnotations
+
+import unittest2 as unittest
+
+
+class ResanitizeIntegrationTest(unittest.TestCase):
+
+    layer = EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+
+    def setUp(self):
+        self.portal = self.layer['portal']
+        setRoles(self.portal, TEST_USER_ID, ['Manager'])
+        for i in range(5):
+            api.content.create(
+                container=self.portal, type='Document', id='doc%d' % i,
+                text=RichTextValue(
+                    u'<p>doc %d</p><script>alert(1)</script>' % i,
+                    'text/html', 'text/x-html-safe'))
+
+    def test_resanitize(self):
+        from experimental.safe_html_transform.resanitize import CHECKPOINT_KEY
+        from experimental.safe_html_transform.resanitize import resanitize
+        changed = resanitize(self.portal, batch_size=2, workers=0,
+                             commit=False)
+        self.assertEqual(changed, 5)
+        self.assertEqual(self.portal['doc3'].text.raw, u'<p>doc 3</p>')
+        self.assertNotIn(CHECKPOINT_KEY, IAnnotations(self.portal))
+
+    def test_unchanged_non_ascii(self):
+        from experimental.safe_html_transform.resanitize import resanitize
+        api.content.create(
+            container=self.portal, type='Document', id='cafe',
+            text=RichTextValue(u'<p>caf\xe9</p>', 'text/html',
+                               'text/x-html-safe'))
+        self.assertEqual(resanitize(self.portal, workers=0, commit=False), 5)
+        self.assertEqual(self.portal['cafe'].text.raw, u'<p>caf\xe9</p>')
+        self.assertEqual(resanitize(self.portal, workers=0, commit=False), 0)
+
+    def test_resume_from_checkpoint(self):
+        from experimental.safe_html_transform.resanitize import CHECKPOINT_KEY
+        from experimental.safe_html_transform.resanitize import get_transform
+        from experimental.safe_html_transform.resanitize import resanitize
+        from persistent.mapping import PersistentMapping
+        catalog = api.portal.get_tool('portal_catalog')
+        uids = sorted(b.UID for b in catalog(portal_type='Document'))
+        IAnnotations(self.portal)[CHECKPOINT_KEY] = PersistentMapping(
+            policy=get_transform(self.portal).policy().fingerprint,
+            last_uid=uids[2], done=3, changed=3)
+        changed = resanitize(self.portal, workers=0, commit=False)
+        self.assertEqual(changed, 5)
+        documents = [api.content.get(UID=uid) for uid in uids]
+        self.assertIn(u'<script>', documents[2].text.raw)
+        self.assertNotIn(u'<script>', documents[3].text.raw)
+        self.assertNotIn(u'<script>', documents[4].text.raw)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from StringIO import StringIO
+
+import unittest2 as unittest
+
+
+class RewriteRulesUnitTest(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from experimental.safe_html_transform.rules import RewriteRules
+        return RewriteRules(**kw)
+
+    def _apply(self, rules, html, **kw):
+        from lxml.html import fragment_fromstring
+        from lxml import etree
+        body = fragment_fromstring(html, create_parent='body')
+        result = rules(body, **kw)
+        return etree.tostring(body)[6:-7], result
+
+    def test_dispatch_table(self):
+        from experimental.safe_html_transform.tags import KILL
+        from experimental.safe_html_transform.tags import UNWRAP
+        rules = self._makeOne(kill_tags=['script', 'b'],
+                              remove_tags=['font', 'script'],
+                              rename_tags={'div': 'p', 'span': 'b',
+                                           'em': 'em'})
+        self.assertEqual(rules.tags, {'script': (None, KILL),
+                                      'b': (None, KILL),
+                                      'font': (None, UNWRAP),
+                                      'div': ('p', None),
+                                      # the fate of the new name
+                                      'span': ('b', KILL)})
+        self.assertEqual(rules.kill_tags, frozenset(['script', 'b', 'span']))
+        self.assertEqual(rules.rename_tags, {'div': 'p', 'span': 'b'})
+
+    def test_single_walk(self):
+        rules = self._makeOne(
+            kill_tags=['script'], remove_tags=['font'],
+            rename_tags={'h3': 'p', 'i': 'em'}, stripped_attributes=['lang'],
+            stripped_combinations={'td': frozenset(['width'])},
+            classes=lambda value: value.replace('evil', ''))
+        html, result = self._apply(
+            rules, '<h3 lang="de">a<ul><li>b</li></ul></h3>'
+                   '<font><i class="evil">c</i></font><script>d</script>'
+                   '<table><tr><td width="1" class="x">e</td></tr></table>')
+        self.assertEqual(html, '<p>a</p><ul><li>b</li></ul><em>c</em>'
+                               '<table><tr><td class="x">e</td></tr></table>')
+        self.assertEqual(result, (2, 3))
+
+    def test_filter_attribute(self):
+        rules = self._makeOne(
+            stripped_attributes=['lang'],
+            stripped_combinations={'td': frozenset(['width'])},
+            styles=lambda value: '')
+        self.assertIsNone(rules.filter_attribute('p', 'lang', 'de'))
+        self.assertIsNone(rules.filter_attribute('td', 'width', '1'))
+        self.assertIsNone(rules.filter_attribute('p', 'style', 'x: y'))
+        self.assertEqual(rules.filter_attribute('p', 'width', '1'), '1')
+
+    def test_max_attributes(self):
+        from experimental.safe_html_transform.limits import LimitExceeded
+        rules = self._makeOne()
+        self.assertRaises(LimitExceeded, self._apply, rules,
+                          '<p a="1" b="2" c="3">x</p>', max_attributes=2)
+
+
+class RenameTagsUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(
+            cache_size=0, stream_size=1000, stream_density=150,
+            rename_tags={'h1': 'h2', 'blockquote': 'p', 'li': 'p'})
+
+    def test_renamed(self):
+        orig = '<h1>Title</h1><blockquote>a<ul><li>b</li></ul></blockquote>'
+        self.assertEqual(self.transform.sanitize(orig),
+                         '<h2>Title</h2><p>a</p><ul><p>b</p></ul>')
+
+    def test_stored_config_without_renames(self):
+        del self.transform.config['rename_tags']
+        self.assertEqual(self.transform.sanitize('<div>a</div><h3>b</h3>'),
+                         '<p>a</p><p>b</p>')
+
+    def test_default_renames_replaced(self):
+        self.assertEqual(self.transform.sanitize('<div>a</div><h3>b</h3>'),
+                         '<div>a</div><h3>b</h3>')
+
+    def test_engines_agree(self):
+        compiled = self.transform.compiled()
+        for orig in ['<h1>Title</h1>', '<blockquote>a<p>b</p></blockquote>',
+                     '<ul><li>a<ol><li>b</li></ol></li></ul>']:
+            tree = self.transform.sanitize(orig)
+            snippet = compiled.snippet(orig)
+            if snippet is not None:
+                self.assertEqual(snippet, tree, orig)
+            self.assertEqual(self.transform.sanitize_streamed(orig, compiled),
+                             tree, orig)
+            sink = self.transform.convert_stream(StringIO(orig), StringIO())
+            self.assertEqual(sink.getvalue(), tree, orig)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import unittest2 as unittest
+
+
+class JavaScriptScrubberUnitTest(unittest.TestCase):
+
+    def _scrubber(self):
+        from experimental.safe_html_transform.scrub import \
+            JavaScriptScrubber
+        return JavaScriptScrubber()
+
+    def test_urls(self):
+        scrubber = self._scrubber()
+        for url in ['http://plone.org', '/relative', 'mailto:a@b.c',
+                    'page.html#javascript:', u'caf\xe9.html']:
+            self.assertTrue(scrubber(url), url)
+        for url in ['javascript:alert(1)', ' JavaScript:alert(1)',
+                    'java\tscript:alert(1)', 'vbscript:msgbox',
+                    'javascript&colon;alert(1)', 'java&Tab;script:x',
+                    'java&NewLine;script&colon;x',
+                    'data:text/html;base64,PHNjcmlwdD4=']:
+            self.assertFalse(scrubber(url), url)
+
+    def test_unsafe(self):
+        scrubber = self._scrubber()
+        self.assertTrue(scrubber.unsafe('onclick', 'x()'))
+        self.assertTrue(scrubber.unsafe('src', 'javascript:x()'))
+        self.assertFalse(scrubber.unsafe('title', 'javascript:x()'))
+        self.assertFalse(scrubber.unsafe('href', 'http://plone.org'))
+        self.assertTrue(scrubber.unsafe('formaction', 'javascript:x()'))
+        self.assertTrue(scrubber.unsafe('xlink:href', 'javascript:x()'))
+
+    def test_srcset(self):
+        scrubber = self._scrubber()
+        self.assertFalse(scrubber.unsafe('srcset', 'a.png 1x, b.png 2x'))
+        self.assertFalse(scrubber.unsafe('srcset', 'a.png'))
+        for srcset in ['a.png 1x, javascript:x() 2x',
+                       ' javascript:x()',
+                       'a.png 480w,\njava\tscript:x() 800w',
+                       'data:image/png;base64,AAAA 1x']:
+            self.assertTrue(scrubber.unsafe('srcset', srcset), srcset)
+
+    def test_memoized(self):
+        scrubber = self._scrubber()
+        scrubber('javascript:x()')
+        self.assertEqual(scrubber._cache, {'javascript:x()': False})
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from experimental.safe_html_transform.testing import \
+    EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+from plone.registry import field
+from plone.registry import Record
+from plone.registry import Registry
+from plone.registry.interfaces import IRecordModifiedEvent
+from plone.registry.interfaces import IRegistry
+from Products.PortalTransforms.data import datastream
+from zope.component import getUtility
+from zope.component import provideHandler
+from zope.component import provideUtility
+from zope.component.testing import setUp
+from zope.component.testing import tearDown
+
+import unittest2 as unittest
+
+
+class FilterSettingsUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform import settings
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.registry = Registry()
+        self.registry.records['plone.nasty_tags'] = Record(
+            field.List(value_type=field.TextLine()), [u'script'])
+        self.registry.records['plone.custom_tags'] = Record(
+            field.List(value_type=field.TextLine()), [u'marquee'])
+        setUp()
+        provideUtility(self.registry, IRegistry)
+        provideHandler(settings.registry_modified, (IRecordModifiedEvent, ))
+        self.transform = SafeHTML()
+
+    def tearDown(self):
+        tearDown()
+
+    def test_registry_overrides_config(self):
+        policy = self.transform.policy()
+        self.assertIn('marquee', policy.valid_tags)
+
+    def test_registry_adds_nasty_tags(self):
+        from experimental.safe_html_transform.tags import NASTY_TAGS
+        self.registry['plone.nasty_tags'] = [u'script', u'marquee']
+        policy = self.transform.policy()
+        self.assertEqual(policy.nasty_tags, NASTY_TAGS | set(['marquee']))
+        html = '<p>foo</p><style>p {}</style><meta http-equiv="refresh" />'
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<p>foo</p>')
+
+    def test_snapshot_is_reused(self):
+        from experimental.safe_html_transform.settings import \
+            get_filter_settings
+        snapshot = get_filter_settings()
+        self.assertIs(get_filter_settings(), snapshot)
+        self.assertIs(self.transform.policy(), self.transform.policy())
+
+    def test_record_change_refreshes_policy(self):
+        from experimental.safe_html_transform.settings import \
+            get_filter_settings
+        version = get_filter_settings().version
+        html = "<p>foo</p><marquee>bar</marquee>"
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>foo</p><marquee>bar</marquee>")
+        self.registry['plone.nasty_tags'] = [u'script', u'marquee']
+        self.assertGreater(get_filter_settings().version, version)
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         "<p>foo</p>")
+
+    def test_merge_without_settings(self):
+        from experimental.safe_html_transform.settings import merge_settings
+        config = {'nasty_tags': ['script']}
+        self.assertIs(merge_settings(config, None), config)
+
+    def test_merge_nasty_tags(self):
+        from experimental.safe_html_transform.settings import FilterSettings
+        from experimental.safe_html_transform.settings import merge_settings
+        config = {'nasty_tags': ['script', 'style', 'meta']}
+        settings = FilterSettings({'nasty_tags': (u'script', u'embed')}, 1)
+        self.assertEqual(merge_settings(config, settings)['nasty_tags'],
+                         ('embed', 'meta', 'script', 'style'))
+
+
+class FilterSettingsIntegrationTest(unittest.TestCase):
+
+    layer = EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.registry = getUtility(IRegistry)
+        self.transform = SafeHTML()
+
+    def test_control_panel_change_applies(self):
+        self.registry['plone.stripped_tags'] = [u'font', u'span']
+        html = '<p><span>foo</span></p>'
+        data = datastream(self.transform.name())
+        self.assertEqual(self.transform.convert(html, data)._data,
+                         '<p>foo</p>')
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest2 as unittest
+
+# building blocks of the generated snippets of the differential test.
+TAGS = ['a', 'b', 'i', 'em', 'strong', 'span', 'br', 'img', 'p', 'div',
+        'h1', 'h3', 'ul', 'ol', 'li', 'blockquote', 'pre', 'hr', 'script',
+        'style', 'font', 'q', 'code', 'layer', 'table', 'td', 'object',
+        'sub', 'title', 'body', 'u', 'tt', 'abbr', 'sup']
+TEXTS = ['x', ' ', ' y ', '\n', '\t', '\r\n', '&amp;', '&lt;', '&nbsp;',
+         '&apos;', '&#233;', '&#x41;', '&#0;', '&#13;', '&foo;', '&amp',
+         'caf\xc3\xa9', '\xc2\xa0', '>', '<', 'a < b', '"', "'", '\x01']
+ATTRIBUTES = [' href="http://plone.org"', ' href="javascript:x()"',
+              ' onclick="y()"', ' class="a evil"', ' class="evil"',
+              ' style="color: red; float: left"', ' title="a &amp; b"',
+              " title='q'", ' title=x', ' title="a\nb\t<c>"', ' TITLE="X"',
+              ' id="a" id="b"', ' disabled', ' width="5"', ' lang="de"',
+              ' href="&#106;avascript:x"']
+
+
+def generate(rng, depth=0):
+    """Return a random snippet, valid or not."""
+    parts = []
+    for i in range(rng.randint(0, 4)):
+        if depth > 3 or rng.random() < 0.4:
+            parts.append(rng.choice(TEXTS))
+            continue
+        tag = rng.choice(TAGS)
+        if rng.random() < 0.15:
+            tag = tag.upper()
+        attributes = ''.join(rng.choice(ATTRIBUTES)
+                             for j in range(rng.choice([0, 0, 1, 2])))
+        close = rng.random()
+        if close < 0.05:
+            parts.append('<%s%s/>' % (tag, attributes))
+            continue
+        parts.append('<%s%s>' % (tag, attributes))
+        parts.append(generate(rng, depth + 1))
+        if close < 0.85:
+            parts.append('</%s>' % tag)
+        elif close < 0.9:
+            parts.append('</%s>' % rng.choice(TAGS))
+    return ''.join(parts)
+
+
+class SnippetSanitizerUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(class_blacklist=['evil'])
+        self.snippet = self.transform.compiled().snippet
+
+    def test_sanitize(self):
+        for orig, expected in [
+                ('<p onclick="x()">Nice <b>article</b></p><script>x</script>',
+                 '<p>Nice <b>article</b></p>'),
+                ('Great <a href="http://plone.org" class="evil">link</a>!',
+                 '<p>Great <a href="http://plone.org">link</a>!</p>'),
+                ('<h3>Title</h3>\n<div>text &amp; more</div>',
+                 '<p>Title</p><p>text &amp; more</p>'),
+                ('<P TITLE=\'a "b"\'>caf\xc3\xa9<br></P>',
+                 '<p title="a &quot;b&quot;">caf&#233;<br/></p>'),
+                ('<ul>\n<li>a</li>\n<li>b</li></ul>',
+                 '<ul>\n<li>a</li>\n<li>b</li></ul>'),
+                ('<em></em>', '<em/>')]:
+            self.assertEqual(self.snippet(orig), expected, orig)
+            self.assertEqual(self.snippet(orig), self.transform.sanitize(orig))
+
+    def test_needs_tree(self):
+        for orig in ['<p>a<ul><li>b</li></ul></p>',
+                     '<b><i>x</b></i>',
+                     '<div><p>renamed div with a block</p></div>',
+                     '<li>outside of a list</li>',
+                     '<table><tr><td>x</td></tr></table>',
+                     '<script>x</script>in the head',
+                     '<p>a &b</p>',
+                     '<p>a<!-- comment --></p>',
+                     '<input disabled>',
+                     '<p id="a" id="b">x</p>',
+                     '<b/>',
+                     '<pre>\nx</pre>',
+                     'a < b',
+                     'invalid \xe9 utf-8']:
+            self.assertIsNone(self.snippet(orig), orig)
+
+    def test_max_attributes(self):
+        from experimental.safe_html_transform.limits import LimitExceeded
+        self.transform.config['max_attributes'] = 2
+        snippet = self.transform.compiled().snippet
+        self.assertEqual(snippet('<p a="1" b="2">x</p>'),
+                         '<p a="1" b="2">x</p>')
+        self.assertRaises(LimitExceeded, snippet,
+                          '<p a="1" b="2" c="3">x</p>')
+
+    def test_matches_tree_sanitizer(self):
+        # the differential test: whatever the snippet sanitizer handles
+        # must come out as from the tree sanitizer
+        rng = random.Random(23)
+        handled = 0
+        for i in range(3000):
+            orig = generate(rng)
+            safe_html = self.snippet(orig)
+            if safe_html is not None:
+                handled += 1
+                self.assertEqual(safe_html, self.transform.sanitize(orig),
+                                 repr(orig))
+        self.assertGreater(handled, 500)
+
+    def test_policy(self):
+        self.transform.config['stripped_tags'] = ['span']
+        self.transform.config['nasty_tags'] = ['script', 'b']
+        snippet = self.transform.compiled().snippet
+        orig = '<p><span>a</span> <i>b</i></p>'
+        self.assertEqual(snippet(orig), '<p>a <i>b</i></p>')
+        self.assertEqual(snippet(orig), self.transform.sanitize(orig))
+        self.assertIsNone(snippet('<p><b>killed</b></p>'))
+
+
+class SnippetTransformUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.stats import STATS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(cache_size=0, collect_stats=1,
+                                  snippet_size=256)
+        STATS.reset()
+        self.stats = STATS
+
+    def tearDown(self):
+        self.stats.configure(False)
+        self.stats.reset()
+
+    def test_small_input(self):
+        self.transform.sanitize = None
+        self.assertEqual(self.transform.convert_text('<p onclick="x()">a</p>'),
+                         '<p>a</p>')
+        self.assertEqual(self.stats.snapshot()['counters']['snippet'], 1)
+
+    def test_fallback(self):
+        orig = '<b><i>x</b>y</i>'
+        self.assertEqual(self.transform.convert_text(orig),
+                         '<b><i>x</i></b>y')
+        counters = self.stats.snapshot()['counters']
+        self.assertEqual(counters['snippet'], 0)
+        self.assertEqual(counters['sanitized'], 1)
+
+    def test_disabled(self):
+        del self.transform.config['snippet_size']
+        self.transform.convert_text('<p onclick="x()">a</p>')
+        self.assertEqual(self.stats.snapshot()['counters']['sanitized'], 1)
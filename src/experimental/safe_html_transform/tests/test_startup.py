@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+import unittest2 as unittest
+
+# seconds importing the transform module may take once Plone is loaded.
+IMPORT_BUDGET = 0.25
+
+# modules the transform imports on first use only.
+LAZY_MODULES = ('lxml.html', 'lxml.html.clean', 'multiprocessing',
+                'zope.annotation', 'experimental.safe_html_transform.cleaner',
+                'experimental.safe_html_transform.snippet',
+                'experimental.safe_html_transform.stored')
+
+# measures the import in a fresh interpreter, with the modules Plone
+# imports before any transform already loaded.
+_MEASURE = """
+import json
+import sys
+import time
+import plone.registry.interfaces
+import Products.PortalTransforms.interfaces
+import zope.component
+import experimental.safe_html_transform
+started = time.time()
+import experimental.safe_html_transform.transforms.safe_html
+elapsed = time.time() - started
+print(json.dumps({'elapsed': elapsed, 'modules': [
+    name for name, module in sys.modules.items() if module is not None]}))
+"""
+
+
+class StartupUnitTest(unittest.TestCase):
+
+    def _measure(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c', _MEASURE],
+                                         env=env)
+        return json.loads(output.splitlines()[-1])
+
+    def test_import_budget(self):
+        # the best of three, the first run may compile the modules
+        elapsed = min(self._measure()['elapsed'] for i in range(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+    def test_lazy_imports(self):
+        modules = set(self._measure()['modules'])
+        self.assertEqual(modules.intersection(LAZY_MODULES), set())
+
+    def test_available_transforms(self):
+        from experimental.safe_html_transform.setuphandlers import \
+            availableTransforms
+        self.assertEqual(availableTransforms(), ['safe_html'])
+
+    def test_config_copies_tag_table(self):
+        from experimental.safe_html_transform.tags import VALID_TAGS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        transform = SafeHTML()
+        transform.config['valid_tags']['iframe'] = 1
+        self.assertNotIn('iframe', VALID_TAGS)
+        self.assertNotIn('iframe', SafeHTML().config['valid_tags'])
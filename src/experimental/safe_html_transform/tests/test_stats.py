@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from experimental.safe_html_transform.testing import \
+    EXPERIMENTAL_SAFE_HTML_TRANSFORM_FUNCTIONAL_TESTING
+from plone.app.testing import SITE_OWNER_NAME
+from plone.app.testing import SITE_OWNER_PASSWORD
+from plone.testing.z2 import Browser
+
+import json
+import logging
+import unittest2 as unittest
+
+
+class ConversionStatsUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.stats import STATS
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(cache_size=0, collect_stats=1)
+        self.stats = STATS
+        self.stats.reset()
+
+    def tearDown(self):
+        self.stats.configure(False)
+        self.stats.reset()
+
+    def _convert(self, html):
+        from Products.PortalTransforms.data import datastream
+        data = datastream(self.transform.name())
+        return self.transform.convert(html, data)._data
+
+    def test_stages_and_counters(self):
+        html = ('<div lang="de"><script>x</script>y<style>z</style>'
+                '<table width="1"></table></div>')
+        safe_html = self._convert(html)
+        self._convert('plain text')
+        snapshot = self.stats.snapshot()
+        counters = snapshot['counters']
+        self.assertEqual(counters['conversions'], 2)
+        self.assertEqual(counters['sanitized'], 1)
+        self.assertEqual(counters['plain_text'], 1)
+        self.assertEqual(counters['elements_removed'], 2)
+        self.assertEqual(counters['attributes_stripped'], 2)
+        self.assertEqual(counters['bytes_in'], len(html) + 10)
+        self.assertEqual(counters['bytes_out'],
+                         len(safe_html) + len('<p>plain text</p>'))
+        for stage in ('parse', 'rewrite', 'clean', 'split', 'serialize'):
+            self.assertGreater(snapshot['timings'][stage], 0, stage)
+
+    def test_disabled(self):
+        self.transform.config['collect_stats'] = 0
+        self._convert('<p>foo</p>')
+        self.assertEqual(self.stats.snapshot()['counters']['conversions'], 0)
+
+    def test_log_interval(self):
+        from experimental.safe_html_transform.stats import Conversion
+        from experimental.safe_html_transform.stats import logger
+        messages = []
+        handler = logging.Handler()
+        handler.emit = lambda record: messages.append(record.getMessage())
+        logger.addHandler(handler)
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        self.stats.configure(True, log_interval=3600)
+        self.stats._logged = 0
+        try:
+            self.stats.record(Conversion(), 'sanitized', 'a', 'b')
+            self.stats.record(Conversion(), 'sanitized', 'a', 'b')
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual(len(messages), 1)
+        self.assertIn('1 conversions', messages[0])
+
+
+class StatsViewFunctionalTest(unittest.TestCase):
+
+    layer = EXPERIMENTAL_SAFE_HTML_TRANSFORM_FUNCTIONAL_TESTING
+
+    def setUp(self):
+        self.portal = self.layer['portal']
+        self.browser = Browser(self.layer['app'])
+        self.browser.handleErrors = False
+        self.browser.addHeader(
+            'Authorization',
+            'Basic %s:%s' % (SITE_OWNER_NAME, SITE_OWNER_PASSWORD,)
+        )
+
+    def test_view(self):
+        self.browser.open(self.portal.absolute_url() + '/@@safe-html-stats')
+        self.assertIn('serialize', self.browser.contents)
+
+    def test_json(self):
+        self.browser.open(self.portal.absolute_url() +
+                          '/@@safe-html-stats?format=json')
+        stats = json.loads(self.browser.contents)
+        self.assertIn('parse', stats['timings'])
+        self.assertIn('hits', stats['cache'])
+        self.assertIn('hits', stats['disk_cache'])
+        self.assertIn('queued', stats['deferred'])
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from experimental.safe_html_transform.testing import \
+    EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+from plone import api
+from plone.app.testing import setRoles
+from plone.app.testing import TEST_USER_ID
+from plone.app.textfield.value import RichTextValue
+from Products.PortalTransforms.data import datastream
+from zope.annotation.attribute import AttributeAnnotations
+from zope.annotation.interfaces import IAnnotations
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.component import provideAdapter
+from zope.interface import implementer
+
+import unittest2 as unittest
+
+
+@implementer(IAttributeAnnotatable)
+class Document(object):
+    pass
+
+
+class StoredOutputUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        provideAdapter(AttributeAnnotations)
+        self.transform = SafeHTML(store_output=1, cache_size=0)
+        self.document = Document()
+
+    def convert(self, orig, context):
+        data = datastream('stored')
+        self.transform.convert(orig, data, context=context)
+        return data.getData()
+
+    def test_store_output(self):
+        from experimental.safe_html_transform.stored import OUTPUT_KEY
+        from experimental.safe_html_transform.stored import store_output
+        from experimental.safe_html_transform.stored import stored_output
+        self.assertIsNone(stored_output(self.document, 'key'))
+        store_output(self.document, 'text', 'key', '<p>safe</p>')
+        outputs = IAnnotations(self.document)[OUTPUT_KEY]
+        self.assertEqual(stored_output(self.document, 'key'), '<p>safe</p>')
+        self.assertIsNone(stored_output(self.document, 'other'))
+        store_output(self.document, 'text', 'key', '<p>safe</p>')
+        self.assertIs(IAnnotations(self.document)[OUTPUT_KEY], outputs)
+
+    def test_not_annotatable(self):
+        from experimental.safe_html_transform.stored import stored_output
+        self.assertIsNone(stored_output(object(), 'key'))
+
+    def test_render_reads_stored_output(self):
+        orig = '<p onclick="evil()">text</p>'
+        self.transform.store(self.document, 'text', orig)
+        self.transform.sanitize = None
+        self.assertEqual(self.convert(orig, self.document), '<p>text</p>')
+
+    def test_edited_input_sanitized(self):
+        self.transform.store(self.document, 'text', '<p>old</p>')
+        self.assertEqual(
+            self.convert('<p>new</p><script>x</script>', self.document),
+            '<p>new</p>')
+
+    def test_changed_policy_sanitized(self):
+        orig = '<p>text</p><em>emphasis</em>'
+        self.transform.store(self.document, 'text', orig)
+        self.transform.config['nasty_tags'] = {'em': 1}
+        self.assertEqual(self.convert(orig, self.document), '<p>text</p>')
+
+    def test_disabled(self):
+        orig = '<p>text</p>'
+        self.transform.store(self.document, 'text', orig, '<p>stored</p>')
+        self.transform.config['store_output'] = 0
+        self.assertEqual(self.convert(orig, self.document), '<p>text</p>')
+
+
+class StoredOutputIntegrationTest(unittest.TestCase):
+
+    layer = EXPERIMENTAL_SAFE_HTML_TRANSFORM_INTEGRATION_TESTING
+
+    def setUp(self):
+        from experimental.safe_html_transform.resanitize import get_transform
+        self.portal = self.layer['portal']
+        setRoles(self.portal, TEST_USER_ID, ['Manager'])
+        self.transform = get_transform(self.portal)
+        self.transform.config['store_output'] = 1
+
+    def tearDown(self):
+        self.transform.config['store_output'] = 0
+
+    def test_stored_on_save(self):
+        from experimental.safe_html_transform.stored import OUTPUT_KEY
+        document = api.content.create(
+            container=self.portal, type='Document', id='doc',
+            text=RichTextValue(u'<p>text</p><script>alert(1)</script>',
+                               'text/html', 'text/x-html-safe'))
+        key, safe_html = IAnnotations(document)[OUTPUT_KEY]['text']
+        self.assertEqual(safe_html, '<p>text</p>')
+        self.assertEqual(document.text.output, u'<p>text</p>')
+
+    def test_stored_with_encoding(self):
+        document = api.content.create(
+            container=self.portal, type='Document', id='doc',
+            text=RichTextValue(u'<p>caf\xe9</p>', 'text/html',
+                               'text/x-html-safe', 'latin-1'))
+        self.assertEqual(document.text.raw_encoded, '<p>caf\xe9</p>')
+        self.assertEqual(
+            self.transform.stored('<p>caf\xe9</p>', document, 'latin-1'),
+            '<p>caf&#233;</p>')
+
+    def test_not_stored(self):
+        from experimental.safe_html_transform.stored import OUTPUT_KEY
+        self.transform.config['store_output'] = 0
+        document = api.content.create(
+            container=self.portal, type='Document', id='doc',
+            text=RichTextValue(u'<p>text</p>', 'text/html',
+                               'text/x-html-safe'))
+        self.assertNotIn(OUTPUT_KEY, IAnnotations(document))
+
+    def test_resanitize_refreshes(self):
+        from experimental.safe_html_transform.resanitize import resanitize
+        from experimental.safe_html_transform.stored import OUTPUT_KEY
+        self.transform.config['store_output'] = 0
+        document = api.content.create(
+            container=self.portal, type='Document', id='doc',
+            text=RichTextValue(u'<p>text</p><script>alert(1)</script>',
+                               'text/html', 'text/x-html-safe'))
+        self.assertNotIn(OUTPUT_KEY, IAnnotations(document))
+        self.transform.config['store_output'] = 1
+        resanitize(self.portal, workers=0, commit=False)
+        key, safe_html = IAnnotations(document)[OUTPUT_KEY]['text']
+        self.assertEqual(safe_html, '<p>text</p>')
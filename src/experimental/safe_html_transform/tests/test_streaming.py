@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from StringIO import StringIO
+import random
+import unittest2 as unittest
+
+# building blocks of the generated documents of the differential test.
+PARTS = ['<p>', '</p>', '<b>', '</b>', '<div>', '</div>', '<ul>', '<li>',
+         '</ul>', '<br>', '<script>x</script>', '<style>p {}</style>',
+         '<!-- c -->', 'text', ' ', '\n', '&amp;', '<', '>', '<h3>', '</h3>',
+         '<table>', '<td>', '<font>', '</font>', '<a href="x">', '</a>',
+         '<title>t</title>', '<span class="c">', '<?pi x?>', '<textarea>',
+         '</textarea>', '&#xD800;', '<P>', '<layer>', '</layer>', '<iframe>',
+         '<object>', '</object>', '<meta name="a">', '<img src="x">',
+         '\xc3\xa9', '<pre>', '</pre>', '<blockquote>', '<h1>', '</h1>',
+         '</body>', '<body>', '<html>', '<head>', '</head>']
+
+
+class StreamingUnitTest(unittest.TestCase):
+
+    def setUp(self):
+        from experimental.safe_html_transform.transforms.safe_html import \
+            SafeHTML
+        self.transform = SafeHTML(class_blacklist=['evil'])
+
+    def _stream(self, html, chunk_size=4):
+        sink = StringIO()
+        self.transform.convert_stream(StringIO(html), sink,
+                                      chunk_size=chunk_size)
+        return sink.getvalue()
+
+    def test_matches_tree_sanitizer(self):
+        for html in ["<p>foo</p>\n<p>bar</p>",
+                     "<h3>foo</h3><div>bar<p>baz</p>tail</div>",
+                     "<div><div>x</div></div>",
+                     "<script>alert(1)</script><p>a<br>b</p>",
+                     "<p>x<style>p {}</style>y</p><!-- c -->",
+                     "<p>a &amp; b &lt; c</p><font>d</font>",
+                     "<object><param name=a><p>alt</p></object>",
+                     "<b>bold</b> and more",
+                     '<span style="color: red; float: left">s</span>',
+                     '<table border="1" width="5"><tr><td width="1" '
+                     'class="c" lang="de">x</td></tr></table>',
+                     '<p class="a evil">x</p><p class="evil">y</p>',
+                     '<a href="javascript:x()" onclick="y()">z</a>',
+                     "<p></p>",
+                     ""]:
+            self.assertEqual(self._stream(html),
+                             self.transform.sanitize(html), html)
+
+    def test_page_structure(self):
+        for html in ["<p>a</p></body><p>b</p>",
+                     "<body></body>x<!-- c -->",
+                     "<!-- a --><p>b</p><?pi c?>",
+                     "</b><<li>",
+                     "<meta name=a> <<p>x</p>",
+                     "\n<body>\n<layer>text</layer>"]:
+            self.assertEqual(self._stream(html),
+                             self.transform.sanitize(html), html)
+
+    def test_streamable(self):
+        from experimental.safe_html_transform.streaming import streamable
+        self.assertTrue(streamable(
+            '<p a="1" b=\'2\' c=3 d="">x</p><br/><script>y</script>'))
+        # the tree sanitizer keeps the order of the attributes
+        self.assertFalse(streamable('<img src="a" alt="b">'))
+        self.assertFalse(streamable('<p title="a" title="b">x</p>'))
+        self.assertFalse(streamable('<input disabled>'))
+        self.assertFalse(streamable('<p>a</p></HTML><p>b</p>'))
+        self.assertFalse(streamable('<p>a<style>b</p>'))
+        self.assertFalse(streamable('<script>a < b</script>'))
+        self.assertFalse(streamable(
+            '<P><textarea></textarea><layer></layer>&#xD800;<style></div>'
+            '</P><b>'))
+
+    def test_differential(self):
+        # whatever streamable accepts must come out as from the tree
+        # sanitizer, in any chunk size
+        from experimental.safe_html_transform.streaming import streamable
+        rng = random.Random(7)
+        checked = 0
+        for i in range(2000):
+            html = ''.join(rng.choice(PARTS)
+                           for j in range(rng.randint(0, 20)))
+            if streamable(html):
+                checked += 1
+                self.assertEqual(self._stream(html, rng.choice([1, 5, 64])),
+                                 self.transform.sanitize(html), repr(html))
+        self.assertGreater(checked, 500)
+
+    def test_script_end_tag_split_over_chunks(self):
+        html = "<p>x<script>alert(1)</script>z</p>"
+        for chunk_size in range(1, len(html)):
+            self.assertEqual(self._stream(html, chunk_size), "<p>xz</p>")
+
+    def test_stray_open_bracket(self):
+        from experimental.safe_html_transform.streaming import HELD_BACK
+        from experimental.safe_html_transform.streaming import iter_chunks
+        html = "<p>a < b</p>" + "<p>paragraph</p>" * 1000
+        chunks = list(iter_chunks(StringIO(html), 64))
+        self.assertGreater(len(chunks), 200)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks),
+                             64 + HELD_BACK)
+        self.assertEqual(u''.join(chunks), html)
+        self.assertEqual(self._stream(html, chunk_size=64),
+                         self.transform.sanitize(html))
+
+    def test_character_split_over_chunks(self):
+        html = "<p>\xc3\xa9\xe2\x82\xac</p><<script iv></LAYER>\xc2\xa0"
+        expected = self.transform.sanitize(html)
+        for chunk_size in range(1, len(html)):
+            self.assertEqual(self._stream(html, chunk_size), expected)
+
+    def test_large_document(self):
+        html = "<p>paragraph <b>bold</b></p><script>x</script>" * 5000
+        result = self._stream(html, chunk_size=1024)
+        self.assertEqual(result, "<p>paragraph <b>bold</b></p>" * 5000)
+
+    def test_disabled(self):
+        self.transform.config['disable_transform'] = 1
+        html = "<p>x<script>alert(1)</script></p>"
+        self.assertEqual(self._stream(html), html)
@@ -1,174 +1,75 @@
 # -*- coding: utf-8 -*-
+"""The safe_html transform.
+
+Importing this module is cheap: PortalTransforms imports it when the
+transform is registered or loaded. The lxml tree sanitizer, the worker
+pools and the stored outputs are imported on first use.
+"""
 import logging
+from collections import namedtuple
+from StringIO import StringIO
 from Products.PortalTransforms.interfaces import ITransform
 from zope.interface import implements
 from Products.PortalTransforms.utils import log
-from lxml import etree
-from StringIO import StringIO
-from lxml.html.clean import Cleaner
-from lxml.html import fragments_fromstring
-from lxml.etree import tostring
-
-# add some tags to nasty.
-NASTY_TAGS = frozenset(['style', 'script', 'object', 'applet', 'meta', 'embed'])  # noqa
-
-# tag mapping: tag -> short or long tag
-# These are the HTML tags that we will leave intact
-VALID_TAGS = {'a': 1,
- 'b': 1,
- 'base': 0,
- 'big': 1,
- 'blockquote': 1,
- 'body': 1,
- 'br': 0,
- 'caption': 1,
- 'cite': 1,
- 'code': 1,
- 'dd': 1,
- 'div': 1,
- 'dl': 1,
- 'dt': 1,
- 'em': 1,
- 'h1': 1,
- 'h2': 1,
- 'h3': 1,
- 'h4': 1,
- 'h5': 1,
- 'h6': 1,
- 'head': 1,
- 'hr': 0,
- 'html': 1,
- 'i': 1,
- 'img': 0,
- 'kbd': 1,
- 'li': 1,
- 'meta': 0,
- 'ol': 1,
- 'p': 1,
- 'pre': 1,
- 'small': 1,
- 'span': 1,
- 'strong': 1,
- 'sub': 1,
- 'sup': 1,
- 'table': 1,
- 'tbody': 1,
- 'td': 1,
- 'th': 1,
- 'title': 1,
- 'tr': 1,
- 'tt': 1,
- 'u': 1,
- 'ul': 1
-}
-
-# add some tags to allowed types. These should be backported to CMFDefault.
-VALID_TAGS['ins'] = 1
-VALID_TAGS['del'] = 1
-VALID_TAGS['q'] = 1
-VALID_TAGS['map'] = 1
-VALID_TAGS['area'] = 0
-VALID_TAGS['abbr'] = 1
-VALID_TAGS['acronym'] = 1
-VALID_TAGS['var'] = 1
-VALID_TAGS['dfn'] = 1
-VALID_TAGS['samp'] = 1
-VALID_TAGS['address'] = 1
-VALID_TAGS['bdo'] = 1
-VALID_TAGS['thead'] = 1
-VALID_TAGS['tfoot'] = 1
-VALID_TAGS['col'] = 1
-VALID_TAGS['colgroup'] = 1
-
-# HTML5 tags that should be allowed:
-VALID_TAGS['article'] = 1
-VALID_TAGS['aside'] = 1
-VALID_TAGS['audio'] = 1
-VALID_TAGS['canvas'] = 1
-VALID_TAGS['command'] = 1
-VALID_TAGS['datalist'] = 1
-VALID_TAGS['details'] = 1
-VALID_TAGS['dialog'] = 1
-VALID_TAGS['figure'] = 1
-VALID_TAGS['footer'] = 1
-VALID_TAGS['header'] = 1
-VALID_TAGS['hgroup'] = 1
-VALID_TAGS['keygen'] = 1
-VALID_TAGS['mark'] = 1
-VALID_TAGS['meter'] = 1
-VALID_TAGS['nav'] = 1
-VALID_TAGS['output'] = 1
-VALID_TAGS['progress'] = 1
-VALID_TAGS['rp'] = 1
-VALID_TAGS['rt'] = 1
-VALID_TAGS['ruby'] = 1
-VALID_TAGS['section'] = 1
-VALID_TAGS['source'] = 1
-VALID_TAGS['time'] = 1
-VALID_TAGS['video'] = 1
-
-_strings = (bytes, str)
-
-
-class HTMLParser(Cleaner):
-    """
-    Inherited cleaner class of lxml.html.
+from experimental.safe_html_transform.cache import cache_key
+from experimental.safe_html_transform.cache import DEFAULT_CACHE_SIZE
+from experimental.safe_html_transform.cache import result_cache
+from experimental.safe_html_transform.deferred import DEFAULT_QUEUE_SIZE
+from experimental.safe_html_transform.deferred import DEFERRED
+from experimental.safe_html_transform.deferred import document_id
+from experimental.safe_html_transform.diskcache import DEFAULT_DISK_CACHE_SIZE
+from experimental.safe_html_transform.diskcache import disk_cache
+from experimental.safe_html_transform.encoding import decode
+from experimental.safe_html_transform.encoding import DEFAULT_ENCODING
+from experimental.safe_html_transform.encoding import input_encoding
+from experimental.safe_html_transform.encoding import native_input
+from experimental.safe_html_transform.encoding import native_source
+from experimental.safe_html_transform.engines import DEFAULT_THRESHOLDS
+from experimental.safe_html_transform.engines import EngineChoice
+from experimental.safe_html_transform.engines import Thresholds
+from experimental.safe_html_transform.fastpath import plain_text
+from experimental.safe_html_transform.fastpath import SafeMarkupScanner
+from experimental.safe_html_transform.fastpath import split_blocks
+from experimental.safe_html_transform.limits import DEFAULT_LIMITS
+from experimental.safe_html_transform.limits import escaped_text
+from experimental.safe_html_transform.limits import LimitExceeded
+from experimental.safe_html_transform.limits import Limits
+from experimental.safe_html_transform.parsers import PARSERS
+from experimental.safe_html_transform.policy import SanitizePolicy
+from experimental.safe_html_transform.settings import get_filter_settings
+from experimental.safe_html_transform.settings import merge_settings
+from experimental.safe_html_transform.stats import Conversion
+from experimental.safe_html_transform.stats import STATS
+from experimental.safe_html_transform.streaming import sanitize_stream
+from experimental.safe_html_transform.streaming import STREAM_CHUNK_SIZE
+from experimental.safe_html_transform.tags import NASTY_TAGS
+from experimental.safe_html_transform.tags import PAGE_TAGS
+from experimental.safe_html_transform.tags import PARAGRAPH_CLOSING_TAGS
+from experimental.safe_html_transform.tags import PARAGRAPH_TAGS
+from experimental.safe_html_transform.tags import VALID_TAGS
 
-    Modified __call__ method of the lxml.html to allow the
-    frames tags in the input.
-    """
+# number of documents handed to a pool worker at once by convert_many.
+DEFAULT_CHUNKSIZE = 64
+
+# everything which is built once per policy. cache, disk_cache and stats
+# are the shared ones the config uses, or None.
+Compiled = namedtuple('Compiled', 'policy cleaner scanner limits snippet '
+                      'engines cache disk_cache stats')
 
-    def __call__(self, doc):
-        kill_tags = set(self.kill_tags or ())
-        remove_tags = set(self.remove_tags or ())
-        if self.frames:
-            pass
-        if self.embedded:
-            for el in list(doc.iter('param')):
-                # found_parent = False
-                parent = el.getparent()
-                while parent is not None and parent.tag not in ('applet', 'object'):
-                    parent = parent.getparent()
-                if parent is None:
-                    el.drop_tree()
-            kill_tags.update(('applet',))
-            # The alternate contents that are in an iframe are a good fallback:
-            remove_tags.update(('embed', 'layer', 'object', 'param'))
-
-
-def fragment_fromstring(html, parser=None, base_url=None, **kw):
-    if not isinstance(html, _strings):
-        raise TypeError('string required')
-    elements = fragments_fromstring(html, parser=parser,
-                                        no_leading_text=True,
-                                        base_url=base_url, **kw)
-    if not elements:
-        raise etree.ParserError('No elements found')
-    # an array containing elements that have been fragmented. Elements
-    # will be stored in that array of there are more than one fragmented
-    # element.
-    ele_array = []
-    if len(elements) > 1:
-        """
-        if the number of elements is greater than 1 then we have to
-        deal with each element by traverse the array and append
-        each array in the ele_array which will be returned later.
-        """
-        for i in range(len(elements)):
-            result = elements[i]
-            if result.tail and result.tail.strip():
-                raise etree.ParserError('Element followed by text: %r' % result.tail)
-            result.tail = None
-            ele_array.append(result)
-    else:
-        # if there is only one element then append that element to the
-        # array and return the array
-        result = elements[0]
-        if result.tail and result.tail.strip():
-            raise etree.ParserError('Element followed by text: %r' % result.tail)
-        result.tail = None
-        ele_array.append(result)
-    return ele_array
+
+def cached_result(key, cache, disk_cache=None):
+    """Return the output cached under key in cache or disk_cache, or None.
+
+    Either may be None. Output found on disk is added to cache.
+    """
+    safe_html = None
+    if cache is not None:
+        safe_html = cache.get(key)
+    if safe_html is None and disk_cache is not None:
+        safe_html = disk_cache.get(key)
+        if safe_html is not None and cache is not None:
+            cache.set(key, safe_html)
+    return safe_html
 
 
 class SafeHTML:
@@ -178,10 +79,70 @@ class SafeHTML:
     Tags must explicit be allowed in valid_tags to pass. Only
     the tags themself are removed, not their contents. If tags
     are removed and in nasty_tags, they are removed with
-    all of their contents.
+    all of their contents. Tags in rename_tags are renamed, by default
+    h3 to h6 and div to p. stripped_attributes are removed from all
+    tags, stripped_combinations from the given tags. Style attributes
+    only keep the properties in style_whitelist, class attributes lose
+    the names in class_blacklist. With remove_javascript, event handler
+    attributes and javascript:, vbscript: and data: urls are removed.
+
+    Byte strings are read in the encoding passed with the conversion,
+    or as utf-8. The output of input which passes unchanged is the input
+    itself, other output is ascii with character references.
+
+    The filter settings of the control panel are read from the registry
+    and take precedence over the config. Changes to them are picked up
+    without a restart.
+
+    Sanitized output is kept in an in-process LRU cache keyed by the
+    input and the fingerprint of the policy, so changed settings never
+    get stale output from that cache. Its size in bytes is set with
+    cache_size, 0 disables it. With disk_cache_path set, sanitized
+    output is also kept in a SQLite database of at most disk_cache_size
+    bytes at that path, which the Zope clients of a machine share.
+    The caches belong to the process: the configs of all sites with the
+    same cache_size share one result cache, the ones with the same
+    disk_cache_path one disk cache of the largest disk_cache_size, so
+    the setting of one site never disables caching for another.
+
+    Input larger than max_bytes, deeper than max_depth, with more than
+    max_elements elements or an element with more than max_attributes
+    attributes, or which takes longer than time_budget milliseconds, is
+    returned as escaped text. 0 disables a limit.
+
+    Input up to snippet_size bytes, 0 by default, is sanitized without
+    building a tree when it only uses simple, properly nested markup.
+    The output is the same, anything else goes to the tree sanitizer.
+
+    Documents larger than incremental_size bytes which consist of block
+    elements are sanitized block by block, using the result cache for
+    every block, so only changed blocks of an edited document are
+    sanitized again. Other documents from stream_size bytes with at most
+    stream_density tags per KiB are sanitized while they are parsed,
+    which is faster for very large documents, unless their output would
+    differ from the tree's. ``bin/instance calibrate_safe_html`` measures
+    these thresholds and stores them in the config.
+
+    With store_output set, the sanitized rich text of dexterity content
+    is stored on the content when it is saved. Conversions for that
+    content return it without sanitizing, as long as the input and the
+    policy did not change since.
+
+    Documents larger than defer_size bytes which are not in the result
+    cache are sanitized in a background thread, with at most
+    defer_queue_size of them waiting. The queue is shared by the
+    process and holds the largest defer_queue_size of its configs.
+    Until it is done the last sanitized version of the document, or the
+    input escaped as text, is returned and not cached by PortalTransforms.
+
+    With collect_stats set, the time spent in every stage and counters
+    of the conversions are collected for the @@safe-html-stats view and
+    logged every stats_log_interval seconds. The totals are the ones of
+    the process, for the configs which collect them, and logged at the
+    shortest interval of those.
 
     Objects will not be transformed again with changed settings.
-    You need to clear the cache by e.g.
+    You need to clear the PortalTransforms cache by e.g.
     1.) restarting your zope or
     2.) empty the zodb-cache via ZMI -> Control_Panel
         -> Database Management -> main || other_used_database
@@ -198,8 +159,9 @@ class SafeHTML:
         self.config = {
             'inputs': self.inputs,
             'output': self.output,
-            'valid_tags': VALID_TAGS,
+            'valid_tags': dict(VALID_TAGS),
             'nasty_tags': NASTY_TAGS,
+            'rename_tags': dict.fromkeys(PARAGRAPH_TAGS, 'p'),
             'stripped_attributes': [
                 'lang', 'valign', 'halign', 'border', 'frame', 'rules',
                 'cellspacing', 'cellpadding', 'bgcolor'],
@@ -209,7 +171,17 @@ class SafeHTML:
             'class_blacklist': [],
             'remove_javascript': 1,
             'disable_transform': 0,
+            'cache_size': DEFAULT_CACHE_SIZE,
+            'disk_cache_path': '',
+            'disk_cache_size': DEFAULT_DISK_CACHE_SIZE,
+            'store_output': 0,
+            'defer_size': 0,
+            'defer_queue_size': DEFAULT_QUEUE_SIZE,
+            'collect_stats': 0,
+            'stats_log_interval': 0,
             }
+        self.config.update(DEFAULT_THRESHOLDS)
+        self.config.update(DEFAULT_LIMITS)
 
         self.config_metadata = {
             'inputs': ('list',
@@ -228,6 +200,13 @@ class SafeHTML:
                            'They are only deleted if they are not marked ' +
                            'as valid_tags.',
                            ('tag', 'value')),
+            'rename_tags': ('dict',
+                            'rename_tags',
+                            'Tags which are renamed, value is the new ' +
+                            'name. Block elements in tags renamed to p ' +
+                            'are moved behind them, like the parser does ' +
+                            'for a real p.',
+                            ('tag', 'value')),
             'stripped_attributes': ('list',
                                     'stripped_attributes',
                                     'These attributes are stripped from ' +
@@ -257,6 +236,88 @@ class SafeHTML:
             'disable_transform': ("int",
                                   'disable_transform',
                                   'If 1, nothing is done.'),
+            'cache_size': ("int",
+                           'cache_size',
+                           'Size in bytes of the in-process cache of ' +
+                           'sanitized output. 0 disables the cache.'),
+            'disk_cache_path': ("string",
+                                'disk_cache_path',
+                                'Absolute path of a file to cache ' +
+                                'sanitized output in, shared by the ' +
+                                'Zope clients of a machine. Empty to not ' +
+                                'cache on disk.'),
+            'disk_cache_size': ("int",
+                                'disk_cache_size',
+                                'Size in bytes of the disk cache.'),
+            'snippet_size': ("int",
+                             'snippet_size',
+                             'Smaller input with simple markup is ' +
+                             'sanitized without building a tree. 0 to ' +
+                             'always build one.'),
+            'incremental_size': ("int",
+                                 'incremental_size',
+                                 'Larger documents are sanitized and ' +
+                                 'cached block by block. 0 to always ' +
+                                 'sanitize the whole document.'),
+            'stream_size': ("int",
+                            'stream_size',
+                            'Larger documents with at most ' +
+                            'stream_density tags per KiB are sanitized ' +
+                            'without building a tree. 0 to always build ' +
+                            'one.'),
+            'stream_density': ("int",
+                               'stream_density',
+                               'Tags per KiB up to which documents larger ' +
+                               'than stream_size are sanitized without ' +
+                               'building a tree.'),
+            'store_output': ("int",
+                             'store_output',
+                             'If 1, the sanitized rich text is stored ' +
+                             'on the content when it is saved and read ' +
+                             'from there when it is shown.'),
+            'defer_size': ("int",
+                           'defer_size',
+                           'Larger documents are sanitized in a ' +
+                           'background thread, until it is done the ' +
+                           'last version or escaped text is shown. 0 to ' +
+                           'always sanitize while rendering.'),
+            'defer_queue_size': ("int",
+                                 'defer_queue_size',
+                                 'Number of documents waiting for the ' +
+                                 'background thread. When more are saved ' +
+                                 'they are shown escaped until rendered ' +
+                                 'again.'),
+            'collect_stats': ("int",
+                              'collect_stats',
+                              'If 1, timings and counters of the ' +
+                              'conversions are collected.'),
+            'stats_log_interval': ("int",
+                                   'stats_log_interval',
+                                   'Seconds between log lines with the ' +
+                                   'collected stats. 0 to not log them.'),
+            'max_bytes': ("int",
+                          'max_bytes',
+                          'Larger input is not sanitized but escaped. ' +
+                          '0 for no limit.'),
+            'max_depth': ("int",
+                          'max_depth',
+                          'Input with deeper nested elements is not ' +
+                          'sanitized but escaped. Input with more tags ' +
+                          'is parsed slower to check it. 0 for no limit.'),
+            'max_elements': ("int",
+                             'max_elements',
+                             'Input with more elements is not sanitized ' +
+                             'but escaped. 0 for no limit.'),
+            'max_attributes': ("int",
+                               'max_attributes',
+                               'Input with an element with more ' +
+                               'attributes is not sanitized but escaped. ' +
+                               '0 for no limit.'),
+            'time_budget': ("int",
+                            'time_budget',
+                            'Milliseconds a conversion may take before ' +
+                            'it is aborted and the input is escaped. ' +
+                            '0 for no limit.'),
             }
 
         self.config.update(kwargs)
@@ -267,6 +328,55 @@ class SafeHTML:
     def name(self):
         return self.__name__
 
+    def compiled(self):
+        """Return the compiled policy, cleaner and scanner for the config.
+
+        The config is combined with the snapshot of the filter settings in
+        the registry. The policy and its cleaner are built once and only
+        rebuilt when the config is replaced, one of its items changes or
+        the registry snapshot got a new version.
+        """
+        config = self.config
+        settings = get_filter_settings()
+        compiled = self.__dict__.get('_compiled')
+        if (compiled is None or compiled[0] != config or
+                compiled[1] is not settings):
+            from experimental.safe_html_transform.cleaner import \
+                build_cleaner
+            from experimental.safe_html_transform.snippet import \
+                SnippetSanitizer
+            policy = SanitizePolicy(merge_settings(config, settings))
+            cleaner = build_cleaner(policy)
+            limits = Limits.from_config(config)
+            thresholds = Thresholds.from_config(config)
+            # tags which are not touched by the sanitizer
+            rules = cleaner.rules
+            safe_tags = policy.valid_tags - frozenset(rules.tags) - PAGE_TAGS
+            stats = None
+            if config.get('collect_stats'):
+                stats = STATS
+                STATS.enable(config.get('stats_log_interval', 0))
+            DEFERRED.reserve(config.get('defer_queue_size',
+                                        DEFAULT_QUEUE_SIZE))
+            compiled = self._compiled = (dict(config), settings, Compiled(
+                policy, cleaner, SafeMarkupScanner(policy, safe_tags), limits,
+                SnippetSanitizer(rules, limits),
+                EngineChoice(thresholds, rules.kill_tags),
+                result_cache(config.get('cache_size', DEFAULT_CACHE_SIZE)),
+                disk_cache(config.get('disk_cache_path'),
+                           config.get('disk_cache_size',
+                                      DEFAULT_DISK_CACHE_SIZE)),
+                stats))
+        return compiled[2]
+
+    def policy(self):
+        """Return the compiled policy for the current config."""
+        return self.compiled().policy
+
+    def cleaner(self):
+        """Return the cleaner belonging to the current policy."""
+        return self.compiled().cleaner
+
     def __getattr__(self, attr):
         if attr == 'inputs':
             return self.config['inputs']
@@ -287,32 +397,353 @@ class SafeHTML:
             data.setData(orig)
             return data
 
-        if orig == "" or orig == "<html></html>" or orig == "<html />" or orig == "<html/>":
-            safe_html = str("")
+        encoding = kwargs.get('encoding')
+        context = kwargs.get('context')
+        if context is not None and self.config.get('store_output'):
+            safe_html = self.stored(orig, context, encoding)
+            if safe_html is not None:
+                data.setData(safe_html)
+                return data
+
+        defer_size = self.config.get('defer_size')
+        if defer_size and len(orig) > defer_size:
+            safe_html, ready = self.convert_deferred(
+                orig, document_id(context, orig), encoding)
+            if not ready:
+                # PortalTransforms must not keep the fallback
+                data.setCacheable(False)
             data.setData(safe_html)
+            return data
+
+        data.setData(self.convert_text(orig, encoding=encoding))
+        return data
+
+    def stored(self, orig, context, encoding=None):
+        """Return the output stored on context for orig, or None."""
+        from experimental.safe_html_transform.stored import stored_output
+        return stored_output(context, cache_key(
+            orig, self.compiled().policy.fingerprint,
+            input_encoding(orig, encoding)))
+
+    def store(self, obj, name, orig, safe_html=None, encoding=None):
+        """Store the sanitized orig on obj as the output of field name.
+
+        orig is sanitized unless safe_html is given.
+        """
+        from experimental.safe_html_transform.stored import store_output
+        if safe_html is None:
+            safe_html = self.convert_text(orig, encoding=encoding)
+        store_output(obj, name, cache_key(
+            orig, self.compiled().policy.fingerprint,
+            input_encoding(orig, encoding)), safe_html)
+
+    def convert_deferred(self, orig, document=None, encoding=None):
+        """Return a tuple (safe_html, ready) without sanitizing orig.
+
+        Sanitized output found in the result cache is returned as ready,
+        otherwise orig is queued for the background thread and the last
+        version of document sanitized with the current policy, or orig
+        escaped, is returned. document is the id of the field orig belongs
+        to, see document_id. Without a result cache orig is sanitized right
+        away.
+        """
+        compiled = self.compiled()
+        encoding = input_encoding(orig, encoding)
+        if compiled.cache is None:
+            return self.convert_text(orig, compiled, encoding=encoding), True
+        safe_html = plain_text(orig, encoding)
+        if safe_html is not None:
+            return safe_html, True
+        key = cache_key(orig, compiled.policy.fingerprint, encoding)
+        if document is not None:
+            document = document + (compiled.policy.fingerprint,)
+        safe_html = cached_result(key, compiled.cache, compiled.disk_cache)
+        if safe_html is not None:
+            DEFERRED.remember(document, safe_html)
+            return safe_html, True
+
+        def convert(orig):
+            return self.convert_text(orig, compiled, encoding=encoding)
+
+        stats = compiled.stats
+        conversion = stats and stats.begin()
+        safe_html = DEFERRED.last_version(document)
+        if safe_html is None:
+            safe_html = escaped_text(orig, encoding)
+        DEFERRED.submit(key, convert, orig, document, compiled.cache)
+        if conversion is not None:
+            stats.record(conversion, 'deferred', orig, safe_html)
+        return safe_html, False
 
+    def convert_many(self, items, pool=None, workers=None,
+                     chunksize=DEFAULT_CHUNKSIZE, encoding=None):
+        """Yield the sanitized version of every html string in items.
+
+        The results are yielded in the order of items. The compiled policy
+        and the cleaner are shared by all items, every thread reuses its
+        parser. pool is None to
+        convert in the calling thread, 'thread' or 'process' to fan out to
+        a pool of workers (default: one per CPU) which get chunksize items
+        at a time. To reuse a process pool for several calls, pass one
+        made by process_pool, it is left running. Byte strings are read in
+        encoding.
+        """
+        if self.config.get('disable_transform'):
+            for orig in items:
+                yield orig
+            return
+
+        compiled = self.compiled()
+        if pool is None:
+            for orig in items:
+                yield self.convert_text(orig, compiled, encoding=encoding)
+            return
+
+        if pool == 'thread':
+            from multiprocessing.pool import ThreadPool
+
+            def convert(orig):
+                return self.convert_text(orig, compiled, encoding=encoding)
+
+            workers = ThreadPool(workers)
+        elif pool == 'process' or hasattr(pool, 'imap'):
+            workers = pool == 'process' and self.process_pool(workers) or pool
+            convert = _convert_in_worker
+            items = ((orig, encoding) for orig in items)
         else:
-            # append html tag to create a dummy parent for the tree
-            html = "<html>%s</html>" % orig
-            parser = etree.HTMLParser()
-            tree = etree.parse(StringIO(html), parser)
-            for element in tree.getiterator():
-                if element.tag in ['h3', 'h4', 'h5', 'h6', 'div']:
-                    element.tag = 'p'
-                if element.tag in ["html", "body"]:
-                    etree.strip_tags(tree, element.tag)
-            result = etree.tostring(tree.getroot(), pretty_print=True, method="html")
-            NASTY_TAGS = frozenset(['style', 'script', 'object', 'applet', 'meta', 'embed'])  # noqa
-            cleaner = HTMLParser(kill_tags=NASTY_TAGS, page_structure=False, safe_attrs_only=False)
-            safe_html = fragment_fromstring(cleaner.clean_html(result))
-            safe_html2 = ""
-            for i in range(len(safe_html)):
-                safe_html1 = tostring(safe_html[i])
-                safe_html2 = safe_html2 + safe_html1
-
-            data.setData(safe_html2)
+            raise ValueError('Unknown pool %r' % pool)
+        try:
+            for safe_html in workers.imap(convert, items, chunksize):
+                yield safe_html
+        finally:
+            if workers is not pool:
+                workers.terminate()
+                workers.join()
 
-        return data
+    def process_pool(self, workers=None):
+        """Return a pool of worker processes converting with this config.
+
+        workers is the number of processes, one per CPU by default. The
+        caller terminates the pool when it is done.
+        """
+        from multiprocessing import Pool
+        config = merge_settings(self.config, get_filter_settings())
+        return Pool(workers, _init_worker, (self.__name__, config))
+
+    def convert_stream(self, source, sink, chunk_size=STREAM_CHUNK_SIZE,
+                       encoding=None):
+        """Sanitize html read from the file-like source into sink.
+
+        Unlike convert, no tree or complete copy of the document is built,
+        the output is written while the input is parsed. Use this for
+        documents of many megabytes. Bytes are read in encoding. The
+        output differs from convert in the ways listed in the streaming
+        module.
+        """
+        if self.config.get('disable_transform'):
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                sink.write(chunk)
+            return sink
+        cleaner = self.cleaner()
+        source, encoding = native_source(source, encoding)
+        sanitize_stream(source, sink, cleaner.rules, chunk_size,
+                        encoding=encoding)
+        return sink
+
+    def convert_text(self, orig, compiled=None, parser=None, encoding=None):
+        """Return the sanitized orig.
+
+        Input without markup and input which only contains markup the
+        policy allows is handled without building a tree, other input is
+        looked up in the result cache before it is sanitized with the
+        engine compiled.engines chooses for it. Input which exceeds one
+        of the limits is returned as escaped text. Without a parser the
+        one of the calling thread for the encoding of orig is used.
+        """
+        if encoding is None and isinstance(orig, str):
+            # the common case, without a call
+            encoding = DEFAULT_ENCODING
+        else:
+            orig, encoding = native_input(orig, encoding)
+        safe_html = plain_text(orig, encoding)
+        if safe_html is not None:
+            # only counted, plain text takes next to no time
+            if STATS.enabled:
+                stats = (compiled or self.compiled()).stats
+                if stats is not None:
+                    stats.record(Conversion(), 'plain_text', orig, safe_html)
+            return safe_html
+
+        compiled = compiled or self.compiled()
+        stats = compiled.stats
+        conversion = stats and stats.begin()
+        cache = compiled.cache
+        key = None
+        if cache is not None or compiled.disk_cache is not None:
+            key = cache_key(orig, compiled.policy.fingerprint, encoding)
+            safe_html = cached_result(key, cache, compiled.disk_cache)
+            if safe_html is not None:
+                if conversion is not None:
+                    stats.record(conversion, 'cached', orig, safe_html)
+                return safe_html
+
+        try:
+            # plain text is linear and escaped anyway, the limits only
+            # apply to markup.
+            compiled.limits.check_bytes(orig)
+            # one budget for the whole conversion, however many blocks
+            safe_html, path = self._choose_engine(
+                orig, compiled, parser, conversion, encoding,
+                compiled.limits.deadline())
+        except LimitExceeded as exceeded:
+            log(logging.WARNING, 'safe_html: %s, the input is escaped '
+                'instead of sanitized' % exceeded)
+            STATS.limit_exceeded(exceeded.limit)
+            safe_html = escaped_text(orig, encoding)
+            path = 'limited'
+            # the time budget depends on the load, try again next time
+            key = None
+        if key is not None:
+            if cache is not None:
+                cache.set(key, safe_html)
+            # the scanner is as fast as reading from disk
+            if path != 'safe_markup' and compiled.disk_cache is not None:
+                compiled.disk_cache.set(key, safe_html)
+        if conversion is not None:
+            stats.record(conversion, path, orig, safe_html)
+        return safe_html
+
+    def _choose_engine(self, orig, compiled, parser=None, conversion=None,
+                       encoding=None, deadline=None):
+        """Sanitize orig with the engine compiled.engines chooses for it.
+
+        Returns the sanitized html and the path it took for the stats.
+        The time budget of the conversion ends at deadline.
+        """
+        engines = compiled.engines
+        # the scanner would only stop at the killed tags
+        nasty = engines.nasty(orig)
+        if not nasty:
+            safe_html = compiled.scanner(orig, encoding)
+            if safe_html is not None:
+                return safe_html, 'safe_markup'
+        tags = orig.count('<')
+        engine = engines(orig, tags, compiled.limits.need_checks(orig, tags),
+                         compiled.cache is not None)
+        if conversion is not None:
+            conversion.lap('lookup')
+            conversion.engine = engine
+            conversion.scanner_skipped = nasty
+        if engine == 'snippet':
+            safe_html = compiled.snippet(orig, encoding)
+            if conversion is not None:
+                conversion.lap('snippet')
+            if safe_html is not None:
+                return safe_html, 'snippet'
+        elif engine == 'incremental':
+            blocks = split_blocks(orig, PARAGRAPH_CLOSING_TAGS)
+            if blocks:
+                if parser is None:
+                    parser = PARSERS.get(encoding)
+                return self.sanitize_blocks(
+                    blocks, compiled, parser, conversion, encoding,
+                    deadline), 'incremental'
+        if engine in ('snippet', 'incremental'):
+            # the snippet sanitizer or the split gave up
+            engine = engines.whole(orig, tags)
+        if engine == 'stream':
+            return self.sanitize_streamed(
+                orig, compiled, conversion, encoding, deadline), 'streamed'
+        if parser is None:
+            parser = PARSERS.get(encoding)
+        return self.sanitize(orig, compiled.cleaner, parser, conversion,
+                             compiled.limits, encoding,
+                             deadline), 'sanitized'
+
+    def sanitize_blocks(self, blocks, compiled, parser=None, conversion=None,
+                        encoding=None, deadline=None):
+        """Return the sanitized blocks of a document joined.
+
+        Blocks found in the result cache are reused, only new or changed
+        ones are sanitized and added to it. They do not take the safe
+        markup fast path, so the result is the same as sanitizing the
+        whole document. All blocks share the time budget ending at
+        deadline, which starts now without one.
+        """
+        if deadline is None:
+            deadline = compiled.limits.deadline()
+        fingerprint = compiled.policy.fingerprint
+        cache = compiled.cache
+        parts = []
+        for block in blocks:
+            key = cache_key(block, fingerprint, encoding)
+            safe_block = cache.get(key)
+            if safe_block is None:
+                if conversion is not None:
+                    conversion.lap('lookup')
+                safe_block = self.sanitize(block, compiled.cleaner, parser,
+                                           conversion, compiled.limits,
+                                           encoding, deadline)
+                cache.set(key, safe_block)
+                if conversion is not None:
+                    conversion.blocks_sanitized += 1
+            elif conversion is not None:
+                conversion.blocks_reused += 1
+            parts.append(safe_block)
+        return ''.join(parts)
+
+    def sanitize_streamed(self, orig, compiled, conversion=None,
+                          encoding=None, deadline=None):
+        """Return orig sanitized by the stream sanitizer of compiled.
+
+        No tree is built, the output is written while orig is parsed and
+        the limits are checked meanwhile, the time budget until deadline.
+        """
+        limits = compiled.limits
+        if deadline is None:
+            deadline = limits.deadline()
+        sink = StringIO()
+        # invalid bytes are replaced, like by the tree sanitizer
+        sanitize_stream(StringIO(decode(orig, encoding)), sink,
+                        compiled.cleaner.rules, limits=limits,
+                        deadline=deadline)
+        if conversion is not None:
+            conversion.lap('stream')
+        return sink.getvalue()
+
+    def sanitize(self, orig, cleaner=None, parser=None, conversion=None,
+                 limits=None, encoding=None, deadline=None):
+        """Return orig cleaned with the current policy.
+
+        The stages are timed into conversion, if one is given. With limits
+        LimitExceeded is raised as soon as orig exceeds one of them, or
+        the time budget ending at deadline. A given parser must be built
+        for the encoding of orig.
+        """
+        from experimental.safe_html_transform.cleaner import sanitize
+        return sanitize(orig, cleaner or self.cleaner(), parser, conversion,
+                        limits, encoding, deadline)
+
+
+# transform of a convert_many process pool worker and its input encoding
+_worker_transform = None
+
+
+def _init_worker(name, config):
+    global _worker_transform
+    from zope.component.hooks import setSite
+    # forked workers inherit the site of the calling thread, they must not
+    # touch its database connection.
+    setSite(None)
+    _worker_transform = SafeHTML(name, **config)
+
+
+def _convert_in_worker(item):
+    orig, encoding = item
+    return _worker_transform.convert_text(orig, encoding=encoding)
 
 
 def register():
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""Upgrade steps of the default profile."""
+from experimental.safe_html_transform.resanitize import resanitize
+from Products.CMFCore.utils import getToolByName
+
+
+def resanitize_content(context):
+    """Run the existing rich text through the new safe_html transform.
+
+    This runs in the Zope process, so it does not fork a process pool, and
+    all content is changed in the transaction of the upgrade. Use
+    ``bin/instance resanitize_html`` for large sites, it commits every
+    batch.
+    """
+    portal = getToolByName(context, 'portal_url').getPortalObject()
+    resanitize(portal, workers=0, commit=False)